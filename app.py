@@ -1,12 +1,11 @@
-from flask import Flask, render_template, jsonify, request
-import requests
+from flask import Flask, Response, render_template, jsonify, request, stream_with_context
 import os
 import math
 from dotenv import load_dotenv
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from typing import Any, Optional, Tuple
 import json
 import config
-from functools import lru_cache
 import time
 import logging
 import redis
@@ -15,6 +14,13 @@ from flask_limiter.util import get_remote_address
 from flask import g
 from prometheus_client import Counter, Histogram
 from flask_cors import CORS
+from weather_client import set_deadline, weather_client
+from forecast_grid import forecast_grid
+from grid_sources import parse_bbox
+from mts_tiles import band_fields, build_mts_tile, grid_bounds, seconds_to_next_hour
+from forecast_cells import ForecastError
+from route_engine import RouteError, analyze_route, plan_race, race_reports, search_release_times
+from timeline_frames import TimelineError, build_timeline
 
 # Konfiguracja logowania
 logging.basicConfig(
@@ -55,17 +61,26 @@ def num2deg(xtile, ytile, zoom):
     lat_deg = math.degrees(lat_rad)
     return (lat_deg, lon_deg)
 
-# Cache dla requestów API (5 minut)
-@lru_cache(maxsize=128)
-def cached_weather_request(url, params_str):
-    """Cache'owane requesty do WeatherAPI.com"""
+# Cache dla requestów API (TTL zależny od endpointu, wspólna pula połączeń)
+def cached_weather_request(url, params_str) -> Tuple[int, Any]:
+    """Cache'owane requesty do WeatherAPI.com (aktualne warunki w zasięgu siatki prognoz - bez wywołania API)"""
     params = json.loads(params_str)
+    if url.endswith('current.json'):
+        point = query_point(params.get('q', ''))
+        data = grid_current(*point) if point else None
+        if data:
+            return 200, data
+    return weather_client.fetch(url, params)
+
+def query_point(q):
+    """(lat, lon) z parametru q - "lat,lon" albo domyślne miasto; None dla innych nazw"""
+    if q.lower() == config.DEFAULT_CITY.lower():
+        return config.DEFAULT_CENTER[1], config.DEFAULT_CENTER[0]
     try:
-        response = requests.get(url, params=params, timeout=10)
-        return response.status_code, response.json() if response.status_code == 200 else None
-    except Exception as e:
-        logger.error(f"Błąd requestu API: {e}")
-        return 500, {'error': str(e)}
+        lat, lon = (float(v) for v in q.split(','))
+    except ValueError:
+        return None
+    return lat, lon
 
 def validate_api_keys():
     """Walidacja kluczy API"""
@@ -102,6 +117,8 @@ def before_request():
     # Używamy g object zamiast dodawania atrybutu do request
     from flask import g
     g.start_time = time.time()
+    # Termin dla wszystkich wywołań WeatherAPI w tym zapytaniu
+    set_deadline(config.REQUEST_DEADLINE)
 
 @app.after_request
 def after_request(response):
@@ -126,7 +143,8 @@ def health_check():
             'status': 'healthy',
             'timestamp': datetime.now().isoformat(),
             'redis': redis_status,
-            'api_keys': 'configured'
+            'api_keys': 'configured',
+            'weather_client': weather_client.stats()
         })
     except Exception as e:
         logger.error(f"Health check failed: {e}")
@@ -177,6 +195,11 @@ def get_config():
         'default_pitch': config.DEFAULT_PITCH
     })
 
+# Pola odpowiedzi /api/weather/current -> pola current.json (opis i ikona z condition)
+CURRENT_SUMMARY_FIELDS = {'temperature': 'temp_c', 'feels_like': 'feelslike_c', 'humidity': 'humidity',
+                          'pressure': 'pressure_mb', 'wind_speed': 'wind_kph', 'wind_direction': 'wind_degree',
+                          'visibility': 'vis_km', 'description': 'condition', 'icon': 'condition'}
+
 @app.route('/api/weather/current')
 @limiter.limit("30 per minute")
 def current_weather():
@@ -201,7 +224,7 @@ def current_weather():
             location = data.get('location', {})
             condition = current.get('condition', {})
             
-            return jsonify({
+            summary = {
                 'temperature': current.get('temp_c', 0) if isinstance(current, dict) else 0,
                 'feels_like': current.get('feelslike_c', 0) if isinstance(current, dict) else 0,
                 'humidity': current.get('humidity', 0) if isinstance(current, dict) else 0,
@@ -213,7 +236,12 @@ def current_weather():
                 'icon': condition.get('icon', '') if isinstance(condition, dict) else '',
                 'sunrise': location.get('localtime', '').split(' ')[1][:5] if isinstance(location, dict) and location.get('localtime') else '00:00',
                 'sunset': location.get('localtime', '').split(' ')[1][:5] if isinstance(location, dict) and location.get('localtime') else '00:00'
-            })
+            }
+            if data.get('source') == 'grid':
+                # Siatka nie ma wszystkich pól current.json - brakujących nie zastępujemy zerami
+                summary = {name: value for name, value in summary.items()
+                           if name not in CURRENT_SUMMARY_FIELDS or CURRENT_SUMMARY_FIELDS[name] in current}
+            return jsonify(summary)
         else:
             logger.error(f"API Error: {status_code} - {data}")
             return jsonify({'error': f'Błąd API: {status_code}'}), 500
@@ -222,6 +250,113 @@ def current_weather():
         logger.error(f"Exception in current_weather: {e}")
         return jsonify({'error': str(e)}), 500
 
+def hour_entry(hour):
+    """Godzina prognozy w formacie API z godziny forecast.json"""
+    return {
+        'time': hour['time'][-5:],
+        'temperature': hour.get('temp_c'),
+        'wind_speed': hour.get('wind_kph'),
+        'wind_direction': hour.get('wind_degree'),
+        'precipitation': hour.get('precip_mm'),
+        'pop': hour.get('chance_of_rain'),
+        'humidity': hour.get('humidity'),
+        'pressure': hour.get('pressure_mb'),
+        'clouds': hour.get('cloud'),
+        'visibility': hour.get('vis_km')
+    }
+
+GRID_HOUR_FIELDS = ('temp_c', 'wind_kph', 'wind_degree', 'precip_mm', 'chance_of_rain', 'humidity',
+                    'pressure_mb', 'cloud', 'vis_km')
+
+def grid_hourly(lat, lon):
+    """Godziny prognozy punktu z siatki prognoz pogrupowane po dacie lokalnej; {} poza zasięgiem siatki"""
+    grid = forecast_grid.snapshot()
+    if grid is None or not grid.covers_point(lat, lon):
+        return {}
+    epochs, values, utc_offset = grid.point_hours(lat, lon, GRID_HOUR_FIELDS)
+    days = {}
+    for epoch, row in zip(epochs, values):
+        local = datetime.utcfromtimestamp(int(epoch) + utc_offset).strftime('%Y-%m-%d %H:%M')
+        hour: dict = {field: None if math.isnan(value) else round(float(value), 1) for field, value in zip(GRID_HOUR_FIELDS, row)}
+        hour['time'] = local
+        days.setdefault(local[:10], []).append(hour_entry(hour))
+    return days
+
+GRID_CURRENT_FIELDS = ('temp_c', 'wind_kph', 'wind_degree', 'gust_kph', 'precip_mm', 'chance_of_rain',
+                       'pressure_mb', 'humidity', 'cloud', 'vis_km')
+
+# Warunki WeatherAPI (kod, ikona, tekst) wg opadu mm/h (lekki, umiarkowany, silny) i zachmurzenia %
+GRID_RAIN = ((2.5, 1183, 296, 'Light rain'), (7.6, 1189, 302, 'Moderate rain'), (math.inf, 1195, 308, 'Heavy rain'))
+GRID_SNOW = ((2.5, 1213, 326, 'Light snow'), (7.6, 1219, 332, 'Moderate snow'), (math.inf, 1225, 338, 'Heavy snow'))
+GRID_CLOUD = ((20, 1000, 113, None), (60, 1003, 116, 'Partly cloudy'), (90, 1006, 119, 'Cloudy'),
+              (math.inf, 1009, 122, 'Overcast'))
+
+def is_daytime(lat, lon, epoch):
+    """Czy słońce jest nad horyzontem - deklinacja i kąt godzinny bez równania czasu"""
+    day = datetime.utcfromtimestamp(epoch).timetuple().tm_yday
+    declination = math.radians(-23.44) * math.cos(2 * math.pi * (day + 10) / 365)
+    hour_angle = math.radians((epoch % 86400) / 240 + lon - 180)
+    lat = math.radians(lat)
+    return math.sin(lat) * math.sin(declination) + math.cos(lat) * math.cos(declination) * math.cos(hour_angle) > 0
+
+def grid_condition(current, is_day):
+    """Pole condition current.json z opadu, zachmurzenia i temperatury siatki; None bez tych danych"""
+    precip, cloud = current.get('precip_mm'), current.get('cloud')
+    if precip is not None and precip >= 0.1:
+        table, value = GRID_SNOW if current.get('temp_c', 10) <= 0 else GRID_RAIN, precip
+    elif cloud is not None:
+        table, value = GRID_CLOUD, cloud
+    else:
+        return None
+    code, icon, text = next((code, icon, text) for limit, code, icon, text in table if value < limit)
+    return {
+        'text': text or ('Sunny' if is_day else 'Clear'),
+        'icon': f"//cdn.weatherapi.com/weather/64x64/{'day' if is_day else 'night'}/{icon}.png",
+        'code': code
+    }
+
+def grid_current(lat, lon) -> Optional[dict]:
+    """Aktualne warunki w formacie current.json z siatki prognoz (chwila bieżąca); None poza zasięgiem siatki"""
+    now = time.time()
+    grid = forecast_grid.snapshot()
+    if grid is None or not grid.covers_point(lat, lon, now):
+        return None
+    values = grid.sample(lat, lon, now, GRID_CURRENT_FIELDS)
+    current: dict = {field: round(float(value), 1) for field, value in zip(GRID_CURRENT_FIELDS, values) if not math.isnan(value)}
+    if 'temp_c' in current:
+        current['feelslike_c'] = current['temp_c']  # siatka nie ma temperatury odczuwalnej
+    if 'wind_kph' in current:
+        current['wind_mph'] = round(current['wind_kph'] / 1.609344, 1)
+    if 'gust_kph' in current:
+        current['gust_mph'] = round(current['gust_kph'] / 1.609344, 1)
+    if 'pressure_mb' in current:
+        current['pressure_in'] = round(current['pressure_mb'] * 0.02953, 2)
+    current['is_day'] = int(is_daytime(lat, lon, now))
+    condition = grid_condition(current, current['is_day'])
+    if condition:
+        current['condition'] = condition
+    current['last_updated_epoch'] = int(now // 60 * 60)
+    return {
+        'location': {
+            'lat': lat,
+            'lon': lon,
+            'localtime_epoch': int(now),
+            'localtime': datetime.utcfromtimestamp(int(now) + grid.local_offset(lat, lon)).strftime('%Y-%m-%d %H:%M')
+        },
+        'current': current,
+        'source': 'grid'
+    }
+
+def current_conditions(lat, lon) -> Tuple[int, Any]:
+    """(status, dane current.json) - z siatki prognoz, poza jej zasięgiem z WeatherAPI"""
+    try:
+        data = grid_current(float(lat), float(lon))
+    except (TypeError, ValueError):
+        data = None
+    if data:
+        return 200, data
+    return weather_client.current(lat, lon)
+
 @app.route('/api/weather/forecast')
 @limiter.limit("20 per minute")
 def weather_forecast():
@@ -241,6 +376,8 @@ def weather_forecast():
         status_code, data = cached_weather_request(url, params_str)
         
         if status_code == 200 and data:
+            location = data.get('location', {})
+            grid_hours = grid_hourly(location.get('lat', 52.2297), location.get('lon', 21.0122))
             forecast = []
             for day in data['forecast']['forecastday']:
                 forecast.append({
@@ -254,7 +391,8 @@ def weather_forecast():
                     'description': day['day']['condition']['text'],
                     'icon': day['day']['condition']['icon'],
                     'pop': day['day']['daily_chance_of_rain'],
-                    'hours': []
+                    # Godziny z siatki prognoz, poza jej horyzontem z odpowiedzi API
+                    'hours': grid_hours.get(day['date']) or [hour_entry(hour) for hour in day.get('hour', [])]
                 })
             
             return jsonify(forecast)
@@ -266,6 +404,58 @@ def weather_forecast():
         logger.error(f"Forecast Exception: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/weather/hourly')
+def hourly_weather():
+    """Prognoza godzinowa dla dowolnego punktu - z siatki prognoz, poza nią z forecast.json"""
+    try:
+        is_valid, result = validate_coordinates(request.args.get('lat', 52.2297), request.args.get('lon', 21.0122))
+        if not is_valid:
+            return jsonify({'error': result}), 400
+        lat, lon = result
+        
+        days = grid_hourly(lat, lon)
+        source = 'grid'
+        if not days:
+            status_code, data = weather_client.forecast(f"{lat},{lon}", days=config.FORECAST_GRID_DAYS)
+            if status_code != 200 or not data:
+                return jsonify({'error': f'Błąd API prognozy: {status_code}'}), 502
+            days = {day['date']: [hour_entry(hour) for hour in day.get('hour', [])]
+                    for day in data['forecast']['forecastday']}
+            source = 'weatherapi'
+        
+        return jsonify({'lat': lat, 'lon': lon, 'source': source, 'days': days})
+    except Exception as e:
+        logger.error(f"Hourly forecast exception: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/weather/timeline/<layer>')
+def weather_timeline(layer):
+    """Wszystkie klatki animacji warstwy dla obszaru w jednej odpowiedzi (uint8, delta, zlib)"""
+    try:
+        try:
+            bbox = parse_bbox(request.args.get('bbox', '14,49,24,55'))
+            width = int(request.args['width']) if request.args.get('width') else None
+            steps = int(request.args['steps']) if request.args.get('steps') else None
+            step_minutes = int(request.args['step_minutes']) if request.args.get('step_minutes') else None
+            start = int(request.args['start']) if request.args.get('start') else None
+        except ValueError:
+            return jsonify({'error': 'Nieprawidłowe bbox/width/steps/step_minutes/start'}), 400
+        if not (-90 <= bbox.south <= 90 and -90 <= bbox.north <= 90
+                and -180 <= bbox.west <= 180 and -180 <= bbox.east <= 180):
+            return jsonify({'error': 'Obszar poza zakresem współrzędnych'}), 400
+        if step_minutes is not None and step_minutes <= 0:
+            return jsonify({'error': 'step_minutes musi być dodatnie'}), 400
+
+        try:
+            timeline = build_timeline(layer, bbox, width, steps, step_minutes, start)
+        except (TimelineError, ForecastError) as e:
+            return jsonify({'error': str(e)}), 400
+
+        return conditional_json(timeline, max_age=config.TIMELINE_CACHE_TTL)
+    except Exception as e:
+        logger.error(f"Timeline exception: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/analyze_flight_route', methods=['POST'])
 def analyze_flight_route():
     """Analiza trasy lotu gołębi"""
@@ -295,39 +485,123 @@ def analyze_flight_route():
         except ValueError:
             return jsonify({'error': 'Nieprawidłowy format czasu (HH:MM)'}), 400
         
-        # TODO: Zastąp symulowane dane rzeczywistymi danymi z API
-        # Pobierz rzeczywiste dane pogodowe dla trasy
-        route_analysis = {
-            'start_location': start_location,
-            'end_location': end_location,
-            'flight_date': flight_date,
-            'flight_time': flight_time,
-            'distance': 295,  # km - do zastąpienia rzeczywistymi obliczeniami
-            'estimated_duration': '4-6 godzin',
-            'route_points': [
-                {'lat': 52.2297, 'lng': 21.0122, 'conditions': 85, 'color': 'green'},
-                {'lat': 51.9194, 'lng': 19.1451, 'conditions': 75, 'color': 'blue'},
-                {'lat': 50.0647, 'lng': 19.9450, 'conditions': 90, 'color': 'green'}
-            ],
-            'overall_score': 83,
-            'recommendations': [
-                'Warunki lotu są dobre',
-                'Temperatura optymalna (18-22°C)',
-                'Wiatr umiarkowany (<15 km/h)',
-                'Widoczność dobra (>10 km)',
-                'Niskie prawdopodobieństwo opadów'
-            ],
-            'warnings': [
-                'Uwaga na wiatr w godzinach popołudniowych',
-                'Możliwe lekkie zachmurzenie'
-            ]
-        }
+        # Gęstość próbkowania: liczba punktów albo odstęp w km (domyślnie z konfiguracji)
+        try:
+            points = int(data['points']) if data.get('points') else None
+            spacing_km = float(data['spacing_km']) if data.get('spacing_km') else None
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Nieprawidłowe points/spacing_km'}), 400
+        
+        try:
+            route_analysis = analyze_route(start_location, end_location, flight_date, flight_time, points, spacing_km)
+        except (RouteError, ForecastError) as e:
+            return jsonify({'error': str(e)}), 400
         
         return jsonify(route_analysis)
     except Exception as e:
         print(f"Błąd analizy trasy: {e}")
         return jsonify({'error': f'Błąd analizy trasy: {str(e)}'}), 500
 
+@app.route('/api/release_window', methods=['POST'])
+def release_window():
+    """Najlepsza godzina wypuszczenia w oknie czasu - ranking kandydatów dla trasy"""
+    try:
+        if not request.is_json:
+            return jsonify({'error': 'Oczekiwano danych JSON'}), 400
+        
+        data = request.json or {}
+        start_location = data.get('start_location')
+        end_location = data.get('end_location')
+        if not start_location or not end_location:
+            return jsonify({'error': 'Brak start_location lub end_location'}), 400
+        
+        flight_date = data.get('flight_date', (datetime.now() + timedelta(days=1)).strftime('%Y-%m-%d'))
+        window_start = data.get('window_start', '06:00')
+        window_end = data.get('window_end', '11:00')
+        try:
+            datetime.strptime(flight_date, '%Y-%m-%d')
+            datetime.strptime(window_start, '%H:%M')
+            datetime.strptime(window_end, '%H:%M')
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Nieprawidłowa data lub okno czasu (YYYY-MM-DD, HH:MM)'}), 400
+        try:
+            step_minutes = int(data['step_minutes']) if data.get('step_minutes') else None
+            points = int(data['points']) if data.get('points') else None
+            spacing_km = float(data['spacing_km']) if data.get('spacing_km') else None
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Nieprawidłowe step_minutes/points/spacing_km'}), 400
+        if step_minutes is not None and step_minutes < 5:
+            return jsonify({'error': 'step_minutes musi wynosić co najmniej 5'}), 400
+        
+        try:
+            result = search_release_times(start_location, end_location, flight_date, window_start, window_end,
+                                          step_minutes, points, spacing_km)
+        except (RouteError, ForecastError) as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify(result)
+    except Exception as e:
+        print(f"Błąd wyszukiwania godziny wypuszczenia: {e}")
+        return jsonify({'error': f'Błąd wyszukiwania godziny wypuszczenia: {str(e)}'}), 500
+
+@app.route('/api/analyze_race', methods=['POST'])
+def analyze_race():
+    """Analiza wyścigu: jedno miejsce wypuszczenia, wiele gołębników - wyniki jako strumień NDJSON"""
+    try:
+        if not request.is_json:
+            return jsonify({'error': 'Oczekiwano danych JSON'}), 400
+        
+        data = request.json or {}
+        release = data.get('release')
+        lofts = data.get('lofts')
+        if not release:
+            return jsonify({'error': 'Brak miejsca wypuszczenia (release)'}), 400
+        if not isinstance(lofts, list) or not lofts:
+            return jsonify({'error': 'Brak listy gołębników (lofts)'}), 400
+        if len(lofts) > config.RACE_MAX_LOFTS:
+            return jsonify({'error': f'Maksymalnie {config.RACE_MAX_LOFTS} gołębników'}), 400
+        
+        flight_date = data.get('flight_date', datetime.now().strftime('%Y-%m-%d'))
+        flight_time = data.get('flight_time', '08:00')
+        try:
+            datetime.strptime(flight_date, '%Y-%m-%d')
+            datetime.strptime(flight_time, '%H:%M')
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Nieprawidłowa data lub czas (YYYY-MM-DD, HH:MM)'}), 400
+        try:
+            spacing_km = float(data['spacing_km']) if data.get('spacing_km') else None
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Nieprawidłowe spacing_km'}), 400
+        
+        # Gołębnik: {'id', 'location'}, {'id', 'lat', 'lon'} albo sama lokalizacja (id = pozycja na liście)
+        entries = []
+        for i, loft in enumerate(lofts):
+            loft_id = loft.get('id', i) if isinstance(loft, dict) else i
+            location = loft.get('location', loft) if isinstance(loft, dict) else loft
+            entries.append((loft_id, location))
+        
+        # Cały wyścig ma wspólny, dłuższy termin niż pojedyncze zapytanie
+        deadline = time.monotonic() + config.RACE_DEADLINE
+        try:
+            release_name, routes = plan_race(release, entries, spacing_km, deadline)
+        except RouteError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        def generate():
+            yield json.dumps({
+                'type': 'race',
+                'release': release_name,
+                'flight_date': flight_date,
+                'flight_time': flight_time,
+                'lofts': len(routes)
+            }, ensure_ascii=False) + '\n'
+            for line in race_reports(routes, flight_date, flight_time, deadline):
+                yield json.dumps(line, ensure_ascii=False) + '\n'
+        
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    except Exception as e:
+        print(f"Błąd analizy wyścigu: {e}")
+        return jsonify({'error': f'Błąd analizy wyścigu: {str(e)}'}), 500
+
 def validate_coordinates(lat, lon):
     """Walidacja współrzędnych geograficznych"""
     try:
@@ -341,6 +615,26 @@ def validate_coordinates(lat, lon):
     except (ValueError, TypeError):
         return False, "Invalid coordinates format"
 
+def conditional_json(payload, last_modified=None, max_age: float = 0):
+    """JSON z ETag, Last-Modified i Cache-Control; 304 gdy klient ma aktualną kopię"""
+    response = jsonify(payload)
+    response.add_etag()
+    if last_modified:
+        response.last_modified = datetime.fromtimestamp(last_modified, tz=timezone.utc)
+    response.headers['Cache-Control'] = (
+        f'public, max-age={int(max_age)}, stale-while-revalidate={config.HTTP_STALE_WHILE_REVALIDATE}'
+    )
+    return response.make_conditional(request)
+
+def layer_response(payload, weather_data, lat, lon):
+    """Odpowiedź warstwy - świeżość z czasu aktualizacji danych i pozostałego TTL cache"""
+    updated = weather_data.get('current', {}).get('last_updated_epoch')
+    if weather_data.get('source') == 'grid':
+        remaining = config.WEATHER_CACHE_TTL_CURRENT
+    else:
+        remaining = weather_client.remaining_ttl('current.json', {'q': f"{lat},{lon}", 'aqi': 'no'})
+    return conditional_json(payload, updated, remaining)
+
 @app.route('/api/weather/layers/temperature')
 def temperature_layer():
     """Warstwa temperatury - rzeczywiste dane z WeatherAPI.com"""
@@ -355,16 +649,9 @@ def temperature_layer():
         lat, lon = result
         
         # Pobierz rzeczywiste dane pogodowe
-        url = "http://api.weatherapi.com/v1/current.json"
-        params = {
-            'key': WEATHERAPI_KEY,
-            'q': f"{lat},{lon}",
-            'aqi': 'no'
-        }
-        response = requests.get(url, params=params, timeout=10)
+        status_code, weather_data = current_conditions(lat, lon)
         
-        if response.status_code == 200:
-            weather_data = response.json()
+        if status_code == 200 and weather_data:
             temp_c = weather_data.get('current', {}).get('temp_c', 0)
             
             # Generuj punkty temperatury wokół lokalizacji
@@ -412,9 +699,9 @@ def temperature_layer():
                     }
                 ]
             }
-            return jsonify(data)
+            return layer_response(data, weather_data, lat, lon)
         else:
-            return jsonify({'error': f'API Error: {response.status_code}'}), 500
+            return jsonify({'error': f'API Error: {status_code}'}), 500
             
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -427,16 +714,9 @@ def wind_layer():
         lon = request.args.get('lon', 21.0122)
         
         # Pobierz rzeczywiste dane pogodowe
-        url = "http://api.weatherapi.com/v1/current.json"
-        params = {
-            'key': WEATHERAPI_KEY,
-            'q': f"{lat},{lon}",
-            'aqi': 'no'
-        }
-        response = requests.get(url, params=params, timeout=10)
+        status_code, weather_data = current_conditions(lat, lon)
         
-        if response.status_code == 200:
-            weather_data = response.json()
+        if status_code == 200 and weather_data:
             current = weather_data.get('current', {})
             
             data = {
@@ -460,9 +740,9 @@ def wind_layer():
                     }
                 ]
             }
-            return jsonify(data)
+            return layer_response(data, weather_data, lat, lon)
         else:
-            return jsonify({'error': f'API Error: {response.status_code}'}), 500
+            return jsonify({'error': f'API Error: {status_code}'}), 500
             
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -475,16 +755,9 @@ def precipitation_layer():
         lon = request.args.get('lon', 21.0122)
         
         # Pobierz rzeczywiste dane pogodowe
-        url = "http://api.weatherapi.com/v1/current.json"
-        params = {
-            'key': WEATHERAPI_KEY,
-            'q': f"{lat},{lon}",
-            'aqi': 'no'
-        }
-        response = requests.get(url, params=params, timeout=10)
+        status_code, weather_data = current_conditions(lat, lon)
         
-        if response.status_code == 200:
-            weather_data = response.json()
+        if status_code == 200 and weather_data:
             current = weather_data.get('current', {})
             
             data = {
@@ -506,9 +779,9 @@ def precipitation_layer():
                     }
                 ]
             }
-            return jsonify(data)
+            return layer_response(data, weather_data, lat, lon)
         else:
-            return jsonify({'error': f'API Error: {response.status_code}'}), 500
+            return jsonify({'error': f'API Error: {status_code}'}), 500
             
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -521,16 +794,9 @@ def radar_layer():
         lon = request.args.get('lon', 21.0122)
         
         # Pobierz rzeczywiste dane pogodowe
-        url = "http://api.weatherapi.com/v1/current.json"
-        params = {
-            'key': WEATHERAPI_KEY,
-            'q': f"{lat},{lon}",
-            'aqi': 'no'
-        }
-        response = requests.get(url, params=params, timeout=10)
+        status_code, weather_data = current_conditions(lat, lon)
         
-        if response.status_code == 200:
-            weather_data = response.json()
+        if status_code == 200 and weather_data:
             current = weather_data.get('current', {})
             
             # Określ intensywność na podstawie opadów
@@ -567,9 +833,9 @@ def radar_layer():
                     }
                 ]
             }
-            return jsonify(data)
+            return layer_response(data, weather_data, lat, lon)
         else:
-            return jsonify({'error': f'API Error: {response.status_code}'}), 500
+            return jsonify({'error': f'API Error: {status_code}'}), 500
             
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -582,16 +848,9 @@ def clouds_layer():
         lon = request.args.get('lon', 21.0122)
         
         # Pobierz rzeczywiste dane pogodowe
-        url = "http://api.weatherapi.com/v1/current.json"
-        params = {
-            'key': WEATHERAPI_KEY,
-            'q': f"{lat},{lon}",
-            'aqi': 'no'
-        }
-        response = requests.get(url, params=params, timeout=10)
+        status_code, weather_data = current_conditions(lat, lon)
         
-        if response.status_code == 200:
-            weather_data = response.json()
+        if status_code == 200 and weather_data:
             current = weather_data.get('current', {})
             
             cloud_cover = current.get('cloud', 0)
@@ -625,9 +884,9 @@ def clouds_layer():
                     }
                 ]
             }
-            return jsonify(data)
+            return layer_response(data, weather_data, lat, lon)
         else:
-            return jsonify({'error': f'API Error: {response.status_code}'}), 500
+            return jsonify({'error': f'API Error: {status_code}'}), 500
             
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -640,16 +899,9 @@ def pressure_layer():
         lon = request.args.get('lon', 21.0122)
         
         # Pobierz rzeczywiste dane pogodowe
-        url = "http://api.weatherapi.com/v1/current.json"
-        params = {
-            'key': WEATHERAPI_KEY,
-            'q': f"{lat},{lon}",
-            'aqi': 'no'
-        }
-        response = requests.get(url, params=params, timeout=10)
+        status_code, weather_data = current_conditions(lat, lon)
         
-        if response.status_code == 200:
-            weather_data = response.json()
+        if status_code == 200 and weather_data:
             current = weather_data.get('current', {})
             
             data = {
@@ -670,9 +922,9 @@ def pressure_layer():
                     }
                 ]
             }
-            return jsonify(data)
+            return layer_response(data, weather_data, lat, lon)
         else:
-            return jsonify({'error': f'API Error: {response.status_code}'}), 500
+            return jsonify({'error': f'API Error: {status_code}'}), 500
             
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -685,16 +937,9 @@ def humidity_layer():
         lon = request.args.get('lon', 21.0122)
         
         # Pobierz rzeczywiste dane pogodowe
-        url = "http://api.weatherapi.com/v1/current.json"
-        params = {
-            'key': WEATHERAPI_KEY,
-            'q': f"{lat},{lon}",
-            'aqi': 'no'
-        }
-        response = requests.get(url, params=params, timeout=10)
+        status_code, weather_data = current_conditions(lat, lon)
         
-        if response.status_code == 200:
-            weather_data = response.json()
+        if status_code == 200 and weather_data:
             current = weather_data.get('current', {})
             
             data = {
@@ -715,9 +960,9 @@ def humidity_layer():
                     }
                 ]
             }
-            return jsonify(data)
+            return layer_response(data, weather_data, lat, lon)
         else:
-            return jsonify({'error': f'API Error: {response.status_code}'}), 500
+            return jsonify({'error': f'API Error: {status_code}'}), 500
             
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -730,16 +975,9 @@ def visibility_layer():
         lon = request.args.get('lon', 21.0122)
         
         # Pobierz rzeczywiste dane pogodowe
-        url = "http://api.weatherapi.com/v1/current.json"
-        params = {
-            'key': WEATHERAPI_KEY,
-            'q': f"{lat},{lon}",
-            'aqi': 'no'
-        }
-        response = requests.get(url, params=params, timeout=10)
+        status_code, weather_data = current_conditions(lat, lon)
         
-        if response.status_code == 200:
-            weather_data = response.json()
+        if status_code == 200 and weather_data:
             current = weather_data.get('current', {})
             
             data = {
@@ -760,9 +998,9 @@ def visibility_layer():
                     }
                 ]
             }
-            return jsonify(data)
+            return layer_response(data, weather_data, lat, lon)
         else:
-            return jsonify({'error': f'API Error: {response.status_code}'}), 500
+            return jsonify({'error': f'API Error: {status_code}'}), 500
             
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -775,16 +1013,9 @@ def satellite_layer():
         lon = request.args.get('lon', 21.0122)
         
         # Pobierz rzeczywiste dane pogodowe
-        url = "http://api.weatherapi.com/v1/current.json"
-        params = {
-            'key': WEATHERAPI_KEY,
-            'q': f"{lat},{lon}",
-            'aqi': 'no'
-        }
-        response = requests.get(url, params=params, timeout=10)
+        status_code, weather_data = current_conditions(lat, lon)
         
-        if response.status_code == 200:
-            weather_data = response.json()
+        if status_code == 200 and weather_data:
             cloud_cover = weather_data.get('current', {}).get('cloud', 0)
             
             data = {
@@ -806,9 +1037,9 @@ def satellite_layer():
                     }
                 ]
             }
-            return jsonify(data)
+            return layer_response(data, weather_data, lat, lon)
         else:
-            return jsonify({'error': f'API Error: {response.status_code}'}), 500
+            return jsonify({'error': f'API Error: {status_code}'}), 500
             
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -821,16 +1052,9 @@ def buildings_3d_layer():
         lon = request.args.get('lon', 21.0122)
         
         # Pobierz rzeczywiste dane pogodowe
-        url = "http://api.weatherapi.com/v1/current.json"
-        params = {
-            'key': WEATHERAPI_KEY,
-            'q': f"{lat},{lon}",
-            'aqi': 'no'
-        }
-        response = requests.get(url, params=params, timeout=10)
+        status_code, weather_data = current_conditions(lat, lon)
         
-        if response.status_code == 200:
-            weather_data = response.json()
+        if status_code == 200 and weather_data:
             pressure = weather_data.get('current', {}).get('pressure_mb', 1013)
             
             # Wysokość budynku na podstawie ciśnienia atmosferycznego
@@ -860,9 +1084,9 @@ def buildings_3d_layer():
                     }
                 ]
             }
-            return jsonify(data)
+            return layer_response(data, weather_data, lat, lon)
         else:
-            return jsonify({'error': f'API Error: {response.status_code}'}), 500
+            return jsonify({'error': f'API Error: {status_code}'}), 500
             
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -875,16 +1099,9 @@ def terrain_3d_layer():
         lon = request.args.get('lon', 21.0122)
         
         # Pobierz rzeczywiste dane pogodowe
-        url = "http://api.weatherapi.com/v1/current.json"
-        params = {
-            'key': WEATHERAPI_KEY,
-            'q': f"{lat},{lon}",
-            'aqi': 'no'
-        }
-        response = requests.get(url, params=params, timeout=10)
+        status_code, weather_data = current_conditions(lat, lon)
         
-        if response.status_code == 200:
-            weather_data = response.json()
+        if status_code == 200 and weather_data:
             humidity = weather_data.get('current', {}).get('humidity', 50)
             
             # Wysokość terenu na podstawie wilgotności
@@ -914,9 +1131,9 @@ def terrain_3d_layer():
                     }
                 ]
             }
-            return jsonify(data)
+            return layer_response(data, weather_data, lat, lon)
         else:
-            return jsonify({'error': f'API Error: {response.status_code}'}), 500
+            return jsonify({'error': f'API Error: {status_code}'}), 500
             
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -929,16 +1146,9 @@ def weather_3d_layer():
         lon = request.args.get('lon', 21.0122)
         
         # Pobierz rzeczywiste dane pogodowe
-        url = "http://api.weatherapi.com/v1/current.json"
-        params = {
-            'key': WEATHERAPI_KEY,
-            'q': f"{lat},{lon}",
-            'aqi': 'no'
-        }
-        response = requests.get(url, params=params, timeout=10)
+        status_code, weather_data = current_conditions(lat, lon)
         
-        if response.status_code == 200:
-            weather_data = response.json()
+        if status_code == 200 and weather_data:
             current = weather_data.get('current', {})
             
             # Określ typ pogody na podstawie warunków
@@ -982,9 +1192,9 @@ def weather_3d_layer():
                     }
                 ]
             }
-            return jsonify(data)
+            return layer_response(data, weather_data, lat, lon)
         else:
-            return jsonify({'error': f'API Error: {response.status_code}'}), 500
+            return jsonify({'error': f'API Error: {status_code}'}), 500
             
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -997,16 +1207,9 @@ def animations_3d_layer():
         lon = request.args.get('lon', 21.0122)
         
         # Pobierz rzeczywiste dane pogodowe
-        url = "http://api.weatherapi.com/v1/current.json"
-        params = {
-            'key': WEATHERAPI_KEY,
-            'q': f"{lat},{lon}",
-            'aqi': 'no'
-        }
-        response = requests.get(url, params=params, timeout=10)
+        status_code, weather_data = current_conditions(lat, lon)
         
-        if response.status_code == 200:
-            weather_data = response.json()
+        if status_code == 200 and weather_data:
             current = weather_data.get('current', {})
             
             # Określ typ animacji na podstawie warunków pogodowych
@@ -1047,9 +1250,9 @@ def animations_3d_layer():
                     }
                 ]
             }
-            return jsonify(data)
+            return layer_response(data, weather_data, lat, lon)
         else:
-            return jsonify({'error': f'API Error: {response.status_code}'}), 500
+            return jsonify({'error': f'API Error: {status_code}'}), 500
             
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -1066,16 +1269,9 @@ def radar_tiles(z, x, y):
         center_lat = (lat_north + lat_south) / 2
         center_lon = (lon_west + lon_east) / 2
         
-        url = "http://api.weatherapi.com/v1/current.json"
-        params = {
-            'key': WEATHERAPI_KEY,
-            'q': f"{center_lat},{center_lon}",
-            'aqi': 'no'
-        }
-        response = requests.get(url, params=params, timeout=10)
+        status_code, weather_data = current_conditions(center_lat, center_lon)
         
-        if response.status_code == 200:
-            weather_data = response.json()
+        if status_code == 200 and weather_data:
             current = weather_data.get('current', {})
             
             # Intensywność na podstawie opadów
@@ -1102,115 +1298,51 @@ def radar_tiles(z, x, y):
                 'humidity': current.get('humidity', 0)
             })
         else:
-            return jsonify({'error': f'API Error: {response.status_code}'}), 500
+            return jsonify({'error': f'API Error: {status_code}'}), 500
             
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def mts_tile_response(layer, z, x, y):
+    """Kafelek raster-array: pasma zlib (little-endian), opis kodowania w nagłówkach X-Raster-*"""
+    if z < 0 or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        return jsonify({'error': 'Nieprawidłowe współrzędne kafelka'}), 400
+    tile = build_mts_tile(layer, z, x, y)
+    if tile is None:
+        # Brak siatki prognoz albo kafelek poza nią - klient traktuje 404 jak pusty kafelek
+        return jsonify({'error': 'Kafelek poza siatką prognoz'}), 404
+    data, meta = tile
+    response = Response(data, mimetype='application/octet-stream')
+    response.headers.update({
+        'X-Raster-Bands': ','.join(meta['bands']),
+        'X-Raster-Reference-Time': str(meta['reference_time']),
+        'X-Raster-Shape': ','.join(str(n) for n in meta['shape']),
+        'X-Raster-Dtype': meta['dtype'],
+        'X-Raster-Scale': str(meta['scale']),
+        'X-Raster-Offset': str(meta['offset']),
+        'X-Raster-Nodata': str(meta['nodata']),
+        'X-Raster-Units': meta['units'],
+        'X-Raster-Compression': 'zlib',
+        'Access-Control-Expose-Headers': 'X-Raster-Bands, X-Raster-Reference-Time, X-Raster-Shape, X-Raster-Dtype, '
+                                         'X-Raster-Scale, X-Raster-Offset, X-Raster-Nodata, X-Raster-Units, X-Raster-Compression',
+        'Cache-Control': f'public, max-age={seconds_to_next_hour()}'
+    })
+    response.add_etag()
+    return response.make_conditional(request)
+
 @app.route('/api/weather/mts/temperature/tiles/<int:z>/<int:x>/<int:y>')
 def temperature_mts_tiles(z, x, y):
-    """Kafelki temperatury w formacie MTS - rzeczywiste dane z WeatherAPI.com"""
+    """Kafelki temperatury w formacie MTS - uint16 (pasma, wiersze, kolumny) w K z siatki prognoz"""
     try:
-        # Pobierz rzeczywiste dane pogodowe dla tego obszaru
-        lat_north, lon_west = num2deg(x, y, z)
-        lat_south, lon_east = num2deg(x + 1, y + 1, z)
-        
-        # Środek kafelka
-        center_lat = (lat_north + lat_south) / 2
-        center_lon = (lon_west + lon_east) / 2
-        
-        url = "http://api.weatherapi.com/v1/current.json"
-        params = {
-            'key': WEATHERAPI_KEY,
-            'q': f"{center_lat},{center_lon}",
-            'aqi': 'no'
-        }
-        response = requests.get(url, params=params, timeout=10)
-        
-        if response.status_code == 200:
-            weather_data = response.json()
-            temp_c = weather_data.get('current', {}).get('temp_c', 0)
-            temp_k = temp_c + 273.15  # Konwersja na Kelviny
-            
-            temperature_data = {
-                'z': z,
-                'x': x,
-                'y': y,
-                'type': 'raster-array',
-                'data': {
-                    'temperature': temp_c,
-                    'temperature_k': temp_k,
-                    'range': [200, 350],  # Zakres w Kelvinach
-                    'scale': 0.1,
-                    'offset': -100,
-                    'units': 'K',
-                    'humidity': weather_data.get('current', {}).get('humidity', 0),
-                    'pressure': weather_data.get('current', {}).get('pressure_mb', 1013)
-                }
-            }
-            return jsonify(temperature_data)
-        else:
-            return jsonify({'error': f'API Error: {response.status_code}'}), 500
-            
+        return mts_tile_response('temperature', z, x, y)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/weather/mts/wind/tiles/<int:z>/<int:x>/<int:y>')
 def wind_mts_tiles(z, x, y):
-    """Kafelki wiatru w formacie MTS - rzeczywiste dane z WeatherAPI.com"""
+    """Kafelki wiatru w formacie MTS - uint8 (pasma, wiersze, kolumny, U/V) w m/s z siatki prognoz"""
     try:
-        # Pobierz rzeczywiste dane pogodowe dla tego obszaru
-        lat_north, lon_west = num2deg(x, y, z)
-        lat_south, lon_east = num2deg(x + 1, y + 1, z)
-        
-        # Środek kafelka
-        center_lat = (lat_north + lat_south) / 2
-        center_lon = (lon_west + lon_east) / 2
-        
-        url = "http://api.weatherapi.com/v1/current.json"
-        params = {
-            'key': WEATHERAPI_KEY,
-            'q': f"{center_lat},{center_lon}",
-            'aqi': 'no'
-        }
-        response = requests.get(url, params=params, timeout=10)
-        
-        if response.status_code == 200:
-            weather_data = response.json()
-            current = weather_data.get('current', {})
-            
-            wind_speed_kph = current.get('wind_kph', 0)
-            wind_speed_ms = wind_speed_kph / 3.6  # Konwersja km/h na m/s
-            wind_direction = current.get('wind_degree', 0)
-            
-            # Oblicz składowe U i V
-            import math
-            wind_rad = math.radians(wind_direction)
-            u_component = -wind_speed_ms * math.sin(wind_rad)
-            v_component = -wind_speed_ms * math.cos(wind_rad)
-            
-            wind_data = {
-                'z': z,
-                'x': x,
-                'y': y,
-                'type': 'raster-array',
-                'data': {
-                    'u_component': round(u_component, 2),
-                    'v_component': round(v_component, 2),
-                    'speed': round(wind_speed_ms, 2),
-                    'direction': wind_direction,
-                    'range': [0, 50],
-                    'scale': 1.0,
-                    'offset': 0,
-                    'units': 'm/s',
-                    'gust_speed': current.get('gust_kph', 0) / 3.6,
-                    'timestamp': weather_data.get('location', {}).get('localtime', '')
-                }
-            }
-            return jsonify(wind_data)
-        else:
-            return jsonify({'error': f'API Error: {response.status_code}'}), 500
-            
+        return mts_tile_response('wind', z, x, y)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -1265,8 +1397,8 @@ def wind_mts_recipe():
         "layers": {
             "wind": {
                 "tilesize": 256,
-                "offset": 0,
-                "scale": 1.0,
+                "offset": -63.5,
+                "scale": 0.5,
                 "resampling": "bilinear",
                 "buffer": 1,
                 "units": "m/s",
@@ -1303,21 +1435,12 @@ def temperature_mts_tilejson():
         "data": [],
         "minzoom": 0,
         "maxzoom": 3,
-        "bounds": [-180, -90, 180, 90],
+        "bounds": grid_bounds() or [-180, -90, 180, 90],
         "center": [0, 0, 0],
         "raster_layers": [
             {
                 "id": "2t",
-                "fields": {
-                    "bands": ["0", "3", "6", "9", "12", "15", "18", "21"],
-                    "buffer": 1,
-                    "name": "2t",
-                    "offset": 0,
-                    "range": [204, 323],
-                    "scale": 1,
-                    "tilesize": 256,
-                    "units": "K"
-                },
+                "fields": dict(band_fields('temperature'), name="2t", range=[204, 323]),
                 "maxzoom": 3,
                 "minzoom": 0
             }
@@ -1344,21 +1467,12 @@ def wind_mts_tilejson():
         "data": [],
         "minzoom": 0,
         "maxzoom": 3,
-        "bounds": [-180, -90, 180, 90],
+        "bounds": grid_bounds() or [-180, -90, 180, 90],
         "center": [0, 0, 0],
         "raster_layers": [
             {
                 "id": "wind",
-                "fields": {
-                    "bands": ["0", "3", "6", "9", "12", "15", "18", "21"],
-                    "buffer": 1,
-                    "name": "wind",
-                    "offset": 0,
-                    "range": [0, 50],
-                    "scale": 1,
-                    "tilesize": 256,
-                    "units": "m/s"
-                },
+                "fields": dict(band_fields('wind'), name="wind", range=[-50, 50]),
                 "maxzoom": 3,
                 "minzoom": 0
             }
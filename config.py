@@ -31,17 +31,112 @@ WEATHER_LANGUAGE = os.getenv('WEATHER_LANGUAGE', "pl")
 # Ustawienia animacji
 DEFAULT_ANIMATION_SPEED = float(os.getenv('DEFAULT_ANIMATION_SPEED', 1.0))
 TIMELINE_STEPS = int(os.getenv('TIMELINE_STEPS', 48))  # 30-minutowe interwały przez 24h
+TIMELINE_STEP_MINUTES = int(os.getenv('TIMELINE_STEP_MINUTES', 30))      # Odstęp klatek (interpolacja z prognoz godzinowych)
+TIMELINE_MAX_STEPS = int(os.getenv('TIMELINE_MAX_STEPS', 144))           # Maks. liczba klatek w odpowiedzi
+TIMELINE_WIDTH = int(os.getenv('TIMELINE_WIDTH', 128))                   # Domyślna szerokość klatki (px)
+TIMELINE_MAX_SIZE = int(os.getenv('TIMELINE_MAX_SIZE', 256))             # Maks. szerokość/wysokość klatki (px)
+TIMELINE_FALLBACK_NODES = int(os.getenv('TIMELINE_FALLBACK_NODES', 8))   # Węzły na bok poza siatką prognoz
+TIMELINE_CACHE_TTL = int(os.getenv('TIMELINE_CACHE_TTL', 600))           # Cache zakodowanych klatek (s)
+MTS_BAND_HOURS = os.getenv('MTS_BAND_HOURS', '0,3,6,9,12,15,18,21')  # Pasma kafelków MTS (godziny od bieżącej pełnej godziny)
 
 # Ustawienia analizy tras
 ROUTE_ANALYSIS_POINTS = int(os.getenv('ROUTE_ANALYSIS_POINTS', 5))  # Liczba punktów analizy na trasie
 MIN_FLIGHT_DISTANCE = int(os.getenv('MIN_FLIGHT_DISTANCE', 10))   # Minimalny dystans lotu w km
 MAX_FLIGHT_DISTANCE = int(os.getenv('MAX_FLIGHT_DISTANCE', 1000)) # Maksymalny dystans lotu w km
+ROUTE_SAMPLE_SPACING_KM = float(os.getenv('ROUTE_SAMPLE_SPACING_KM', 0))  # Odstęp punktów trasy (0 = ROUTE_ANALYSIS_POINTS)
+ROUTE_MAX_POINTS = int(os.getenv('ROUTE_MAX_POINTS', 200))              # Maks. liczba punktów na trasie
+ROUTE_CELL_DEG = float(os.getenv('ROUTE_CELL_DEG', 0.1))                # Siatka komórek prognozy (wspólne dla bliskich punktów)
+ROUTE_FORECAST_DAYS = int(os.getenv('ROUTE_FORECAST_DAYS', 3))          # Horyzont prognozy godzinowej dla tras
+ROUTE_FETCH_WORKERS = int(os.getenv('ROUTE_FETCH_WORKERS', 16))         # Równoległe pobieranie prognoz punktów trasy
+PIGEON_AIRSPEED_KPH = float(os.getenv('PIGEON_AIRSPEED_KPH', 70))       # Prędkość własna gołębia (bez wiatru)
+FLIGHT_STEP_MINUTES = float(os.getenv('FLIGHT_STEP_MINUTES', 5))        # Krok czasu symulacji lotu
+FLIGHT_MAX_HOURS = float(os.getenv('FLIGHT_MAX_HOURS', 16))             # Maks. czas symulowanego lotu
+RELEASE_SEARCH_STEP_MINUTES = int(os.getenv('RELEASE_SEARCH_STEP_MINUTES', 30))  # Krok kandydatów godziny wypuszczenia
+RELEASE_SEARCH_MAX_CANDIDATES = int(os.getenv('RELEASE_SEARCH_MAX_CANDIDATES', 144))  # Maks. liczba kandydatów w oknie
+RACE_SAMPLE_SPACING_KM = float(os.getenv('RACE_SAMPLE_SPACING_KM', 10))  # Odstęp punktów tras wyścigu (wspólne komórki korytarza)
+RACE_MAX_LOFTS = int(os.getenv('RACE_MAX_LOFTS', 1000))                 # Maks. liczba gołębników w jednym wyścigu
+RACE_DEADLINE = float(os.getenv('RACE_DEADLINE', 60))                   # Termin pobrania prognoz dla całego wyścigu (s)
 
 # Ustawienia Redis
 REDIS_HOST = os.getenv('REDIS_HOST', 'localhost')
 REDIS_PORT = int(os.getenv('REDIS_PORT', 6379))
 REDIS_DB = int(os.getenv('REDIS_DB', 0))
+REDIS_CACHE_TIMEOUT = float(os.getenv('REDIS_CACHE_TIMEOUT', 0.5))  # Timeout operacji cache L2 (s)
 
 # Ustawienia rate limiting
 RATE_LIMIT_DAILY = os.getenv('RATE_LIMIT_DAILY', '200 per day')
-RATE_LIMIT_HOURLY = os.getenv('RATE_LIMIT_HOURLY', '50 per hour') 
\ No newline at end of file
+RATE_LIMIT_HOURLY = os.getenv('RATE_LIMIT_HOURLY', '50 per hour')
+
+# Ustawienia klienta WeatherAPI (pula połączeń i cache odpowiedzi)
+WEATHERAPI_BASE_URL = os.getenv('WEATHERAPI_BASE_URL', "http://api.weatherapi.com/v1")
+WEATHERAPI_TIMEOUT = float(os.getenv('WEATHERAPI_TIMEOUT', 10))
+WEATHERAPI_POOL_SIZE = int(os.getenv('WEATHERAPI_POOL_SIZE', 32))  # Połączenia keep-alive na hosta
+WEATHER_CACHE_MAXSIZE = int(os.getenv('WEATHER_CACHE_MAXSIZE', 4096))  # Maks. liczba odpowiedzi w cache
+WEATHER_CACHE_TTL_CURRENT = int(os.getenv('WEATHER_CACHE_TTL_CURRENT', 300))     # current.json - 5 minut
+WEATHER_CACHE_TTL_FORECAST = int(os.getenv('WEATHER_CACHE_TTL_FORECAST', 1800))  # forecast.json - 30 minut
+WEATHER_CACHE_TTL_SEARCH = int(os.getenv('WEATHER_CACHE_TTL_SEARCH', 86400))     # search.json - 24 godziny
+WEATHER_CACHE_TTL_DEFAULT = int(os.getenv('WEATHER_CACHE_TTL_DEFAULT', 300))
+WEATHER_CACHE_MAX_STALE = int(os.getenv('WEATHER_CACHE_MAX_STALE', 900))      # Przeterminowana odpowiedź serwowana max. tyle s (odświeżanie w tle)
+WEATHER_CACHE_TTL_JITTER = float(os.getenv('WEATHER_CACHE_TTL_JITTER', 0.1))  # Losowe skrócenie TTL (ułamek), by wpisy nie wygasały naraz
+
+# Limit wywołań WeatherAPI (wspólny dla wszystkich workerów przez Redis, jeśli jest)
+WEATHERAPI_QUOTA_MONTHLY = int(os.getenv('WEATHERAPI_QUOTA_MONTHLY', 1000000))   # Darmowy plan
+WEATHERAPI_QUOTA_DAILY = int(os.getenv('WEATHERAPI_QUOTA_DAILY', 0))             # 0 = miesięczny / 30
+WEATHERAPI_QUOTA_PER_SECOND = float(os.getenv('WEATHERAPI_QUOTA_PER_SECOND', 50))
+WEATHERAPI_QUOTA_RESERVE_TILE = float(os.getenv('WEATHERAPI_QUOTA_RESERVE_TILE', 0.1))       # Część budżetu tylko dla zapytań interaktywnych
+WEATHERAPI_QUOTA_RESERVE_PREWARM = float(os.getenv('WEATHERAPI_QUOTA_RESERVE_PREWARM', 0.3)) # Prewarming zatrzymuje się wcześniej
+
+# Terminy, hedging i circuit breaker wywołań WeatherAPI
+REQUEST_DEADLINE = float(os.getenv('REQUEST_DEADLINE', 10.0))                  # Budżet czasu zapytania przychodzącego (s)
+WEATHERAPI_HEDGE_QUANTILE = float(os.getenv('WEATHERAPI_HEDGE_QUANTILE', 0.95))  # Zapytanie zapasowe po tym kwantylu opóźnień (0 = wyłączone)
+WEATHERAPI_HEDGE_MIN_DELAY = float(os.getenv('WEATHERAPI_HEDGE_MIN_DELAY', 0.05))
+WEATHERAPI_BREAKER_ERROR_RATE = float(os.getenv('WEATHERAPI_BREAKER_ERROR_RATE', 0.5))  # Odsetek błędów otwierający breaker
+WEATHERAPI_BREAKER_MIN_CALLS = int(os.getenv('WEATHERAPI_BREAKER_MIN_CALLS', 20))
+WEATHERAPI_BREAKER_WINDOW = float(os.getenv('WEATHERAPI_BREAKER_WINDOW', 30))          # Okno liczenia błędów (s)
+WEATHERAPI_BREAKER_COOLDOWN = float(os.getenv('WEATHERAPI_BREAKER_COOLDOWN', 15))      # Po tylu s jedno zapytanie próbne
+
+# Ustawienia serwera kafelków pogodowych
+TILE_SAMPLE_WORKERS = int(os.getenv('TILE_SAMPLE_WORKERS', 16))        # Równoległe pobieranie próbek na proces
+TILE_SAMPLE_DEADLINE = float(os.getenv('TILE_SAMPLE_DEADLINE', 8.0))   # Maks. czas zbierania próbek kafelka (s)
+LATTICE_STEP_DEG = float(os.getenv('LATTICE_STEP_DEG', 0.25))            # Krok globalnej siatki próbek (stopnie)
+LATTICE_NODES_PER_TILE = int(os.getenv('LATTICE_NODES_PER_TILE', 8))     # Docelowa liczba węzłów na bok kafelka
+TILE_MAX_NATIVE_ZOOM = int(os.getenv('TILE_MAX_NATIVE_ZOOM', 10))       # Powyżej - kafelki z przybliżenia przodka
+TILE_MAX_NATIVE_ZOOM_LAYERS = {                                           # Nadpisania per warstwa, np. "precipitation:11"
+    layer: int(zoom) for layer, zoom in
+    (item.split(':') for item in os.getenv('TILE_MAX_NATIVE_ZOOM_LAYERS', '').split(',') if item)
+}
+TILE_STORE_BACKEND = os.getenv('TILE_STORE_BACKEND', 'sqlite')            # 'sqlite' (jeden plik) lub 'files'
+TILE_STORE_PATH = os.getenv('TILE_STORE_PATH', '')                        # Domyślnie weather_tiles_cache/tiles.sqlite
+TILE_STORE_MAX_MB = int(os.getenv('TILE_STORE_MAX_MB', 512))              # Limit rozmiaru - eviction LRU
+TILE_STORE_RETENTION = int(os.getenv('TILE_STORE_RETENTION', 86400))      # Kafelki starsze są usuwane przez GC
+TILE_STORE_GC_INTERVAL = int(os.getenv('TILE_STORE_GC_INTERVAL', 600))    # Co ile sekund GC/vacuum (0 = wyłączone)
+TILE_MEMORY_CACHE_MB = int(os.getenv('TILE_MEMORY_CACHE_MB', 64))       # Budżet pamięci na gorące kafelki (PNG)
+TILE_MAX_STALE = int(os.getenv('TILE_MAX_STALE', 1800))                  # Przeterminowany kafelek serwowany max. tyle s (odświeżanie w tle)
+TILE_TTL_JITTER = float(os.getenv('TILE_TTL_JITTER', 0.1))              # Rozrzut wygasania kafelków (ułamek CACHE_TIMEOUT)
+TILE_REFRESH_WORKERS = int(os.getenv('TILE_REFRESH_WORKERS', 2))         # Wątki odświeżające przeterminowane kafelki
+WIND_TEXTURE_WIDTH = int(os.getenv('WIND_TEXTURE_WIDTH', 360))          # Domyślna szerokość tekstury U/V wiatru (px)
+WIND_TEXTURE_MAX_SIZE = int(os.getenv('WIND_TEXTURE_MAX_SIZE', 1024))    # Maks. szerokość/wysokość tekstury (px)
+PREWARM_ENABLED = os.getenv('PREWARM_ENABLED', 'false').lower() == 'true'  # Wątek odświeżania w tle (włącz w jednym procesie)
+PREWARM_REGIONS = os.getenv('PREWARM_REGIONS', '14.0,49.0,24.2,55.0:5-9')  # "zach,płd,wsch,płn:zmin-zmax;..."
+PREWARM_LAYERS = os.getenv('PREWARM_LAYERS', 'temperature,wind,precipitation').split(',')
+PREWARM_LEAD = int(os.getenv('PREWARM_LEAD', 300))                        # Odświeżaj na tyle sekund przed wygaśnięciem
+PREWARM_INTERVAL = int(os.getenv('PREWARM_INTERVAL', 60))                 # Co ile sekund cykl prewarmingu
+PREWARM_CALL_BUDGET = int(os.getenv('PREWARM_CALL_BUDGET', 2000))         # Maks. wywołań WeatherAPI na cykl
+FORECAST_GRID_DIR = os.getenv('FORECAST_GRID_DIR', 'forecast_grid')          # Katalog kostek prognoz (.npy, mmap)
+FORECAST_GRID_SOURCE = os.getenv('FORECAST_GRID_SOURCE', 'weatherapi')     # 'weatherapi' (węzły) lub 'files' (pliki modelu)
+FORECAST_GRID_MODEL_DIR = os.getenv('FORECAST_GRID_MODEL_DIR', 'model_data')  # Katalog plików modelu (.npz, .nc)
+_grid_utc_offset = os.getenv('FORECAST_GRID_UTC_OFFSET')
+FORECAST_GRID_UTC_OFFSET = float(_grid_utc_offset) * 3600 if _grid_utc_offset else None  # Czas lokalny plików modelu (h; puste = strefa serwera)
+FORECAST_GRID_BBOX = os.getenv('FORECAST_GRID_BBOX', '14.0,49.0,24.2,55.0')  # Obszar siatki "zach,płd,wsch,płn"
+FORECAST_GRID_STEP = float(os.getenv('FORECAST_GRID_STEP', 0.5))             # Krok siatki (stopnie); domyślnie 273 węzły = 273 wywołania na pobranie
+FORECAST_GRID_DAYS = int(os.getenv('FORECAST_GRID_DAYS', 3))                 # Horyzont prognozy godzinowej siatki
+FORECAST_GRID_INGEST_ENABLED = os.getenv('FORECAST_GRID_INGEST_ENABLED', 'false').lower() == 'true'  # Wątek pobierania (jeden proces)
+FORECAST_GRID_INGEST_INTERVAL = int(os.getenv('FORECAST_GRID_INGEST_INTERVAL', 10800))  # Co ile sekund nowe pobranie (domyślnie ~66 tys. wywołań/miesiąc)
+FORECAST_GRID_WORKERS = int(os.getenv('FORECAST_GRID_WORKERS', 16))          # Równoległe pobieranie węzłów
+FORECAST_GRID_MAX_MISSING = float(os.getenv('FORECAST_GRID_MAX_MISSING', 0.05))  # Ułamek brakujących węzłów blokujący podmianę
+FORECAST_GRID_MAX_AGE = int(os.getenv('FORECAST_GRID_MAX_AGE', 86400))       # Starsze dane (od pobrania z WeatherAPI / mtime pliku modelu) nie są używane (s)
+FORECAST_GRID_MIN_HORIZON = int(os.getenv('FORECAST_GRID_MIN_HORIZON', 21600))  # Siatka z krótszą pozostałą prognozą nie jest używana (s)
+FORECAST_GRID_KEEP_RUNS = int(os.getenv('FORECAST_GRID_KEEP_RUNS', 2))       # Liczba przechowywanych pobrań
+
+# Nagłówki cache HTTP (kafelki i warstwy JSON)
+HTTP_STALE_WHILE_REVALIDATE = int(os.getenv('HTTP_STALE_WHILE_REVALIDATE', 60))
@@ -0,0 +1,36 @@
+"""
+Wspólne fixture testów - syntetyczny plik modelu dla pobrania siatki prognoz
+"""
+
+import os
+import time
+
+import numpy as np
+import pytest
+
+from grid_sources import ModelFileSource
+
+HOUR = 3600
+
+
+@pytest.fixture
+def model_file(tmp_path):
+    """Plik .npz w konwencji modelu: K, Pa, Wind_components (czas, u/v, lat, lon) w m/s, lats malejąco"""
+    start = time.time() // HOUR * HOUR - HOUR
+    times = start + np.arange(24) * HOUR
+    lats = np.array([53.0, 52.0, 51.0, 50.0])
+    lons = np.array([19.0, 20.0, 21.0, 22.0])
+    shape = (len(times), len(lats), len(lons))
+    temperature = np.full(shape, 283.15, dtype=np.float32) + np.arange(len(times), dtype=np.float32)[:, None, None]
+    wind = np.zeros((len(times), 2) + shape[1:], dtype=np.float32)
+    wind[:, 0] = 5.0  # u: wieje na wschód, czyli z zachodu
+    pressure = np.full(shape, 101300.0, dtype=np.float32)
+
+    directory = tmp_path / 'model'
+    directory.mkdir()
+    path = directory / 'run.npz'
+    np.savez(path, times=times, lats=lats, lons=lons, Temperature_height_above_ground=temperature,
+             Wind_components=wind, Pressure_reduced_to_MSL_msl=pressure)
+    settled = time.time() - ModelFileSource.SETTLE_SECONDS - 1
+    os.utime(path, (settled, settled))
+    return directory, times
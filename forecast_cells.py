@@ -0,0 +1,112 @@
+"""
+Godzinowe prognozy komórek siatki ROUTE_CELL_DEG - wspólne dla tras lotu, klatek animacji
+i pola wiatru: siatka prognoz albo równoległe pobrania z cache, złożone w kostkę na wspólnej osi czasu
+"""
+
+import calendar
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+import config
+from forecast_grid import forecast_grid
+from grid_sources import GRID_FIELD, parse_hours
+from weather_client import TTLCache, request_deadline, weather_client
+
+# Pola prognozy godzinowej komórki (podzbiór GRID_FIELDS); wiatr jako składowe, żeby dało się interpolować
+HOUR_FIELDS = ('temp_c', 'wind_u', 'wind_v', 'gust_kph', 'precip_mm', 'chance_of_rain', 'vis_km', 'humidity', 'cloud')
+FIELD = {name: i for i, name in enumerate(HOUR_FIELDS)}
+
+# Równoległe pobieranie prognoz dla komórek
+cell_executor = ThreadPoolExecutor(max_workers=config.ROUTE_FETCH_WORKERS, thread_name_prefix='cell-forecast')
+# Sparsowane prognozy komórek - ciepła trasa nie parsuje ponownie JSON
+cell_cache = TTLCache(maxsize=8192)
+
+CellForecast = namedtuple('CellForecast', ['epochs', 'values', 'utc_offset'])
+
+
+class ForecastError(ValueError):
+    """Brak danych prognozy dla żadnej z komórek - zwracane klientowi jako 400"""
+
+
+def cell_of(lat, lon):
+    """Komórka siatki ROUTE_CELL_DEG dla punktu - wspólny klucz prognozy dla bliskich punktów i tras"""
+    step = config.ROUTE_CELL_DEG
+    return (round(round(lat / step) * step, 4), round(round(lon / step) * step, 4))
+
+
+def cell_forecast(cell, deadline=None):
+    """Prognoza godzinowa komórki jako tablice (CellForecast) albo None, gdy brak danych.
+
+    Komórki w zasięgu siatki prognoz (forecast_grid) czytane są z niej bez wywołań upstream.
+    """
+    grid = forecast_grid.snapshot()
+    if grid is not None and grid.covers_point(*cell):
+        return CellForecast(*grid.point_hours(cell[0], cell[1], HOUR_FIELDS))
+
+    cached = cell_cache.get(cell)
+    if cached is not None:
+        return cached
+
+    params = {'q': f"{cell[0]},{cell[1]}", 'days': config.ROUTE_FORECAST_DAYS, 'aqi': 'no', 'alerts': 'no'}
+    status, data = weather_client.fetch('forecast.json', params, deadline=deadline)
+    parsed = parse_hours(data) if status == 200 else None
+    if parsed is None:
+        return None
+    epochs, values, utc_offset = parsed
+    forecast = CellForecast(epochs, values[:, [GRID_FIELD[name] for name in HOUR_FIELDS]], utc_offset)
+
+    cell_cache.set(cell, forecast, weather_client.remaining_ttl('forecast.json', params))
+    return forecast
+
+
+def fetch_cells(cells, deadline=None):
+    """Prognozy dla listy komórek - równolegle, każda komórka raz, przez cache klienta"""
+    deadline = deadline or request_deadline.get()
+    futures = [cell_executor.submit(cell_forecast, cell, deadline) for cell in cells]
+    return [future.result() for future in futures]
+
+
+class ForecastCube:
+    """Prognozy godzinowe wielu komórek na wspólnej osi czasu: values (komórki, godziny, pola)"""
+
+    def __init__(self, cells, forecasts):
+        self.index = {cell: i for i, cell in enumerate(cells)}
+        available = [f for f in forecasts if f is not None]
+        if not available:
+            raise ForecastError("Brak danych prognozy")
+        self.times = np.unique(np.concatenate([f.epochs for f in available]))
+        self.values = np.full((len(cells), len(self.times), len(HOUR_FIELDS)), np.nan, dtype=np.float32)
+        for i, forecast in enumerate(forecasts):
+            if forecast is not None:
+                self.values[i, np.searchsorted(self.times, forecast.epochs)] = forecast.values
+        self.utc_offset = available[0].utc_offset
+
+    def cell_indices(self, cells):
+        return np.array([self.index[cell] for cell in cells], dtype=np.intp)
+
+    def covers(self, epochs):
+        epochs = np.asarray(epochs)
+        return bool(np.all((epochs >= self.times[0]) & (epochs <= self.times[-1])))
+
+    def local_epoch(self, date_text, time_text):
+        """Czas lokalny trasy ('YYYY-MM-DD', 'HH:MM') jako epoka UTC"""
+        local = datetime.strptime(f"{date_text} {time_text}", '%Y-%m-%d %H:%M')
+        return calendar.timegm(local.timetuple()) - self.utc_offset
+
+    def sample(self, cell_idx, epochs):
+        """Pola prognozy dla par (indeks komórki, epoka) - liniowo w czasie; kształt wejścia + (pola,)"""
+        cell_idx = np.asarray(cell_idx)
+        position = np.interp(epochs, self.times, np.arange(len(self.times)))
+        i0 = np.floor(position).astype(np.intp)
+        i1 = np.minimum(i0 + 1, len(self.times) - 1)
+        frac = (position - i0)[..., None].astype(np.float32)
+        return self.values[cell_idx, i0] * (1 - frac) + self.values[cell_idx, i1] * frac
+
+
+def load_cube(cells, deadline=None):
+    """ForecastCube dla unikalnych komórek z listy (kolejność pierwszego wystąpienia)"""
+    unique = list(dict.fromkeys(cells))
+    return ForecastCube(unique, fetch_cells(unique, deadline))
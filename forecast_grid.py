@@ -0,0 +1,278 @@
+"""
+Magazyn godzinowych prognoz na regularnej siatce - kostki float32 (pole x godzina x lat x lon)
+w plikach .npy mapowanych do pamięci, podmieniane atomowo po każdym pobraniu
+
+Układ katalogu:
+    <katalog>/<run>/cube.npy        prognoza (pola, godziny, szerokości, długości)
+    <katalog>/<run>/utc_offset.npy  przesunięcie czasu lokalnego węzłów (s)
+    <katalog>/<run>/meta.json       osie i opis pobrania
+    <katalog>/current               dowiązanie do aktualnego <run>
+
+Wszystkie procesy czytają te same pliki przez mmap, więc dzielą page cache.
+"""
+
+import fcntl
+import json
+import os
+import shutil
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+from prometheus_client import Gauge
+
+import config
+from grid_sources import GRID_FIELDS, GridSourceError, open_grid_source, parse_bbox
+
+# Pola wyliczane z innych przy próbkowaniu
+DERIVED_FIELDS = ('wind_degree',)
+
+# Metryki Prometheus
+grid_run_age = Gauge('forecast_grid_run_age_seconds', 'Age of the source data of the forecast grid run currently served')
+grid_missing_nodes = Gauge('forecast_grid_missing_nodes', 'Lattice nodes without data in the last WeatherAPI grid ingest')
+
+
+class GridSnapshot:
+    """Jedno pobranie siatki (mmap) - niezmienne, bezpieczne do użycia w całym zapytaniu"""
+
+    def __init__(self, directory):
+        with open(os.path.join(directory, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.run = self.meta['run']
+        self.created = self.meta['created']
+        self.source_time = self.meta.get('source_time', self.created)  # czas danych (pobranie, mtime pliku modelu)
+        self.fields = {name: i for i, name in enumerate(self.meta['fields'])}
+        self.times = np.array(self.meta['times'], dtype=np.float64)
+        self.lats = np.array(self.meta['lats'], dtype=np.float64)
+        self.lons = np.array(self.meta['lons'], dtype=np.float64)
+        self.cube = np.load(os.path.join(directory, 'cube.npy'), mmap_mode='r')
+        self.utc_offset = np.load(os.path.join(directory, 'utc_offset.npy'), mmap_mode='r')
+
+    def covers(self, lat_min, lat_max, lon_min, lon_max, epoch=None):
+        """Czy prostokąt (i chwila epoch) mieści się w siatce"""
+        inside = (self.lats[0] <= lat_min and lat_max <= self.lats[-1]
+                  and self.lons[0] <= lon_min and lon_max <= self.lons[-1])
+        if epoch is not None:
+            inside = inside and self.times[0] <= epoch <= self.times[-1]
+        return bool(inside)
+
+    def covers_point(self, lat, lon, epoch=None):
+        return self.covers(lat, lat, lon, lon, epoch)
+
+    def _corners(self, lats, lons):
+        rows = np.interp(lats, self.lats, np.arange(len(self.lats)))
+        cols = np.interp(lons, self.lons, np.arange(len(self.lons)))
+        r0 = np.minimum(np.floor(rows).astype(np.intp), len(self.lats) - 2).clip(0)
+        c0 = np.minimum(np.floor(cols).astype(np.intp), len(self.lons) - 2).clip(0)
+        return r0, c0, (rows - r0).astype(np.float32), (cols - c0).astype(np.float32)
+
+    def sample(self, lats, lons, epochs, names=GRID_FIELDS):
+        """Pola names w punktach (lats, lons, epochs) - dwuliniowo w przestrzeni, liniowo w czasie.
+
+        Wejścia są rozgłaszane do wspólnego kształtu; wynik ma kształt + (len(names),).
+        'wind_degree' (skąd wieje) wyliczany jest ze składowych wiatru. Poza
+        siatką zwracane są wartości brzegowe - zasięg sprawdza covers().
+        """
+        lats, lons, epochs = np.broadcast_arrays(np.asarray(lats, dtype=np.float64),
+                                                 np.asarray(lons, dtype=np.float64),
+                                                 np.asarray(epochs, dtype=np.float64))
+        needed = [self.fields[name] for name in names if name not in DERIVED_FIELDS]
+        if 'wind_degree' in names:
+            needed += [self.fields['wind_u'], self.fields['wind_v']]
+        needed = sorted(set(needed))
+
+        r0, c0, fr, fc = self._corners(lats, lons)
+        position = np.interp(epochs, self.times, np.arange(len(self.times)))
+        t0 = np.floor(position).astype(np.intp)
+        t1 = np.minimum(t0 + 1, len(self.times) - 1)
+        ft = (position - t0).astype(np.float32)
+
+        values = {}
+        for index in needed:
+            plane = self.cube[index]
+            total = 0
+            for t, wt in ((t0, 1 - ft), (t1, ft)):
+                total = total + wt * (
+                    plane[t, r0, c0] * (1 - fr) * (1 - fc) + plane[t, r0, c0 + 1] * (1 - fr) * fc
+                    + plane[t, r0 + 1, c0] * fr * (1 - fc) + plane[t, r0 + 1, c0 + 1] * fr * fc
+                )
+            values[index] = total
+        columns = []
+        for name in names:
+            if name == 'wind_degree':
+                u, v = values[self.fields['wind_u']], values[self.fields['wind_v']]
+                columns.append((np.degrees(np.arctan2(u, v)) + 180) % 360)
+            else:
+                columns.append(values[self.fields[name]])
+        return np.stack(columns, axis=-1).astype(np.float32)
+
+    def point_hours(self, lat, lon, names=GRID_FIELDS):
+        """(epoki, wartości (godziny, names), przesunięcie UTC najbliższego węzła) dla punktu"""
+        values = self.sample(np.full(len(self.times), lat), np.full(len(self.times), lon), self.times, names)
+        return self.times, values, self.local_offset(lat, lon)
+
+    def local_offset(self, lat, lon):
+        """Przesunięcie czasu lokalnego (s) najbliższego węzła"""
+        row = int(np.abs(self.lats - lat).argmin())
+        col = int(np.abs(self.lons - lon).argmin())
+        return int(self.utc_offset[row, col])
+
+
+class ForecastGrid:
+    """Czytnik aktualnego pobrania z katalogu - przeładowuje mmap po podmianie dowiązania 'current'"""
+
+    CHECK_INTERVAL = 5  # co ile sekund sprawdzać dowiązanie
+
+    def __init__(self, directory, max_age=None, min_horizon=0):
+        self.directory = directory
+        self.max_age = max_age  # wiek danych liczony od source_time, nie od pobrania
+        self.min_horizon = min_horizon  # tyle sekund prognozy musi jeszcze zostać
+        self._snapshot = None
+        self._target = None
+        self._checked = 0
+        self._lock = threading.Lock()
+
+    def snapshot(self):
+        """Aktualne pobranie albo None (brak danych, dane starsze niż max_age lub prognoza krótsza niż min_horizon).
+
+        Wiek liczony jest od czasu danych źródła - niezmieniony plik modelu
+        pomijany przy pobraniu nie postarza siatki, dopóki pokrywa przyszłe godziny.
+        """
+        now = time.time()
+        with self._lock:
+            if now - self._checked >= self.CHECK_INTERVAL:
+                self._checked = now
+                try:
+                    target = os.readlink(os.path.join(self.directory, 'current'))
+                except OSError:
+                    target = None
+                if target != self._target:
+                    try:
+                        self._snapshot = GridSnapshot(os.path.join(self.directory, target)) if target else None
+                    except (OSError, ValueError, KeyError) as e:
+                        print(f"Błąd wczytania siatki prognoz {target}: {e}")
+                        self._snapshot = None
+                    self._target = target
+            snapshot = self._snapshot
+        if snapshot is None:
+            return None
+        grid_run_age.set(now - snapshot.source_time)
+        if self.max_age and now - snapshot.source_time > self.max_age:
+            return None
+        if snapshot.times[-1] - now < self.min_horizon:
+            return None
+        return snapshot
+
+
+class GridIngest:
+    """Zapisuje pobranie ze źródła (grid_sources) jako nowy run i atomowo podmienia 'current'"""
+
+    def __init__(self, directory, source, keep_runs=2):
+        self.directory = directory
+        self.source = source
+        self.keep_runs = keep_runs
+
+    def run(self):
+        """Jedno pobranie; zwraca statystyki, a gdy inny proces już pobiera - None"""
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, '.ingest.lock'), 'w') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return None
+            return self._ingest()
+
+    def current_source(self):
+        """Identyfikator źródła aktualnego pobrania (np. plik@mtime) albo None"""
+        try:
+            with open(os.path.join(self.directory, 'current', 'meta.json')) as f:
+                return json.load(f).get('source')
+        except (OSError, ValueError):
+            return None
+
+    def _ingest(self):
+        started = time.time()
+        identity = self.source.identity()
+        if identity is not None and identity == self.current_source():
+            return {'swapped': False, 'reason': 'unchanged', 'source': identity}
+        try:
+            grid = self.source.load()
+        except GridSourceError as e:
+            # Nieużywalne pobranie - zostaje poprzednie
+            return {'swapped': False, 'reason': str(e), 'seconds': round(time.time() - started, 1)}
+        if 'missing_nodes' in grid.info:
+            grid_missing_nodes.set(grid.info['missing_nodes'])
+
+        run = datetime.fromtimestamp(started, tz=timezone.utc).strftime('%Y%m%dT%H%M%S') + f".{int(started * 1000) % 1000:03d}Z"
+        staging = os.path.join(self.directory, f".{run}.tmp")
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+
+        cube = np.lib.format.open_memmap(os.path.join(staging, 'cube.npy'), mode='w+', dtype=np.float32,
+                                         shape=grid.values.shape)
+        cube[:] = grid.values
+        cube.flush()
+        del cube
+        np.save(os.path.join(staging, 'utc_offset.npy'), grid.utc_offset.astype(np.int32))
+        with open(os.path.join(staging, 'meta.json'), 'w') as f:
+            json.dump(dict(grid.info, **{
+                'run': run,
+                'created': started,
+                'fields': list(GRID_FIELDS),
+                'times': grid.times.tolist(),
+                'lats': grid.lats.tolist(),
+                'lons': grid.lons.tolist()
+            }), f)
+
+        os.rename(staging, os.path.join(self.directory, run))
+        self._swap(run)
+        self._prune(run)
+        return dict(grid.info, run=run, hours=len(grid.times), swapped=True, seconds=round(time.time() - started, 1))
+
+    def _swap(self, run):
+        """Atomowa podmiana dowiązania 'current' (rename nadpisuje stare)"""
+        link = os.path.join(self.directory, 'current')
+        staging = f"{link}.{os.getpid()}.tmp"
+        if os.path.lexists(staging):
+            os.remove(staging)
+        os.symlink(run, staging)
+        os.replace(staging, link)
+
+    def _prune(self, current):
+        """Usuwa najstarsze pobrania ponad keep_runs; zmapowane pliki pozostają dostępne dla czytelników"""
+        runs = sorted(name for name in os.listdir(self.directory)
+                      if not name.startswith('.') and name != 'current'
+                      and os.path.isdir(os.path.join(self.directory, name)))
+        for name in runs[:-self.keep_runs] if self.keep_runs else []:
+            if name != current:
+                shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+    def run_forever(self, interval):
+        """Pobranie co interval sekund (do wątku w tle)"""
+        while True:
+            try:
+                stats = self.run()
+                if stats is not None:
+                    print(f"🗺️ Siatka prognoz: {stats}")
+            except Exception as e:
+                print(f"❌ Błąd pobierania siatki prognoz: {e}")
+            time.sleep(interval)
+
+
+forecast_grid = ForecastGrid(config.FORECAST_GRID_DIR, max_age=config.FORECAST_GRID_MAX_AGE,
+                             min_horizon=config.FORECAST_GRID_MIN_HORIZON)
+grid_ingest = GridIngest(
+    config.FORECAST_GRID_DIR,
+    open_grid_source(
+        config.FORECAST_GRID_SOURCE,
+        parse_bbox(config.FORECAST_GRID_BBOX),
+        config.FORECAST_GRID_STEP,
+        config.FORECAST_GRID_DAYS,
+        workers=config.FORECAST_GRID_WORKERS,
+        max_missing=config.FORECAST_GRID_MAX_MISSING,
+        model_dir=config.FORECAST_GRID_MODEL_DIR,
+        utc_offset=config.FORECAST_GRID_UTC_OFFSET
+    ),
+    keep_runs=config.FORECAST_GRID_KEEP_RUNS
+)
@@ -0,0 +1,326 @@
+"""
+Źródła danych siatki prognoz - węzły z WeatherAPI albo pliki modelu (.npz, NetCDF) z lokalnego dysku
+dekodowane do wspólnych tablic (pole x godzina x lat x lon)
+
+Pliki GRIB należy wcześniej przekonwertować do NetCDF (np. cdo -f nc copy, wgrib2 -netcdf).
+"""
+
+import calendar
+import math
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import List, Optional
+
+import numpy as np
+
+from quota_governor import PREWARM
+from weather_client import weather_client
+
+try:
+    import netCDF4
+except ImportError:  # opcjonalne - potrzebne tylko dla plików .nc
+    netCDF4 = None
+
+# Pola godzinowe siatki; wiatr także jako składowe (km/h, kierunek "dokąd wieje") do interpolacji
+GRID_FIELDS = ('temp_c', 'wind_u', 'wind_v', 'wind_kph', 'gust_kph', 'precip_mm', 'chance_of_rain',
+               'pressure_mb', 'humidity', 'cloud', 'vis_km')
+GRID_FIELD = {name: i for i, name in enumerate(GRID_FIELDS)}
+
+# Zmienne plików modelu dla pól siatki: (nazwa, skala, przesunięcie) do jednostek WeatherAPI.
+# Nazwy pól siatki oznaczają dane już w tych jednostkach.
+MODEL_VARIABLES = {
+    'temp_c': [('temp_c', 1, 0), ('Temperature_height_above_ground', 1, -273.15), ('t2m', 1, -273.15)],
+    'wind_u': [('wind_u', 1, 0), ('u-component_of_wind_height_above_ground', 3.6, 0), ('u10', 3.6, 0)],
+    'wind_v': [('wind_v', 1, 0), ('v-component_of_wind_height_above_ground', 3.6, 0), ('v10', 3.6, 0)],
+    'wind_kph': [('wind_kph', 1, 0), ('Wind_speed_height_above_ground', 3.6, 0), ('si10', 3.6, 0)],
+    'gust_kph': [('gust_kph', 1, 0), ('Wind_speed_gust_surface', 3.6, 0), ('i10fg', 3.6, 0)],
+    'precip_mm': [('precip_mm', 1, 0), ('Precipitation_rate_surface', 3600, 0), ('prate', 3600, 0)],
+    'chance_of_rain': [('chance_of_rain', 1, 0)],
+    'pressure_mb': [('pressure_mb', 1, 0), ('Pressure_reduced_to_MSL_msl', 0.01, 0), ('msl', 0.01, 0)],
+    'humidity': [('humidity', 1, 0), ('Relative_humidity_height_above_ground', 1, 0), ('r2', 1, 0)],
+    'cloud': [('cloud', 1, 0), ('Total_cloud_cover_entire_atmosphere', 1, 0), ('tcc', 100, 0)],
+    'vis_km': [('vis_km', 1, 0), ('Visibility_surface', 0.001, 0), ('vis', 0.001, 0)],
+}
+# Wiatr jako jedna zmienna ze składowymi (u, v) - jak w recepcie MTS
+WIND_COMPONENTS = 'Wind_components'
+# Wysokość (m n.p.g.) wybierana z osi poziomów zmiennych NetCDF
+NOMINAL_HEIGHT = {
+    'Temperature_height_above_ground': 2,
+    'Relative_humidity_height_above_ground': 2,
+    'u-component_of_wind_height_above_ground': 10,
+    'v-component_of_wind_height_above_ground': 10,
+    'Wind_speed_height_above_ground': 10,
+    WIND_COMPONENTS: 10,
+}
+MODEL_FILE_EXTENSIONS = ('.npz', '.nc', '.nc4')
+
+Bounds = namedtuple('Bounds', ['west', 'south', 'east', 'north'])
+# Jedno pobranie siatki: values (GRID_FIELDS, godziny, lats rosnąco, lons rosnąco), utc_offset (lats, lons)
+GridRun = namedtuple('GridRun', ['times', 'lats', 'lons', 'values', 'utc_offset', 'info'])
+
+
+class GridSourceError(ValueError):
+    """Źródło nie dało używalnego pobrania - zostaje poprzednie"""
+
+
+def parse_bbox(spec):
+    """Bounds z "zach,płd,wsch,płn" """
+    values = [float(v) for v in spec.split(',')]
+    if len(values) != 4:
+        raise ValueError(f"Obszar siatki wymaga zach,płd,wsch,płn: {spec}")
+    return Bounds(*values)
+
+
+def node_axes(bounds, step):
+    """Szerokości (z południa na północ) i długości (z zachodu na wschód) węzłów siatki"""
+    lats = np.round(np.arange(math.ceil(bounds.south / step), math.floor(bounds.north / step) + 1) * step, 6)
+    lons = np.round(np.arange(math.ceil(bounds.west / step), math.floor(bounds.east / step) + 1) * step, 6)
+    return lats, lons
+
+
+def parse_hours(data):
+    """(epoki, wartości (godziny, GRID_FIELDS), przesunięcie UTC) z odpowiedzi forecast.json albo None"""
+    hours = [hour for day in (data or {}).get('forecast', {}).get('forecastday', []) for hour in day.get('hour', [])]
+    if not hours:
+        return None
+    epochs = np.array([hour['time_epoch'] for hour in hours], dtype=np.float64)
+    speed = np.array([hour.get('wind_kph', np.nan) for hour in hours], dtype=np.float32)
+    # wind_degree to kierunek, z którego wieje - wektor wskazuje, dokąd
+    toward = np.radians(np.array([hour.get('wind_degree', 0) for hour in hours], dtype=np.float32) + 180)
+    columns = {'wind_u': speed * np.sin(toward), 'wind_v': speed * np.cos(toward)}
+    values = np.stack([
+        columns[name] if name in columns else np.array([hour.get(name, np.nan) for hour in hours], dtype=np.float32)
+        for name in GRID_FIELDS
+    ], axis=1).astype(np.float32)
+    first_local = calendar.timegm(datetime.strptime(hours[0]['time'], '%Y-%m-%d %H:%M').timetuple())
+    return epochs, values, first_local - hours[0]['time_epoch']
+
+
+class WeatherAPISource:
+    """Węzły regularnej siatki z forecast.json - jedno wywołanie na węzeł, ponawiane dla odrzuconych"""
+
+    def __init__(self, bounds, step, days, workers=16, max_missing=0.05, retries=2):
+        self.bounds = bounds
+        self.step = step
+        self.days = days
+        self.workers = workers
+        self.max_missing = max_missing
+        self.retries = retries
+
+    def identity(self):
+        return None  # każde pobranie jest nowe
+
+    def fetch_node(self, lat, lon):
+        params = {'q': f"{lat},{lon}", 'days': self.days, 'aqi': 'no', 'alerts': 'no'}
+        status, data = weather_client.fetch('forecast.json', params, priority=PREWARM, deadline=None)
+        return parse_hours(data) if status == 200 else None
+
+    def load(self):
+        started = time.time()
+        lats, lons = node_axes(self.bounds, self.step)
+        nodes = [(float(lat), float(lon)) for lat in lats for lon in lons]
+        results: List[Optional[tuple]] = [None] * len(nodes)
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='grid-ingest') as executor:
+            for _ in range(1 + self.retries):
+                # Kolejne przejścia ponawiają węzły odrzucone przez limit lub z błędem
+                pending = [i for i, result in enumerate(results) if result is None]
+                if not pending:
+                    break
+                for i, result in zip(pending, executor.map(lambda i: self.fetch_node(*nodes[i]), pending)):
+                    results[i] = result
+
+        missing = sum(1 for result in results if result is None)
+        if missing > self.max_missing * len(nodes):
+            raise GridSourceError(f"Brak danych dla {missing}/{len(nodes)} węzłów")
+
+        times = np.unique(np.concatenate([epochs for epochs, _, _ in filter(None, results)]))
+        values = np.full((len(GRID_FIELDS), len(times), len(lats), len(lons)), np.nan, dtype=np.float32)
+        offsets = np.zeros((len(lats), len(lons)), dtype=np.int32)
+        for i, result in enumerate(results):
+            if result is not None:
+                epochs, node_values, utc_offset = result
+                row, col = divmod(i, len(lons))
+                values[:, np.searchsorted(times, epochs), row, col] = node_values.T
+                offsets[row, col] = utc_offset
+        info = {'source': 'weatherapi', 'source_time': started, 'nodes': len(nodes), 'missing_nodes': missing}
+        return GridRun(times, lats, lons, values, offsets, info)
+
+
+class ModelFileSource:
+    """Najnowszy plik modelu (.npz, .nc) z katalogu - jedno czytanie pliku zamiast wywołań na węzeł.
+
+    Plik .npz zawiera tablice 'times' (epoki UTC), 'lats', 'lons' i zmienne
+    (czas, lat, lon) nazwane jak pola siatki albo zmienne modelu z
+    MODEL_VARIABLES. Plik jest brany po SETTLE_SECONDS od ostatniej
+    modyfikacji, żeby nie czytać niedokończonej kopii.
+    """
+
+    SETTLE_SECONDS = 10
+
+    def __init__(self, directory, bounds=None, utc_offset=None):
+        self.directory = directory
+        self.bounds = bounds  # przycięcie do obszaru (z marginesem jednego węzła)
+        self.utc_offset = utc_offset  # sekundy; None = strefa serwera w chwili pobrania
+
+    def latest(self):
+        """Ścieżka najnowszego gotowego pliku modelu albo None"""
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return None
+        now = time.time()
+        files = [os.path.join(self.directory, name) for name in names if name.endswith(MODEL_FILE_EXTENSIONS)]
+        files = [path for path in files if now - os.path.getmtime(path) >= self.SETTLE_SECONDS]
+        return max(files, key=os.path.getmtime) if files else None
+
+    def identity(self):
+        path = self.latest()
+        return None if path is None else f"{os.path.basename(path)}@{int(os.path.getmtime(path))}"
+
+    def load(self):
+        path = self.latest()
+        if path is None:
+            raise GridSourceError(f"Brak plików modelu w {self.directory}")
+        identity = self.identity()
+        reader = read_npz if path.endswith('.npz') else read_netcdf
+        variables, lats, lons = reader(path)
+        times, lats, lons, values = decode_model(variables, lats, lons, self.bounds)
+
+        utc_offset = time.localtime().tm_gmtoff if self.utc_offset is None else self.utc_offset
+        offsets = np.full((len(lats), len(lons)), int(utc_offset), dtype=np.int32)
+        info = {'source': identity, 'source_time': os.path.getmtime(path), 'file': os.path.basename(path)}
+        return GridRun(times, lats, lons, values, offsets, info)
+
+
+def read_npz(path):
+    """({zmienna: (epoki, tablica)}, lats, lons) z pliku .npz"""
+    with np.load(path) as data:
+        for key in ('times', 'lats', 'lons'):
+            if key not in data:
+                raise GridSourceError(f"Plik {os.path.basename(path)} nie zawiera tablicy '{key}'")
+        times = data['times'].astype(np.float64)
+        variables = {name: (times, data[name]) for name in data.files if name not in ('times', 'lats', 'lons')}
+        return variables, data['lats'].astype(np.float64), data['lons'].astype(np.float64)
+
+
+def read_netcdf(path):
+    """({zmienna: (epoki, tablica)}, lats, lons) ze znanych zmiennych pliku NetCDF.
+
+    Każda zmienna może mieć własną oś czasu (time, time1, ...); z osi
+    poziomów wybierana jest wysokość NOMINAL_HEIGHT.
+    """
+    if netCDF4 is None:
+        raise GridSourceError("Odczyt plików NetCDF wymaga pakietu netCDF4 (pip install netCDF4)")
+    wanted = {name for candidates in MODEL_VARIABLES.values() for name, _, _ in candidates} | {WIND_COMPONENTS}
+    with netCDF4.Dataset(path) as dataset:
+        lat_name = next((name for name in ('lat', 'latitude') if name in dataset.variables), None)
+        lon_name = next((name for name in ('lon', 'longitude') if name in dataset.variables), None)
+        if lat_name is None or lon_name is None:
+            raise GridSourceError(f"Plik {os.path.basename(path)} nie ma osi lat/lon")
+        lats = np.asarray(dataset.variables[lat_name][:], dtype=np.float64)
+        lons = np.asarray(dataset.variables[lon_name][:], dtype=np.float64)
+
+        variables = {}
+        for name in wanted & set(dataset.variables):
+            variable = dataset.variables[name]
+            time_dim = next((dim for dim in variable.dimensions if dim.startswith('time')), None)
+            if time_dim is None:
+                continue
+            index = []
+            for dim in variable.dimensions:
+                if dim in (time_dim, lat_name, lon_name):
+                    index.append(slice(None))
+                elif dim in dataset.variables and dim not in (lat_name, lon_name):
+                    levels = np.asarray(dataset.variables[dim][:], dtype=np.float64)
+                    index.append(int(np.abs(levels - NOMINAL_HEIGHT.get(name, levels[0])).argmin()))
+                elif name == WIND_COMPONENTS and len(dataset.dimensions[dim]) == 2:
+                    index.append(slice(None))  # oś składowych (u, v)
+                else:
+                    index.append(0)
+            values = np.ma.filled(variable[tuple(index)].astype(np.float32), np.nan)
+            variables[name] = (_epochs(dataset.variables[time_dim]), values)
+    return variables, lats, lons
+
+
+def _epochs(variable):
+    dates = netCDF4.num2date(variable[:], variable.units, getattr(variable, 'calendar', 'standard'),
+                             only_use_cftime_datetimes=False, only_use_python_datetimes=True)
+    return np.array([calendar.timegm(date.timetuple()) for date in np.atleast_1d(np.array(dates, dtype=object))], dtype=np.float64)
+
+
+def decode_model(variables, lats, lons, bounds=None):
+    """Zmienne modelu -> (epoki, lats rosnąco, lons rosnąco w [-180, 180), values (GRID_FIELDS, godziny, lat, lon))"""
+    if WIND_COMPONENTS in variables:
+        times, components = variables[WIND_COMPONENTS]
+        axis = next(i for i in range(1, components.ndim) if components.shape[i] == 2)
+        u, v = np.moveaxis(components, axis, 0)
+        variables = dict(variables)
+        variables.setdefault('u-component_of_wind_height_above_ground', (times, u))
+        variables.setdefault('v-component_of_wind_height_above_ground', (times, v))
+
+    fields = {}
+    for field, candidates in MODEL_VARIABLES.items():
+        for name, scale, offset in candidates:
+            if name in variables:
+                times, data = variables[name]
+                fields[field] = (times, np.asarray(data, dtype=np.float32).reshape(len(times), len(lats), len(lons))
+                                 * np.float32(scale) + np.float32(offset))
+                break
+    if not fields:
+        raise GridSourceError("Plik nie zawiera żadnej znanej zmiennej modelu")
+    if 'wind_kph' not in fields and 'wind_u' in fields and 'wind_v' in fields:
+        fields['wind_kph'] = (fields['wind_u'][0], np.hypot(fields['wind_u'][1], fields['wind_v'][1]))
+
+    # Wspólna oś czasu: temperatury (albo pierwszego pola); pozostałe interpolowane liniowo
+    times = fields['temp_c'][0] if 'temp_c' in fields else next(iter(fields.values()))[0]
+    lat_order = np.argsort(lats)
+    lons = (lons + 180) % 360 - 180
+    lon_order = np.argsort(lons)
+    lats, lons = lats[lat_order], lons[lon_order]
+    rows, cols = slice(None), slice(None)
+    if bounds is not None:
+        rows, cols = _crop(lats, bounds.south, bounds.north), _crop(lons, bounds.west, bounds.east)
+
+    values = np.full((len(GRID_FIELDS), len(times), len(lats[rows]), len(lons[cols])), np.nan, dtype=np.float32)
+    for field, (field_times, data) in fields.items():
+        data = data[:, lat_order][:, :, lon_order][:, rows, cols]
+        values[GRID_FIELD[field]] = _resample_time(data, field_times, times)
+    return times, lats[rows], lons[cols], values
+
+
+def _crop(axis, low, high):
+    """Wycinek rosnącej osi obejmujący [low, high] z jednym węzłem zapasu.
+
+    Plik, który nie pokrywa obszaru (albo tylko jednym węzłem), zgłasza
+    GridSourceError - inaczej podmieniłby poprawną siatkę przebiegiem 1 x 1.
+    """
+    if axis[0] >= high or axis[-1] <= low:
+        raise GridSourceError(f"Plik modelu ({axis[0]:g}..{axis[-1]:g}) nie pokrywa obszaru siatki ({low:g}..{high:g})")
+    start = max(0, int(np.searchsorted(axis, low, side='right')) - 1)
+    stop = min(len(axis), int(np.searchsorted(axis, high, side='left')) + 1)
+    if stop - start < 2:
+        raise GridSourceError(f"Wycinek pliku modelu dla obszaru ({low:g}..{high:g}) ma mniej niż 2 węzły")
+    return slice(start, stop)
+
+
+def _resample_time(data, source_times, target_times):
+    """Liniowa interpolacja tablicy (czas, ...) na inną oś czasu"""
+    if len(source_times) == len(target_times) and np.array_equal(source_times, target_times):
+        return data
+    position = np.interp(target_times, source_times, np.arange(len(source_times)))
+    i0 = np.floor(position).astype(np.intp)
+    i1 = np.minimum(i0 + 1, len(source_times) - 1)
+    frac = (position - i0).astype(np.float32)[:, None, None]
+    return data[i0] * (1 - frac) + data[i1] * frac
+
+
+def open_grid_source(kind, bounds, step, days, workers=16, max_missing=0.05, model_dir='model_data', utc_offset=None):
+    """Źródło siatki z konfiguracji: 'weatherapi' albo 'files'"""
+    if kind == 'weatherapi':
+        return WeatherAPISource(bounds, step, days, workers=workers, max_missing=max_missing)
+    if kind == 'files':
+        return ModelFileSource(model_dir, bounds, utc_offset)
+    raise ValueError(f"Nieznane źródło siatki prognoz: {kind}")
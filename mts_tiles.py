@@ -0,0 +1,121 @@
+"""
+Kafelki raster-array (MTS) z siatki prognoz - pasmo na każdą godzinę prognozy, kwantyzacja
+skala/przesunięcie zgodna z tilejson, wiatr jako spakowane składowe U/V; bez zapytań do WeatherAPI
+"""
+
+import time
+
+import numpy as np
+
+import config
+from forecast_grid import forecast_grid
+from raster_codec import compress, quantize
+from weather_client import TTLCache
+
+TILE_SIZE = 256
+
+# Warstwa MTS -> pola siatki, kwantyzacja (wartość = q * scale + offset) i typ pikseli
+MTS_LAYERS = {
+    'temperature': {'fields': ('temp_c',), 'scale': 0.1, 'offset': -100.0, 'dtype': np.uint16, 'units': 'K'},
+    'wind': {'fields': ('wind_u', 'wind_v'), 'scale': 0.5, 'offset': -63.5, 'dtype': np.uint8, 'units': 'm/s'},
+}
+
+# Zakodowane kafelki (klucz zawiera run siatki i godzinę odniesienia pasm)
+mts_cache = TTLCache(maxsize=1024)
+
+
+def band_hours():
+    """Przesunięcia pasm w godzinach od bieżącej pełnej godziny (MTS_BAND_HOURS)"""
+    return [int(h) for h in config.MTS_BAND_HOURS.split(',')]
+
+
+def tile_axes(z, x, y):
+    """Szerokości i długości środków pikseli kafelka (Web Mercator)"""
+    n = 2.0 ** z
+    offsets = (np.arange(TILE_SIZE) + 0.5) / TILE_SIZE
+    lons = (x + offsets) / n * 360.0 - 180.0
+    lats = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * (y + offsets) / n))))
+    return lats, lons
+
+
+def to_units(layer, values):
+    """Jednostki siatki (°C, km/h) -> jednostki warstwy MTS (K, m/s)"""
+    if layer == 'temperature':
+        return values + 273.15
+    return values / 3.6
+
+
+def build_mts_tile(layer, z, x, y):
+    """(skompresowane pasma, metadane) albo None, gdy kafelek leży poza siatką prognoz.
+
+    Temperatura: uint16 (pasma, wiersze, kolumny); wiatr: uint8 (pasma, wiersze,
+    kolumny, U/V). Piksele poza siatką lub poza horyzontem prognozy mają wartość nodata.
+    """
+    spec = MTS_LAYERS[layer]
+    grid = forecast_grid.snapshot()
+    if grid is None:
+        return None
+    lats, lons = tile_axes(z, x, y)
+    rows = (lats >= grid.lats[0]) & (lats <= grid.lats[-1])
+    cols = (lons >= grid.lons[0]) & (lons <= grid.lons[-1])
+    if not (rows.any() and cols.any()):
+        return None
+
+    reference = int(time.time() // 3600 * 3600)
+    key = (layer, z, x, y, grid.run, reference)
+    cached = mts_cache.get(key)
+    if cached is not None:
+        return cached
+
+    hours = band_hours()
+    epochs = reference + np.array(hours, dtype=np.float64) * 3600
+    values = to_units(layer, grid.sample(lats[None, :, None], lons[None, None, :], epochs[:, None, None], spec['fields']))
+    in_time = (epochs >= grid.times[0]) & (epochs <= grid.times[-1])
+    inside = in_time[:, None, None] & rows[None, :, None] & cols[None, None, :]
+    values[~inside] = np.nan
+    if len(spec['fields']) == 1:
+        values = values[..., 0]
+
+    q, nodata = quantize(values, spec['scale'], spec['offset'], spec['dtype'])
+    meta = {
+        'bands': [str(h) for h in hours],
+        'reference_time': reference,
+        'shape': list(q.shape),
+        'dtype': np.dtype(spec['dtype']).newbyteorder('<').str,
+        'scale': spec['scale'],
+        'offset': spec['offset'],
+        'nodata': nodata,
+        'units': spec['units'],
+        'run': grid.run
+    }
+    tile = (compress(q.astype(meta['dtype'])), meta)
+    mts_cache.set(key, tile, seconds_to_next_hour())
+    return tile
+
+
+def grid_bounds():
+    """[zach, płd, wsch, płn] aktualnej siatki prognoz (dla tilejson) albo None"""
+    grid = forecast_grid.snapshot()
+    if grid is None:
+        return None
+    return [float(grid.lons[0]), float(grid.lats[0]), float(grid.lons[-1]), float(grid.lats[-1])]
+
+
+def seconds_to_next_hour():
+    return 3600 - int(time.time()) % 3600
+
+
+def band_fields(layer):
+    """Pola 'fields' warstwy w tilejson zgodne z kodowaniem kafelków"""
+    spec = MTS_LAYERS[layer]
+    nodata = np.iinfo(spec['dtype']).max
+    return {
+        'bands': [str(h) for h in band_hours()],
+        'offset': spec['offset'],
+        'scale': spec['scale'],
+        'data_type': np.dtype(spec['dtype']).name,
+        'nodata': int(nodata),
+        'tilesize': TILE_SIZE,
+        'buffer': 0,  # kafelki liczone są dokładnie na swój zasięg, bez pikseli sąsiadów
+        'units': spec['units']
+    }
@@ -0,0 +1,142 @@
+"""
+Limit wywołań WeatherAPI - budżety miesięczny, dzienny i na sekundę z klasami priorytetu
+Zapytania interaktywne mają pierwszeństwo przed próbkami kafelków, a te przed prewarmingiem
+"""
+
+import threading
+import time
+from datetime import datetime, timezone
+
+from prometheus_client import Counter, Gauge
+
+# Klasy priorytetu (mniejsza liczba = ważniejsze)
+INTERACTIVE = 0
+TILE = 1
+PREWARM = 2
+PRIORITY_NAMES = {INTERACTIVE: 'interactive', TILE: 'tile', PREWARM: 'prewarm'}
+
+# Metryki Prometheus
+quota_remaining = Gauge('weatherapi_quota_remaining', 'WeatherAPI calls left in the budget window', ['window'])
+quota_denied = Counter('weatherapi_quota_denied_total', 'WeatherAPI calls refused by the quota governor', ['priority'])
+
+
+class TokenBucket:
+    """Kubełek tokenów uzupełniany ze stałą szybkością (limit na sekundę z burstem)"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, reserve=0.0, max_wait=0.0):
+        """Pobiera token, zostawiając reserve * capacity; czeka do max_wait s na uzupełnienie"""
+        floor = reserve * self.capacity
+        deadline = time.monotonic() + max_wait
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens - 1 >= floor:
+                    self.tokens -= 1
+                    return True
+                wait = (floor + 1 - self.tokens) / self.rate
+            if time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    def remaining(self):
+        with self._lock:
+            self._refill()
+            return self.tokens
+
+
+class PeriodBudget:
+    """Limit wywołań na dobę/miesiąc kalendarzowy (UTC), współdzielony przez Redis, gdy jest dostępny"""
+
+    FORMATS = {'day': '%Y-%m-%d', 'month': '%Y-%m'}
+    KEY_TTL = {'day': 2 * 86400, 'month': 32 * 86400}
+
+    def __init__(self, limit, period, shared=None):
+        self.limit = limit
+        self.period = period
+        self.shared = shared  # opcjonalny RedisTier z licznikami wszystkich workerów
+        self.used = 0
+        self._window = None
+        self._lock = threading.Lock()
+
+    def _current_window(self):
+        window = datetime.now(timezone.utc).strftime(self.FORMATS[self.period])
+        if window != self._window:
+            self._window = window
+            self.used = 0
+        return window
+
+    def allows(self, reserve=0.0):
+        """Czy jest miejsce na wywołanie ponad rezerwę dla ważniejszych klas"""
+        with self._lock:
+            self._current_window()
+            return self.used + 1 <= self.limit * (1 - reserve)
+
+    def consume(self):
+        with self._lock:
+            window = self._current_window()
+            self.used += 1
+        if self.shared is not None:
+            # Licznik z Redis obejmuje wywołania wszystkich workerów
+            total = self.shared.incr(f"{self.period}:{window}", ttl=self.KEY_TTL[self.period])
+            if total is not None:
+                with self._lock:
+                    if self._window == window:
+                        self.used = max(self.used, total)
+
+    def remaining(self):
+        with self._lock:
+            self._current_window()
+            return max(0, self.limit - self.used)
+
+
+class QuotaGovernor:
+    """Wspólny limit dla wszystkich wywołań WeatherAPI z rezerwą budżetu dla ważniejszych klas"""
+
+    def __init__(self, monthly, daily, per_second, burst=None, reserves=None, max_wait=1.0, shared=None):
+        self.month = PeriodBudget(monthly, 'month', shared)
+        self.day = PeriodBudget(daily or monthly // 30, 'day', shared)
+        self.second = TokenBucket(per_second, burst or per_second)
+        # Ułamek każdego budżetu niedostępny dla danej klasy
+        self.reserves = reserves or {INTERACTIVE: 0.0, TILE: 0.1, PREWARM: 0.3}
+        self.max_wait = max_wait
+
+    def available(self, priority=INTERACTIVE):
+        """Czy dzienny i miesięczny budżet pozwalają jeszcze na wywołania tej klasy (bez zużycia)"""
+        reserve = self.reserves.get(priority, 0.0)
+        return self.month.allows(reserve) and self.day.allows(reserve)
+
+    def acquire(self, priority=INTERACTIVE, max_wait=None):
+        """Rezerwuje jedno wywołanie; False oznacza, że trzeba użyć danych z cache"""
+        reserve = self.reserves.get(priority, 0.0)
+        max_wait = self.max_wait if max_wait is None else max_wait
+        allowed = self.available(priority) and self.second.take(reserve, max_wait)
+        if allowed:
+            self.month.consume()
+            self.day.consume()
+        else:
+            quota_denied.labels(priority=PRIORITY_NAMES.get(priority, str(priority))).inc()
+        self._export()
+        return allowed
+
+    def remaining(self):
+        return {
+            'month': self.month.remaining(),
+            'day': self.day.remaining(),
+            'second': round(self.second.remaining(), 1)
+        }
+
+    def _export(self):
+        for window, value in self.remaining().items():
+            quota_remaining.labels(window=window).set(value)
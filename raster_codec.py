@@ -0,0 +1,46 @@
+"""
+Kodowanie rastrów pogodowych dla klientów - kwantyzacja (skala/przesunięcie), delta między klatkami i kompresja
+"""
+
+import zlib
+
+import numpy as np
+
+
+def quantize(values, scale, offset, dtype=np.uint8):
+    """q = round((v - offset) / scale) w [0, max - 1]; NaN -> max (nodata). Zwraca (q, nodata)"""
+    nodata = np.iinfo(dtype).max
+    q = np.clip(np.rint((values - offset) / scale), 0, nodata - 1)
+    return np.where(np.isnan(values), nodata, q).astype(dtype), int(nodata)
+
+
+def dequantize(q, scale, offset, nodata):
+    """Odwrotność quantize (nodata -> NaN)"""
+    values = q.astype(np.float32) * scale + offset
+    values[q == nodata] = np.nan
+    return values
+
+
+def stretch(values):
+    """Liniowe rozciągnięcie do uint8 0..255 w zakresie danych; zwraca (q, min, max), NaN -> 0"""
+    finite = values[np.isfinite(values)]
+    if not finite.size:
+        return np.zeros(values.shape, dtype=np.uint8), 0.0, 0.0
+    low, high = float(finite.min()), float(finite.max())
+    q = np.rint((np.nan_to_num(values, nan=low) - low) / ((high - low) or 1.0) * 255)
+    return q.astype(np.uint8), low, high
+
+
+def delta_encode(frames):
+    """Różnice kolejnych klatek (oś 0) modulo zakres typu; pierwsza klatka bez zmian - bezstratne"""
+    deltas = frames.copy()
+    deltas[1:] = frames[1:] - frames[:-1]  # arytmetyka liczb bez znaku zawija modulo 2**bity
+    return deltas
+
+
+def delta_decode(deltas):
+    return np.cumsum(deltas, axis=0, dtype=deltas.dtype)
+
+
+def compress(array, level=6):
+    return zlib.compress(np.ascontiguousarray(array).tobytes(), level)
@@ -0,0 +1,101 @@
+"""
+Współdzielony cache L2 w Redis dla wszystkich workerów
+Gdy Redis jest niedostępny, tier wyłącza się na chwilę i zostaje tylko cache L1 w procesie
+"""
+
+import logging
+import time
+
+import redis
+
+import config
+
+logger = logging.getLogger(__name__)
+
+
+def connect_redis():
+    """Połączenie Redis na dane binarne albo None, gdy Redis jest wyłączony/niedostępny"""
+    if not config.REDIS_HOST or config.REDIS_HOST == 'localhost':
+        return None
+    try:
+        client = redis.Redis(
+            host=config.REDIS_HOST,
+            port=config.REDIS_PORT,
+            db=config.REDIS_DB,
+            socket_connect_timeout=config.REDIS_CACHE_TIMEOUT,
+            socket_timeout=config.REDIS_CACHE_TIMEOUT
+        )
+        client.ping()
+        return client
+    except Exception as e:
+        logger.info(f"Redis cache niedostępny - tylko cache L1: {e}")
+        return None
+
+
+class RedisTier:
+    """Cache L2 z prefiksem kluczy; błędy Redis nie przerywają requestu"""
+
+    def __init__(self, client, prefix, retry_after=30):
+        self.client = client
+        self.prefix = prefix
+        self.retry_after = retry_after
+        self._down_until = 0
+
+    @property
+    def available(self):
+        return self.client is not None and time.monotonic() >= self._down_until
+
+    def _failed(self, e):
+        if time.monotonic() >= self._down_until:
+            logger.warning(f"Redis cache niedostępny, tylko L1 przez {self.retry_after}s: {e}")
+        self._down_until = time.monotonic() + self.retry_after
+
+    def get(self, key):
+        """(wartość, pozostały TTL w sekundach) albo (None, 0)"""
+        return self.mget([key])[0]
+
+    def mget(self, keys):
+        """Pobiera wiele kluczy jednym pipeline; lista (wartość, TTL) w kolejności kluczy"""
+        if not keys or not self.available:
+            return [(None, 0)] * len(keys)
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for key in keys:
+                pipe.get(self.prefix + key)
+                pipe.pttl(self.prefix + key)
+            replies = pipe.execute()
+        except Exception as e:
+            self._failed(e)
+            return [(None, 0)] * len(keys)
+        results = []
+        for value, pttl in zip(replies[::2], replies[1::2]):
+            if value is None or pttl is None or pttl <= 0:
+                results.append((None, 0))
+            else:
+                results.append((value, pttl / 1000.0))
+        return results
+
+    def set(self, key, value, ttl):
+        if not self.available or ttl <= 0:
+            return
+        try:
+            self.client.set(self.prefix + key, value, px=int(ttl * 1000))
+        except Exception as e:
+            self._failed(e)
+
+    def incr(self, key, amount=1, ttl=None):
+        """Atomowy licznik współdzielony przez workery; None, gdy Redis jest niedostępny"""
+        if not self.available:
+            return None
+        try:
+            pipe = self.client.pipeline(transaction=True)
+            pipe.incrby(self.prefix + key, amount)
+            if ttl:
+                pipe.expire(self.prefix + key, int(ttl))
+            return pipe.execute()[0]
+        except Exception as e:
+            self._failed(e)
+            return None
+
+
+redis_cache_client = connect_redis()
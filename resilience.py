@@ -0,0 +1,90 @@
+"""
+Odporność wywołań WeatherAPI - pomiar opóźnień (próg hedgingu) i circuit breaker
+"""
+
+import threading
+import time
+from collections import deque
+
+from prometheus_client import Gauge
+
+# Metryki Prometheus
+circuit_open = Gauge('weatherapi_circuit_open', 'WeatherAPI circuit breaker state (1 = open, calls fail fast to cache)')
+
+
+class LatencyTracker:
+    """Ostatnie czasy odpowiedzi upstream - kwantyl wyznacza moment wysłania zapytania zapasowego"""
+
+    def __init__(self, size=500, min_samples=20):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def quantile(self, q):
+        """Kwantyl q z ostatnich pomiarów albo None, gdy jest ich za mało"""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class CircuitBreaker:
+    """Otwiera się, gdy odsetek błędów w oknie czasu przekroczy próg; po cooldown przepuszcza jedną próbę"""
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, error_rate=0.5, min_calls=20, window: float = 30, cooldown: float = 15):
+        self.error_rate = error_rate
+        self.min_calls = min_calls
+        self.window = window
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self._opened_at = 0
+        self._outcomes = deque()  # (czas, czy_błąd)
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Czy wykonać wywołanie; False = od razu użyć cache"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.cooldown:
+                self.state = self.HALF_OPEN  # dokładnie jedno zapytanie próbne
+                return True
+            return False
+
+    def record(self, failed):
+        """Wynik wywołania przepuszczonego przez allow()"""
+        with self._lock:
+            now = time.monotonic()
+            if self.state == self.HALF_OPEN:
+                if failed:
+                    self._open(now)
+                else:
+                    self.state = self.CLOSED
+                    self._outcomes.clear()
+                    circuit_open.set(0)
+                return
+
+            self._outcomes.append((now, failed))
+            while self._outcomes and self._outcomes[0][0] < now - self.window:
+                self._outcomes.popleft()
+            failures = sum(1 for _, f in self._outcomes if f)
+            if len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.error_rate:
+                self._open(now)
+
+    def cancel(self):
+        """Zwraca niewykorzystane pozwolenie z allow() (np. wywołanie zablokował limit)"""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.state = self.OPEN  # następne allow() znów wyśle próbę
+
+    def _open(self, now):
+        self.state = self.OPEN
+        self._opened_at = now
+        circuit_open.set(1)
@@ -0,0 +1,546 @@
+"""
+Silnik analizy tras lotu - próbkowanie ortodromy, równoległe prognozy godzinowe z cache
+i wektorowa (NumPy) ocena warunków w punktach trasy
+"""
+
+import math
+import time
+import warnings
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+import config
+from forecast_cells import FIELD, ForecastError, cell_of, load_cube
+from weather_client import request_deadline, weather_client
+
+EARTH_RADIUS_KM = 6371.0
+
+# Minimalna prędkość względem ziemi (ułamek prędkości własnej) - ptak nie stoi w miejscu przy silnym wietrze przeciwnym
+MIN_GROUND_SPEED_FRACTION = 0.2
+
+# Równoległe planowanie tras gołębników (geokodowanie)
+route_executor = ThreadPoolExecutor(max_workers=config.ROUTE_FETCH_WORKERS, thread_name_prefix='route-plan')
+
+Route = namedtuple('Route', ['start', 'end', 'lats', 'lons', 'along_km', 'distance_km', 'bearing', 'cells'])
+FlightEstimate = namedtuple('FlightEstimate', ['arrival', 'passage'])
+
+
+class RouteError(ValueError):
+    """Nieprawidłowe dane trasy - zwracane klientowi jako 400"""
+
+
+def parse_location(value):
+    """(lat, lon) z {'lat', 'lon'/'lng'}, [lat, lon] lub 'lat,lon'; None, gdy to nazwa miejscowości.
+
+    Słownik bez lat albo lon/lng (lub z nieliczbowymi wartościami) zgłasza RouteError.
+    """
+    if isinstance(value, dict):
+        lat, lon = value.get('lat'), value.get('lon', value.get('lng'))
+        if lat is None or lon is None:
+            raise RouteError(f"Nieprawidłowe współrzędne: {value}")
+        try:
+            return float(lat), float(lon)
+        except (TypeError, ValueError):
+            raise RouteError(f"Nieprawidłowe współrzędne: {value}")
+    try:
+        if isinstance(value, (list, tuple)) and len(value) == 2:
+            return float(value[0]), float(value[1])
+        parts = str(value).split(',')
+        if len(parts) == 2:
+            return float(parts[0]), float(parts[1])
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+def resolve_location(value, deadline=None):
+    """(lat, lon, nazwa) - współrzędne wprost albo geokodowanie nazwy przez search.json (cache 24 h)"""
+    coords = parse_location(value)
+    if coords is not None:
+        lat, lon = coords
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            raise RouteError(f"Nieprawidłowe współrzędne: {value}")
+        return lat, lon, f"{lat:.4f},{lon:.4f}"
+    if not value or not str(value).strip():
+        raise RouteError("Brak lokalizacji")
+
+    status, results = weather_client.fetch('search.json', {'q': str(value)}, deadline=deadline)
+    place = results[0] if status == 200 and isinstance(results, list) and results else None
+    if not isinstance(place, dict) or place.get('lat') is None or place.get('lon') is None:
+        raise RouteError(f"Nie znaleziono lokalizacji: {value}")
+    return float(place['lat']), float(place['lon']), place.get('name', str(value))
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Odległość po ortodromie (km); działa na skalarach i tablicach"""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def initial_bearing(lat1, lon1, lat2, lon2):
+    """Kurs początkowy (stopnie od północy) z punktu 1 do punktu 2; działa na tablicach"""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    y = np.sin(lon2 - lon1) * np.cos(lat2)
+    x = np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(lon2 - lon1)
+    return np.degrees(np.arctan2(y, x)) % 360
+
+
+def great_circle_points(lat1, lon1, lat2, lon2, n):
+    """n punktów równomiernie rozłożonych na ortodromie (z końcami) - interpolacja sferyczna"""
+    return great_circle_at(lat1, lon1, lat2, lon2, np.linspace(0, 1, n))
+
+
+def great_circle_at(lat1, lon1, lat2, lon2, fractions):
+    """Punkty ortodromy w podanych ułamkach drogi (0 = punkt 1, 1 = punkt 2)"""
+    p1 = _unit_vector(lat1, lon1)
+    p2 = _unit_vector(lat2, lon2)
+    omega = math.acos(max(-1.0, min(1.0, float(np.dot(p1, p2)))))
+    f = np.asarray(fractions, dtype=np.float64)[:, None]
+    if omega < 1e-9:
+        points = np.repeat(p1[None, :], len(f), axis=0)
+    else:
+        points = (np.sin((1 - f) * omega) * p1 + np.sin(f * omega) * p2) / math.sin(omega)
+    lats = np.degrees(np.arcsin(np.clip(points[:, 2], -1, 1)))
+    lons = np.degrees(np.arctan2(points[:, 1], points[:, 0]))
+    return lats, lons
+
+
+def _unit_vector(lat, lon):
+    lat, lon = math.radians(lat), math.radians(lon)
+    return np.array([math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat)])
+
+
+def sample_count(distance_km, points=None, spacing_km=None):
+    """Liczba punktów próbkowania - stała (ROUTE_ANALYSIS_POINTS) albo z docelowego odstępu"""
+    spacing_km = spacing_km or config.ROUTE_SAMPLE_SPACING_KM
+    if spacing_km:
+        n = math.ceil(distance_km / spacing_km) + 1
+    else:
+        n = points or config.ROUTE_ANALYSIS_POINTS
+    return int(min(max(n, 2), config.ROUTE_MAX_POINTS))
+
+
+def plan_route(start, end, points=None, spacing_km=None, deadline=None):
+    """Trasa z punktami próbkowania na ortodromie; sprawdza MIN/MAX_FLIGHT_DISTANCE"""
+    return build_route(resolve_location(start, deadline), resolve_location(end, deadline), points, spacing_km)
+
+
+def build_route(origin, destination, points=None, spacing_km=None, aligned=False):
+    """Trasa między rozwiązanymi lokalizacjami (lat, lon, nazwa).
+
+    aligned=True stawia punkty co dokładnie spacing_km od startu (plus koniec
+    trasy), więc trasy z jednego miejsca wypuszczenia trafiają na wspólnym
+    odcinku korytarza w te same komórki prognozy.
+    """
+    lat1, lon1, start_name = origin
+    lat2, lon2, end_name = destination
+
+    distance = float(haversine_km(lat1, lon1, lat2, lon2))
+    if distance < config.MIN_FLIGHT_DISTANCE:
+        raise RouteError(f"Dystans {distance:.1f} km poniżej minimum {config.MIN_FLIGHT_DISTANCE} km")
+    if distance > config.MAX_FLIGHT_DISTANCE:
+        raise RouteError(f"Dystans {distance:.1f} km powyżej maksimum {config.MAX_FLIGHT_DISTANCE} km")
+
+    n = sample_count(distance, points, spacing_km)
+    if aligned and spacing_km and math.ceil(distance / spacing_km) + 1 <= config.ROUTE_MAX_POINTS:
+        along_km = np.append(np.arange(0, distance, spacing_km), distance)
+    else:
+        along_km = np.linspace(0, distance, n)
+    lats, lons = great_circle_at(lat1, lon1, lat2, lon2, along_km / distance)
+    return Route(
+        start=start_name,
+        end=end_name,
+        lats=lats,
+        lons=lons,
+        along_km=along_km,
+        distance_km=distance,
+        bearing=float(initial_bearing(lat1, lon1, lat2, lon2)),
+        cells=[cell_of(lat, lon) for lat, lon in zip(lats, lons)]
+    )
+
+
+def wind_speed(values):
+    return np.hypot(values[..., FIELD['wind_u']], values[..., FIELD['wind_v']])
+
+
+def wind_components(values, bearings):
+    """(wzdłuż kursu, w poprzek kursu) w km/h; dodatnia składowa wzdłuż = wiatr w plecy"""
+    b = np.radians(bearings)
+    u, v = values[..., FIELD['wind_u']], values[..., FIELD['wind_v']]
+    return u * np.sin(b) + v * np.cos(b), u * np.cos(b) - v * np.sin(b)
+
+
+def track_bearings(route):
+    """Kurs odcinka zaczynającego się w każdym punkcie trasy (ostatni punkt - kurs dolotu)"""
+    bearings = initial_bearing(route.lats[:-1], route.lons[:-1], route.lats[1:], route.lons[1:])
+    return np.append(bearings, bearings[-1])
+
+
+def simulate_flights(cube, routes, release_epochs, airspeed_kph=None, step_minutes=None, max_hours=None):
+    """Całkowanie lotów krokami czasu - wszystkie trasy (lub czasy wypuszczenia) naraz.
+
+    W każdym kroku ptak bierze wiatr z prognozy godzinowej w komórce, nad
+    którą jest, i w bieżącej chwili; leci z prędkością własną, kompensując
+    wiatr boczny, a składowa wzdłuż kursu przyspiesza go lub spowalnia.
+    Zwraca FlightEstimate: arrival (loty,) i passage (loty, punkty) - epoki
+    UTC przelotu nad punktami trasy; NaN, gdy lot nie kończy się w max_hours.
+    """
+    airspeed = airspeed_kph or config.PIGEON_AIRSPEED_KPH
+    dt = (step_minutes or config.FLIGHT_STEP_MINUTES) * 60.0
+    steps = int(math.ceil((max_hours or config.FLIGHT_MAX_HOURS) * 3600 / dt))
+
+    # Trasy różnej długości wyrównane do wspólnej szerokości (dopełnienie ostatnim punktem)
+    count, width = len(routes), max(len(route.cells) for route in routes)
+    along = np.full((count, width), np.inf)
+    cells = np.zeros((count, width), dtype=np.intp)
+    bearings = np.zeros((count, width))
+    for i, route in enumerate(routes):
+        n = len(route.cells)
+        along[i, :n] = route.along_km
+        cells[i] = np.append(cube.cell_indices(route.cells), np.full(width - n, cube.index[route.cells[-1]]))
+        bearings[i, :n] = track_bearings(route)
+        bearings[i, n:] = bearings[i, n - 1]
+    distance = np.array([route.distance_km for route in routes])
+    rows = np.arange(count)
+
+    t = np.broadcast_to(np.asarray(release_epochs, dtype=np.float64), (count,)).copy()
+    position = np.zeros(count)
+    arrival = np.full(count, np.nan)
+    passage = np.full((count, width), np.nan)
+    passage[:, 0] = t
+    active = np.ones(count, dtype=bool)
+
+    for _ in range(steps):
+        if not active.any():
+            break
+        segment = np.clip((along <= position[:, None]).sum(axis=1) - 1, 0, width - 1)
+        tail, cross = wind_components(cube.sample(cells[rows, segment], t), bearings[rows, segment])
+        tail, cross = np.nan_to_num(tail), np.nan_to_num(cross)  # brak prognozy = bezwietrznie
+        ground = np.sqrt(np.maximum(airspeed ** 2 - cross ** 2, 0)) + tail
+        ground = np.where(active, np.maximum(ground, airspeed * MIN_GROUND_SPEED_FRACTION), 0)
+        km_per_s = np.maximum(ground, 1e-9)[:, None] / 3600
+        reached = position + ground * dt / 3600
+
+        crossed = active[:, None] & (along > position[:, None]) & (along <= reached[:, None])
+        passage = np.where(crossed, t[:, None] + (along - position[:, None]) / km_per_s, passage)
+        landed = active & (reached >= distance)
+        arrival[landed] = t[landed] + (distance[landed] - position[landed]) / km_per_s[landed, 0]
+
+        position = reached
+        t = np.where(active, t + dt, t)
+        active &= ~landed
+    return FlightEstimate(arrival, passage)
+
+
+def flight_conditions(cube, routes, release_epochs):
+    """Symulacja lotów i prognoza w każdym punkcie w chwili przelotu: [(values, passage, arrival)] na trasę"""
+    flight = simulate_flights(cube, routes, release_epochs)
+    cells = [cell for route in routes for cell in route.cells]
+    passage = np.concatenate([flight.passage[i, :len(route.cells)] for i, route in enumerate(routes)])
+    reached = ~np.isnan(passage)
+    values = cube.sample(cube.cell_indices(cells), np.where(reached, passage, cube.times[0]))
+    values[~reached] = np.nan  # punkty, do których ptak nie doleciał w FLIGHT_MAX_HOURS
+    offsets = np.cumsum([len(route.cells) for route in routes])[:-1]
+    return list(zip(np.split(values, offsets), np.split(passage, offsets), flight.arrival))
+
+
+def score_conditions(values):
+    """Ocena 0-100 warunków lotu dla tablicy (..., pola).
+
+    NaN, gdy brak temperatury lub wiatru; brak pozostałych pól (np. w
+    plikach modelu) nie obniża oceny.
+    """
+    temp = values[..., FIELD['temp_c']]
+    penalty = (
+        np.clip(np.abs(temp - 20) - 2, 0, None) * 2.0                    # optimum 18-22°C
+        + np.clip(wind_speed(values) - 15, 0, None) * 1.5                # wiatr umiarkowany < 15 km/h
+    )
+    optional = (
+        np.clip(values[..., FIELD['gust_kph']] - 30, 0, None) * 1.0,
+        np.clip(values[..., FIELD['precip_mm']], 0, None) * 15.0,
+        values[..., FIELD['chance_of_rain']] * 0.2,
+        np.clip(10 - values[..., FIELD['vis_km']], 0, None) * 4.0,       # widoczność dobra > 10 km
+        np.clip(values[..., FIELD['cloud']] - 70, 0, None) * 0.2,
+    )
+    for term in optional:
+        penalty = penalty + np.nan_to_num(term)
+    return np.clip(100 - penalty, 0, 100)
+
+
+def overall_score(scores, axis=-1):
+    """Ocena całej trasy - średnia z naciskiem na najgorszy odcinek"""
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # trasa bez żadnych danych daje NaN
+        return 0.7 * np.nanmean(scores, axis=axis) + 0.3 * np.nanmin(scores, axis=axis)
+
+
+def score_color(score):
+    if score >= 80:
+        return 'green'
+    if score >= 60:
+        return 'blue'
+    if score >= 40:
+        return 'orange'
+    return 'red'
+
+
+def assess(values, overall):
+    """Zalecenia i ostrzeżenia dla warunków na trasie (values: punkty x pola)"""
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # pola bez danych (np. z plików modelu)
+        wind = wind_speed(values)
+        temp = values[:, FIELD['temp_c']]
+        recommendations, cautions = [], []
+
+        if overall >= 80:
+            recommendations.append('Warunki lotu są dobre')
+        elif overall >= 60:
+            recommendations.append('Warunki lotu umiarkowane - rozważ późniejsze wypuszczenie')
+        else:
+            recommendations.append('Warunki lotu niekorzystne - lot odradzany')
+        if np.nanmin(temp) >= 18 and np.nanmax(temp) <= 22:
+            recommendations.append('Temperatura optymalna (18-22°C)')
+        if np.nanmax(wind) < 15:
+            recommendations.append('Wiatr umiarkowany (<15 km/h)')
+        if np.nanmin(values[:, FIELD['vis_km']]) > 10:
+            recommendations.append('Widoczność dobra (>10 km)')
+        if np.nanmax(values[:, FIELD['chance_of_rain']]) < 30:
+            recommendations.append('Niskie prawdopodobieństwo opadów')
+
+        if np.nanmax(wind) >= 25:
+            cautions.append(f"Silny wiatr na trasie (do {np.nanmax(wind):.0f} km/h)")
+        if np.nanmax(values[:, FIELD['gust_kph']]) >= 40:
+            cautions.append(f"Porywy wiatru do {np.nanmax(values[:, FIELD['gust_kph']]):.0f} km/h")
+        if np.nanmax(values[:, FIELD['precip_mm']]) >= 0.5:
+            cautions.append('Opady na części trasy')
+        if np.nanmin(values[:, FIELD['vis_km']]) < 5:
+            cautions.append(f"Ograniczona widoczność (od {np.nanmin(values[:, FIELD['vis_km']]):.0f} km)")
+        if np.nanmin(temp) < 5 or np.nanmax(temp) > 30:
+            cautions.append(f"Temperatura poza zakresem komfortu ({np.nanmin(temp):.0f}-{np.nanmax(temp):.0f}°C)")
+        return recommendations, cautions
+
+
+def route_report(route, values, passage, arrival, utc_offset):
+    """Wynik analizy trasy: ocena każdego punktu w chwili przelotu, całej trasy i czas lotu"""
+    scores = score_conditions(values)
+    if np.all(np.isnan(scores)):
+        raise RouteError("Brak danych prognozy dla trasy")
+    overall = float(overall_score(scores))
+    recommendations, cautions = assess(values, overall)
+    if np.isnan(arrival):
+        cautions.append(f"Lot nie kończy się w {config.FLIGHT_MAX_HOURS} h przy prognozowanym wietrze")
+    elif np.any(np.isnan(scores)):
+        cautions.append('Brak prognozy dla części punktów trasy')
+
+    wind = wind_speed(values)
+    tail, _ = wind_components(values, track_bearings(route))
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        mean_tail = np.nanmean(tail)
+    if mean_tail <= -10:
+        cautions.append(f"Przeważający wiatr przeciwny (średnio {-mean_tail:.0f} km/h)")
+    points = []
+    for i in range(len(route.lats)):
+        score = _score(scores[i])
+        points.append({
+            'lat': round(float(route.lats[i]), 5),
+            'lng': round(float(route.lons[i]), 5),
+            'distance_km': round(float(route.along_km[i]), 1),
+            'conditions': score,
+            'color': score_color(score) if score is not None else 'gray',
+            'temp_c': _round(values[i, FIELD['temp_c']]),
+            'wind_kph': _round(wind[i]),
+            'precip_mm': _round(values[i, FIELD['precip_mm']]),
+            'vis_km': _round(values[i, FIELD['vis_km']]),
+            'tailwind_kph': _round(tail[i]),
+            'eta': _local_time(passage[i], utc_offset, '%H:%M')
+        })
+    duration = None if np.isnan(arrival) else (arrival - passage[0]) / 60
+    return {
+        'start_location': route.start,
+        'end_location': route.end,
+        'distance': round(route.distance_km, 1),
+        'bearing': round(route.bearing),
+        'route_points': points,
+        'overall_score': int(round(overall)),
+        'estimated_duration': _format_duration(duration),
+        'estimated_duration_minutes': None if duration is None else int(round(duration)),
+        'estimated_arrival': _local_time(arrival, utc_offset, '%Y-%m-%d %H:%M'),
+        'mean_tailwind_kph': _round(mean_tail),
+        'recommendations': recommendations,
+        'warnings': cautions
+    }
+
+
+def _round(value, digits=1):
+    return None if np.isnan(value) else round(float(value), digits)
+
+
+def _score(value):
+    return None if np.isnan(value) else int(round(float(value)))
+
+
+def _local_time(epoch, utc_offset, fmt):
+    return None if np.isnan(epoch) else datetime.utcfromtimestamp(round(float(epoch)) + utc_offset).strftime(fmt)
+
+
+def _format_duration(minutes):
+    if minutes is None:
+        return None
+    hours, minutes = divmod(int(round(minutes)), 60)
+    return f"{hours} h {minutes:02d} min"
+
+
+def analyze_route(start, end, flight_date, flight_time, points=None, spacing_km=None):
+    """Pełna analiza trasy: geokodowanie, próbkowanie ortodromy, prognozy z cache i ocena"""
+    deadline = request_deadline.get()
+    route = plan_route(start, end, points, spacing_km, deadline)
+    cube = load_cube(route.cells, deadline)
+    release = cube.local_epoch(flight_date, flight_time)
+    if not cube.covers(release):
+        raise RouteError(f"Data lotu poza zakresem prognozy ({config.ROUTE_FORECAST_DAYS} dni)")
+    values, passage, arrival = flight_conditions(cube, [route], release)[0]
+    report = route_report(route, values, passage, arrival, cube.utc_offset)
+    report.update({'flight_date': flight_date, 'flight_time': flight_time})
+    return report
+
+
+def plan_race(release, lofts, spacing_km=None, deadline=None):
+    """Trasy wyścigu: (nazwa miejsca wypuszczenia, [(id gołębnika, Route albo komunikat błędu)]).
+
+    Błędny gołębnik nie przerywa wyścigu - dostaje własny komunikat;
+    błędne miejsce wypuszczenia zgłasza RouteError.
+    """
+    spacing_km = spacing_km or config.RACE_SAMPLE_SPACING_KM
+    origin = resolve_location(release, deadline)
+
+    def plan(loft):
+        try:
+            return build_route(origin, resolve_location(loft, deadline), spacing_km=spacing_km, aligned=True)
+        except RouteError as e:
+            return str(e)
+
+    ids = [loft_id for loft_id, _ in lofts]
+    return origin[2], list(zip(ids, route_executor.map(plan, [location for _, location in lofts])))
+
+
+def race_reports(routes, flight_date, flight_time, deadline=None):
+    """Generator wyników wyścigu: wiersz 'loft' na gołębnika, na końcu 'summary'.
+
+    Komórki wszystkich tras są deduplikowane i pobierane raz; loty
+    wszystkich gołębników symulowane są razem (simulate_flights).
+    """
+    started = time.monotonic()
+    planned = [(loft_id, route) for loft_id, route in routes if isinstance(route, Route)]
+    cells = [cell for _, route in planned for cell in route.cells]
+    try:
+        if not planned:
+            raise RouteError("Brak poprawnych tras w wyścigu")
+        cube = load_cube(cells, deadline)
+        release = cube.local_epoch(flight_date, flight_time)
+        if not cube.covers(release):
+            raise RouteError(f"Data lotu poza zakresem prognozy ({config.ROUTE_FORECAST_DAYS} dni)")
+    except (RouteError, ForecastError) as e:
+        yield {'type': 'error', 'error': str(e)}
+        return
+
+    flights = iter(flight_conditions(cube, [route for _, route in planned], release))
+
+    analyzed = 0
+    for loft_id, route in routes:
+        if not isinstance(route, Route):
+            yield {'type': 'loft', 'id': loft_id, 'error': route}
+            continue
+        try:
+            report = route_report(route, *next(flights), cube.utc_offset)
+        except RouteError as e:
+            yield {'type': 'loft', 'id': loft_id, 'error': str(e)}
+            continue
+        analyzed += 1
+        yield dict(report, type='loft', id=loft_id)
+
+    yield {
+        'type': 'summary',
+        'lofts': len(routes),
+        'analyzed': analyzed,
+        'failed': len(routes) - analyzed,
+        'sample_points': len(cells),
+        'unique_cells': len(cube.index),
+        'seconds': round(time.monotonic() - started, 3)
+    }
+
+
+def search_release_times(start, end, flight_date, window_start, window_end, step_minutes=None,
+                         points=None, spacing_km=None):
+    """Ranking godzin wypuszczenia w oknie czasu dla jednej trasy.
+
+    Prognozy komórek trasy pobierane są raz; wszystkie kandydaty symulowane
+    razem, a macierz warunków (kandydat x punkt trasy) oceniana jednym
+    wektorowym przebiegiem.
+    """
+    step_minutes = step_minutes or config.RELEASE_SEARCH_STEP_MINUTES
+    deadline = request_deadline.get()
+    route = plan_route(start, end, points, spacing_km, deadline)
+    cube = load_cube(route.cells, deadline)
+
+    first = cube.local_epoch(flight_date, window_start)
+    last = cube.local_epoch(flight_date, window_end)
+    if last < first:
+        raise RouteError("Koniec okna przed jego początkiem")
+    candidates = np.arange(first, last + 1, step_minutes * 60, dtype=np.float64)
+    if len(candidates) > config.RELEASE_SEARCH_MAX_CANDIDATES:
+        raise RouteError(f"Maksymalnie {config.RELEASE_SEARCH_MAX_CANDIDATES} godzin wypuszczenia w oknie")
+    if not cube.covers(candidates):
+        raise RouteError(f"Okno wypuszczenia poza zakresem prognozy ({config.ROUTE_FORECAST_DAYS} dni)")
+
+    flight = simulate_flights(cube, [route] * len(candidates), candidates)
+    passage = flight.passage[:, :len(route.cells)]
+    reached = ~np.isnan(passage)
+    values = cube.sample(cube.cell_indices(route.cells)[None, :], np.where(reached, passage, cube.times[0]))
+    values[~reached] = np.nan
+    scores = score_conditions(values)                        # (kandydaci, punkty)
+    overall = overall_score(scores, axis=1)
+    tail, _ = wind_components(values, track_bearings(route)[None, :])
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        worst = np.nanmin(scores, axis=1)
+        mean_tail = np.nanmean(tail, axis=1)
+    duration = (flight.arrival - candidates) / 60
+
+    # Najpierw loty, które kończą się w FLIGHT_MAX_HOURS, potem ocena, potem krótszy lot
+    order = sorted(range(len(candidates)), key=lambda i: (
+        np.isnan(duration[i]), -np.nan_to_num(overall[i], nan=-1), np.nan_to_num(duration[i], nan=np.inf)))
+    ranked = []
+    for rank, i in enumerate(order, 1):
+        score = _score(overall[i])
+        minutes = None if np.isnan(duration[i]) else float(duration[i])
+        ranked.append({
+            'rank': rank,
+            'release_time': _local_time(candidates[i], cube.utc_offset, '%H:%M'),
+            'overall_score': score,
+            'color': score_color(score) if score is not None else 'gray',
+            'worst_point_score': _score(worst[i]),
+            'estimated_duration': _format_duration(minutes),
+            'estimated_duration_minutes': None if minutes is None else int(round(minutes)),
+            'estimated_arrival': _local_time(flight.arrival[i], cube.utc_offset, '%Y-%m-%d %H:%M'),
+            'mean_tailwind_kph': _round(mean_tail[i]),
+            'point_scores': [_score(value) for value in scores[i]]
+        })
+    return {
+        'start_location': route.start,
+        'end_location': route.end,
+        'distance': round(route.distance_km, 1),
+        'bearing': round(route.bearing),
+        'flight_date': flight_date,
+        'window': {'start': window_start, 'end': window_end, 'step_minutes': step_minutes},
+        'route_points': [
+            {'lat': round(float(lat), 5), 'lng': round(float(lon), 5), 'distance_km': round(float(km), 1)}
+            for lat, lon, km in zip(route.lats, route.lons, route.along_km)
+        ],
+        'best': ranked[0],
+        'candidates': ranked
+    }
@@ -0,0 +1,86 @@
+"""
+Global, zoom-independent lat/lon sampling lattice for weather tiles
+
+Nodes sit on multiples of a fixed base step (e.g. 0.25 degrees). Lower
+zooms use coarser levels whose spacing is step * 2**k, so every coarse
+node is also a node of every finer level and all tiles, at any zoom,
+share the same cached samples.
+"""
+
+import math
+import time
+
+import numpy as np
+
+from weather_client import TTLCache
+
+
+def mercator_lat(ytile, zoom):
+    """Latitude of a (fractional) Web Mercator tile row"""
+    n = 2.0 ** zoom
+    return np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * np.asarray(ytile, dtype=np.float64) / n))))
+
+
+class SampleLattice:
+    """Lattice geometry plus a per-node sample cache"""
+
+    def __init__(self, fetcher, step=0.25, nodes_per_tile=8, ttl=3600, maxsize=100000):
+        self.fetcher = fetcher  # callable: list of (lat, lon), **kwargs -> list of samples (None on failure)
+        self.step = step
+        self.nodes_per_tile = nodes_per_tile
+        self.ttl = ttl
+        self.cache = TTLCache(maxsize=maxsize)
+
+    def spacing_for(self, lon_span):
+        """Node spacing for a tile: the finest level with at most nodes_per_tile nodes across"""
+        wanted = lon_span / max(1, self.nodes_per_tile - 1)
+        level = max(0, math.ceil(math.log2(max(wanted / self.step, 1e-9))))
+        return self.step * 2 ** level
+
+    def node_axes(self, lat_north, lat_south, lon_west, lon_east):
+        """Node latitudes (north to south) and longitudes (west to east) covering the bounds"""
+        spacing = self.spacing_for(lon_east - lon_west)
+        i_north = math.ceil(lat_north / spacing)
+        i_south = math.floor(lat_south / spacing)
+        j_west = math.floor(lon_west / spacing)
+        j_east = math.ceil(lon_east / spacing)
+        lats = np.unique(np.clip(np.arange(i_south, i_north + 1) * spacing, -90, 90))[::-1]
+        lons = np.unique(np.clip(np.arange(j_west, j_east + 1) * spacing, -180, 180))
+        return lats, lons
+
+    def node_key(self, lat, lon):
+        """Cache key in base-step units, shared by every lattice level"""
+        return (int(round(lat / self.step)), int(round(lon / self.step)))
+
+    def fetch_nodes(self, lats, lons, refresh=False, **fetch_kwargs):
+        """Samples for every node of the lats x lons grid (row-major), fetching only uncached nodes.
+
+        Returns (samples, sampled_at) where sampled_at is the fetch time of the
+        oldest node used. refresh=True ignores the node cache (used when a
+        tile is regenerated ahead of expiry). fetch_kwargs go to the fetcher.
+        """
+        now = time.time()
+        points = [(float(lat), float(lon)) for lat in lats for lon in lons]
+        entries = [None if refresh else self.cache.get(self.node_key(lat, lon)) for lat, lon in points]
+        samples = [entry[0] if entry else None for entry in entries]
+        sampled_at = min([entry[1] for entry in entries if entry] + [now])
+
+        missing = [i for i, entry in enumerate(entries) if entry is None]
+        if missing:
+            fetched = self.fetcher([points[i] for i in missing], **fetch_kwargs)
+            for i, sample in zip(missing, fetched):
+                if sample is not None:
+                    self.cache.set(self.node_key(*points[i]), (sample, now), self.ttl)
+                samples[i] = sample
+        return samples, sampled_at
+
+    def pixel_coords(self, z, x, y, lats, lons, size=256):
+        """Fractional node indices of each tile pixel centre (rows, cols) for bilinear sampling"""
+        offsets = (np.arange(size) + 0.5) / size
+        pixel_lats = mercator_lat(y + offsets, z)
+        n = 2.0 ** z
+        pixel_lons = (x + offsets) / n * 360.0 - 180.0
+        # np.interp needs increasing x; latitudes run north to south
+        rows = np.interp(-pixel_lats, -lats, np.arange(len(lats)))
+        cols = np.interp(pixel_lons, lons, np.arange(len(lons)))
+        return rows.astype(np.float32), cols.astype(np.float32)
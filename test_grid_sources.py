@@ -0,0 +1,94 @@
+"""
+Testy dekodowania plików modelu i pobrania siatki prognoz na syntetycznych plikach .npz
+"""
+
+import os
+import time
+
+import numpy as np
+import pytest
+
+from forecast_grid import ForecastGrid, GridIngest, GridSnapshot
+from grid_sources import GRID_FIELD, ModelFileSource, decode_model, parse_bbox
+
+HOUR = 3600
+
+
+def test_ingest_model_file(tmp_path, model_file):
+    directory, times = model_file
+    ingest = GridIngest(str(tmp_path / 'grid'), ModelFileSource(str(directory), utc_offset=0))
+
+    stats = ingest.run()
+    assert stats is not None and stats['swapped']
+
+    grid = GridSnapshot(str(tmp_path / 'grid' / 'current'))
+    assert list(grid.lats) == [50.0, 51.0, 52.0, 53.0]
+    values = grid.sample(51.5, 20.5, times[3] + HOUR / 2, ('temp_c', 'wind_u', 'wind_v', 'wind_kph', 'wind_degree',
+                                                         'pressure_mb', 'humidity'))
+    temp_c, wind_u, wind_v, wind_kph, wind_degree, pressure_mb, humidity = values
+    assert temp_c == pytest.approx(13.5, abs=1e-3)
+    assert wind_u == pytest.approx(18.0, abs=1e-3)  # 5 m/s -> km/h
+    assert wind_v == pytest.approx(0.0, abs=1e-3)
+    assert wind_kph == pytest.approx(18.0, abs=1e-3)
+    assert wind_degree == pytest.approx(270.0, abs=1e-3)
+    assert pressure_mb == pytest.approx(1013.0, abs=1e-2)
+    assert np.isnan(humidity)
+
+
+def test_unchanged_model_file_is_skipped(tmp_path, model_file):
+    directory, _ = model_file
+    ingest = GridIngest(str(tmp_path / 'grid'), ModelFileSource(str(directory), utc_offset=0))
+    first = ingest.run()
+    assert first is not None
+
+    second = ingest.run()
+    assert second is not None
+    assert not second['swapped']
+    assert second['reason'] == 'unchanged'
+    assert os.readlink(str(tmp_path / 'grid' / 'current')) == first['run']
+
+
+def test_model_file_outside_bbox_keeps_grid(tmp_path, model_file):
+    directory, times = model_file
+    grid_dir = str(tmp_path / 'grid')
+    ingest = GridIngest(grid_dir, ModelFileSource(str(directory), parse_bbox('19,50,22,53'), utc_offset=0))
+    first = ingest.run()
+    assert first is not None and first['swapped']
+
+    # Nowszy plik nad 36-40N / 0-4E nie może podmienić siatki przebiegiem 1 x 1
+    path = directory / 'elsewhere.npz'
+    temperature = np.full((len(times), 5, 5), 283.15, dtype=np.float32)
+    np.savez(path, times=times, lats=np.arange(36.0, 41.0), lons=np.arange(0.0, 5.0),
+             Temperature_height_above_ground=temperature)
+    settled = time.time() - ModelFileSource.SETTLE_SECONDS
+    os.utime(path, (settled, settled))
+
+    second = ingest.run()
+    assert second is not None
+    assert not second['swapped']
+    assert 'nie pokrywa' in str(second['reason'])
+    assert os.readlink(os.path.join(grid_dir, 'current')) == first['run']
+
+
+def test_grid_age_follows_source_data(tmp_path, model_file):
+    directory, _ = model_file
+    GridIngest(str(tmp_path / 'grid'), ModelFileSource(str(directory), utc_offset=0)).run()
+
+    assert ForecastGrid(str(tmp_path / 'grid'), max_age=HOUR, min_horizon=6 * HOUR).snapshot() is not None
+    assert ForecastGrid(str(tmp_path / 'grid'), max_age=1).snapshot() is None
+    assert ForecastGrid(str(tmp_path / 'grid'), min_horizon=48 * HOUR).snapshot() is None
+
+
+def test_decode_model_resamples_to_temperature_axis():
+    times = np.arange(7, dtype=np.float64) * HOUR
+    coarse = times[::3]
+    lats, lons = np.array([50.0, 51.0]), np.array([200.0, 20.0])
+    temperature = np.zeros((len(times), 2, 2), dtype=np.float32)
+    precipitation = (np.arange(len(coarse), dtype=np.float32) / HOUR)[:, None, None] * np.ones((1, 2, 2), np.float32)
+
+    decoded_times, decoded_lats, decoded_lons, values = decode_model(
+        {'temp_c': (times, temperature), 'Precipitation_rate_surface': (coarse, precipitation)}, lats, lons)
+
+    assert np.array_equal(decoded_times, times)
+    assert list(decoded_lons) == [-160.0, 20.0]
+    np.testing.assert_allclose(values[GRID_FIELD['precip_mm'], :, 0, 0], np.arange(7) / 3, atol=1e-5)
@@ -0,0 +1,58 @@
+"""
+Test formatu klatek animacji: build_timeline -> base64/zlib -> delta_decode -> dequantize
+"""
+
+import base64
+import zlib
+
+import numpy as np
+import pytest
+
+import timeline_frames
+from forecast_grid import ForecastGrid, GridIngest
+from grid_sources import ModelFileSource, parse_bbox
+from raster_codec import delta_decode, delta_encode, dequantize, quantize
+
+HOUR = 3600
+
+
+def decode_frames(timeline):
+    """Dekodowanie odpowiedzi tak, jak robi to klient"""
+    encoding = timeline['encoding']
+    raw = np.frombuffer(zlib.decompress(base64.b64decode(timeline['data'])), dtype=encoding['dtype'])
+    deltas = raw.reshape(timeline['frames'], len(timeline['channels']), timeline['height'], timeline['width'])
+    return dequantize(delta_decode(deltas), encoding['scale'], encoding['offset'], encoding['nodata'])
+
+
+@pytest.fixture
+def grid(tmp_path, model_file, monkeypatch):
+    directory, times = model_file
+    GridIngest(str(tmp_path / 'grid'), ModelFileSource(str(directory), utc_offset=0)).run()
+    monkeypatch.setattr(timeline_frames, 'forecast_grid', ForecastGrid(str(tmp_path / 'grid')))
+    return times
+
+
+@pytest.mark.parametrize('layer, expected', [
+    ('temperature', lambda hours: [10.0 + hours]),  # 283.15 K + 1 K na godzinę
+    ('wind', lambda hours: [18.0, 0.0]),  # u = 5 m/s -> 18 km/h, v = 0
+])
+def test_timeline_round_trip(grid, layer, expected):
+    start = int(grid[1])
+    timeline = timeline_frames.build_timeline(layer, parse_bbox('19.5,50.5,21.5,52.5'), width=16, steps=6,
+                                              step_minutes=30, start=start)
+    assert timeline['source'] == 'grid'
+    assert timeline['encoding']['delta'] == 'mod256'
+
+    values = decode_frames(timeline)
+    assert values.shape == (6, len(timeline['channels']), timeline['height'], 16)
+    for frame, epoch in enumerate(start + np.arange(6) * 1800):
+        hours = (epoch - grid[0]) / HOUR
+        for channel, value in enumerate(expected(hours)):
+            np.testing.assert_allclose(values[frame, channel], value, atol=timeline['encoding']['scale'] / 2)
+
+
+def test_nodata_survives_round_trip():
+    values = np.array([[1.0, np.nan], [2.0, 3.5]], dtype=np.float32)[:, None]
+    frames, nodata = quantize(values, 0.5, 0.0)
+    decoded = dequantize(delta_decode(delta_encode(frames)), 0.5, 0.0, nodata)
+    np.testing.assert_array_equal(decoded, values)
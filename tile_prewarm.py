@@ -0,0 +1,111 @@
+"""
+Background tile prewarming - keeps configured regions, layers and zooms fresh
+ahead of expiry, within an upstream call budget per cycle
+"""
+
+import time
+
+from prometheus_client import Counter, Gauge
+
+# Metryki Prometheus
+prewarm_pending = Gauge('tile_prewarm_pending_tiles', 'Tiles due for prewarming at the start of the last cycle')
+prewarm_refreshed = Counter('tile_prewarm_refreshed_total', 'Tiles regenerated by the prewarmer', ['layer'])
+prewarm_errors = Counter('tile_prewarm_errors_total', 'Tiles the prewarmer failed to regenerate', ['layer'])
+prewarm_cycle_calls = Gauge('tile_prewarm_cycle_upstream_calls', 'Upstream calls spent by the last prewarm cycle')
+prewarm_last_cycle = Gauge('tile_prewarm_last_cycle_timestamp_seconds', 'Unix time the last prewarm cycle finished')
+
+
+def parse_regions(spec):
+    """Parse "west,south,east,north:zmin-zmax;..." into [(bbox, zmin, zmax), ...]"""
+    regions = []
+    for part in spec.split(';'):
+        part = part.strip()
+        if not part:
+            continue
+        bounds, _, zooms = part.partition(':')
+        bbox = [float(v) for v in bounds.split(',')]
+        if len(bbox) != 4:
+            raise ValueError(f"Prewarm region needs west,south,east,north: {part}")
+        zmin, _, zmax = zooms.partition('-')
+        regions.append((bbox, int(zmin), int(zmax or zmin)))
+    return regions
+
+
+class TilePrewarmer:
+    """Regenerates region tiles shortly before they expire, most urgent first"""
+
+    def __init__(self, regions, layers, lookup, refresh, upstream_count, tiles_in_bbox,
+                 ttl: float = 3600, lead: float = 300, budget=2000):
+        self.regions = regions  # [(bbox, zmin, zmax)]
+        self.layers = list(layers)
+        self.lookup = lookup  # (layer, z, x, y) -> generation time or None, without counting as an access
+        self.refresh = refresh  # (layer, z, x, y) -> regenerated tile, or None when out of upstream quota
+        self.upstream_count = upstream_count  # () -> upstream calls made so far (process-wide)
+        self.tiles_in_bbox = tiles_in_bbox  # (bbox, z) -> iterable of (x, y)
+        self.ttl = ttl
+        self.lead = lead
+        self.budget = budget
+
+    def due_tiles(self, now=None):
+        """(remaining seconds, layer, z, x, y) for tiles missing or expiring within lead, most urgent first.
+
+        Missing tiles come first; ties go to the higher zoom so its parents
+        can later be composed from freshly refreshed children.
+        """
+        now = now or time.time()
+        due = set()
+        for bbox, zmin, zmax in self.regions:
+            for z in range(zmax, zmin - 1, -1):
+                for x, y in self.tiles_in_bbox(bbox, z):
+                    for layer in self.layers:
+                        generated_at = self.lookup(layer, z, x, y)
+                        remaining = self.ttl - (now - generated_at) if generated_at else float('-inf')
+                        if remaining <= self.lead:
+                            due.add((remaining, layer, z, x, y))
+        return sorted(due, key=lambda t: (t[0], -t[2]))
+
+    def run_cycle(self):
+        """Refresh due tiles until done, the call budget is spent or the upstream quota runs low.
+
+        Only calls made while a prewarm refresh runs count against the budget,
+        so user traffic between refreshes does not eat it.
+        """
+        started = time.time()
+        due = self.due_tiles(started)
+        prewarm_pending.set(len(due))
+        calls = refreshed = failed = 0
+        for _, layer, z, x, y in due:
+            if calls >= self.budget:
+                break
+            calls_before = self.upstream_count()
+            try:
+                if self.refresh(layer, z, x, y) is None:
+                    break
+                refreshed += 1
+                prewarm_refreshed.labels(layer=layer).inc()
+            except Exception as e:
+                failed += 1
+                prewarm_errors.labels(layer=layer).inc()
+                print(f"❌ Prewarm failed for {layer} {z}/{x}/{y}: {e}")
+            finally:
+                calls += self.upstream_count() - calls_before
+
+        prewarm_cycle_calls.set(calls)
+        prewarm_last_cycle.set(time.time())
+        return {
+            'due': len(due),
+            'refreshed': refreshed,
+            'failed': failed,
+            'deferred': len(due) - refreshed - failed,
+            'upstream_calls': calls,
+            'seconds': round(time.time() - started, 1)
+        }
+
+    def run_forever(self, interval):
+        """Run a cycle every interval seconds (meant for a daemon thread)"""
+        while True:
+            try:
+                print(f"🔥 Tile prewarm: {self.run_cycle()}")
+            except Exception as e:
+                print(f"❌ Tile prewarm cycle failed: {e}")
+            time.sleep(interval)
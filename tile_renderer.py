@@ -0,0 +1,66 @@
+"""
+Vectorized NumPy tile renderer - bilinear upsampling and colormap lookup tables
+"""
+
+import numpy as np
+from PIL import Image
+
+LUT_SIZE = 256
+
+
+def build_lut(color_fn, vmin, vmax, size=LUT_SIZE):
+    """Precompute a (size, 4) uint8 RGBA table by evaluating color_fn over [vmin, vmax]"""
+    values = np.linspace(vmin, vmax, size)
+    return np.array([color_fn(float(v)) for v in values], dtype=np.uint8)
+
+
+def interpolation_matrix(coords, n):
+    """(len(coords), n) matrix of linear interpolation weights at fractional indices"""
+    coords = np.clip(np.asarray(coords, dtype=np.float32), 0, n - 1)
+    i0 = np.floor(coords).astype(np.intp)
+    i1 = np.minimum(i0 + 1, n - 1)
+    frac = coords - i0
+    matrix = np.zeros((len(coords), n), dtype=np.float32)
+    rows = np.arange(len(coords))
+    np.add.at(matrix, (rows, i0), 1 - frac)
+    np.add.at(matrix, (rows, i1), frac)
+    return matrix
+
+
+def bilinear_sample(grid, rows, cols):
+    """Bilinearly resample grid (..., h, w) at 1-D fractional row and column indices.
+
+    Bilinear interpolation is separable, so the whole output is two small
+    matrix products. NaN cells are excluded by weight, so missing samples
+    are filled from their neighbours; pixels with no valid neighbour stay NaN.
+    """
+    h, w = grid.shape[-2:]
+    row_weights = interpolation_matrix(rows, h)
+    col_weights = interpolation_matrix(cols, w).T
+
+    valid = ~np.isnan(grid)
+    values = np.where(valid, grid, 0).astype(np.float32)
+    num = row_weights @ values @ col_weights
+    den = row_weights @ valid.astype(np.float32) @ col_weights
+    with np.errstate(invalid='ignore', divide='ignore'):
+        out = num / den
+    out[den < 1e-6] = np.nan
+    return out
+
+
+def apply_lut(values, lut, vmin, vmax):
+    """Map a float array to RGBA uint8 through a lookup table; NaN becomes transparent"""
+    missing = np.isnan(values)
+    scale = (len(lut) - 1) / float(vmax - vmin)
+    idx = np.clip((np.where(missing, vmin, values) - vmin) * scale + 0.5, 0, len(lut) - 1).astype(np.uint8)
+    # Gather whole RGBA pixels as packed uint32 - one lookup per pixel instead of four
+    packed = np.ascontiguousarray(lut).view(np.uint32).reshape(-1)
+    rgba = np.take(packed, idx)
+    rgba[missing] = 0
+    return rgba.view(np.uint8).reshape(values.shape + (4,))
+
+
+def colorize(values, lut, vmin, vmax):
+    """Turn a float array of layer values into an RGBA PIL image"""
+    return Image.fromarray(apply_lut(values, lut, vmin, vmax), 'RGBA')
+
@@ -0,0 +1,271 @@
+"""
+Pluggable tile store backends - a single SQLite file (default) or a flat PNG directory
+"""
+
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from prometheus_client import Counter, Gauge
+
+StoredTile = namedtuple('StoredTile', ['data', 'generated_at'])
+
+# Metryki Prometheus
+memory_cache_hits = Counter('tile_memory_cache_hits_total', 'Tiles served from the in-process memory cache')
+memory_cache_misses = Counter('tile_memory_cache_misses_total', 'Tile lookups that fell through to the tile store')
+memory_cache_bytes = Gauge('tile_memory_cache_bytes', 'Encoded tile bytes held in the memory cache')
+
+# last_access is only rewritten when older than this, so hot reads stay read-only
+ACCESS_RESOLUTION = 60
+
+
+class TileStore:
+    """Interface shared by the tile store backends"""
+
+    def get(self, layer, z, x, y, max_age=None):
+        """Return a StoredTile, or None when missing or older than max_age seconds"""
+        raise NotImplementedError
+
+    def generated_at(self, layer, z, x, y):
+        """Generation time of a stored tile, or None - metadata only, does not count as an access"""
+        raise NotImplementedError
+
+    def put(self, layer, z, x, y, data, generated_at=None):
+        """Atomically store encoded tile bytes"""
+        raise NotImplementedError
+
+    def gc(self, retention):
+        """Drop tiles older than retention seconds, enforce the size cap and reclaim space"""
+        raise NotImplementedError
+
+
+class SQLiteTileStore(TileStore):
+    """All tiles in one SQLite file, indexed by (layer, z, x, y) with generation and access times"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS tiles (
+            layer TEXT NOT NULL,
+            z INTEGER NOT NULL,
+            x INTEGER NOT NULL,
+            y INTEGER NOT NULL,
+            tile_data BLOB NOT NULL,
+            generated_at REAL NOT NULL,
+            last_access REAL NOT NULL,
+            size INTEGER NOT NULL,
+            PRIMARY KEY (layer, z, x, y)
+        );
+        CREATE INDEX IF NOT EXISTS tiles_generated_at ON tiles (generated_at);
+        CREATE INDEX IF NOT EXISTS tiles_last_access ON tiles (last_access);
+    """
+
+    def __init__(self, path, max_bytes=512 * 1024 * 1024, enforce_every=100):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.enforce_every = enforce_every
+        self._local = threading.local()
+        self._puts = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # auto_vacuum must be chosen before anything (even the WAL switch) writes the file
+        bootstrap = sqlite3.connect(path, timeout=30)
+        bootstrap.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        bootstrap.executescript(self.SCHEMA)
+        bootstrap.close()
+
+    def _conn(self):
+        """One connection per thread (sqlite3 connections are not thread-safe)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, layer, z, x, y, max_age=None):
+        now = time.time()
+        query = "SELECT tile_data, generated_at, last_access FROM tiles WHERE layer = ? AND z = ? AND x = ? AND y = ?"
+        args = [layer, z, x, y]
+        if max_age is not None:
+            query += " AND generated_at > ?"
+            args.append(now - max_age)
+        row = self._conn().execute(query, args).fetchone()
+        if row is None:
+            return None
+
+        data, generated_at, last_access = row
+        if now - last_access > ACCESS_RESOLUTION:
+            self._conn().execute(
+                "UPDATE tiles SET last_access = ? WHERE layer = ? AND z = ? AND x = ? AND y = ?",
+                (now, layer, z, x, y)
+            )
+        return StoredTile(bytes(data), generated_at)
+
+    def generated_at(self, layer, z, x, y):
+        row = self._conn().execute(
+            "SELECT generated_at FROM tiles WHERE layer = ? AND z = ? AND x = ? AND y = ?", (layer, z, x, y)
+        ).fetchone()
+        return row[0] if row else None
+
+    def put(self, layer, z, x, y, data, generated_at=None):
+        now = time.time()
+        self._conn().execute(
+            "INSERT OR REPLACE INTO tiles (layer, z, x, y, tile_data, generated_at, last_access, size) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (layer, z, x, y, sqlite3.Binary(data), generated_at or now, now, len(data))
+        )
+        with self._lock:
+            self._puts += 1
+            enforce = self._puts % self.enforce_every == 0
+        if enforce:
+            self.enforce_size()
+
+    def total_bytes(self):
+        return self._conn().execute("SELECT COALESCE(SUM(size), 0) FROM tiles").fetchone()[0]
+
+    def enforce_size(self):
+        """Evict least recently used tiles until the store fits in max_bytes"""
+        excess = self.total_bytes() - self.max_bytes
+        if excess <= 0:
+            return 0
+
+        conn = self._conn()
+        victims, freed = [], 0
+        cursor = conn.execute("SELECT rowid, size FROM tiles ORDER BY last_access")
+        for rowid, size in cursor:
+            victims.append((rowid,))
+            freed += size
+            if freed >= excess:
+                break
+        cursor.close()  # an unfinished SELECT would keep a read transaction open
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany("DELETE FROM tiles WHERE rowid = ?", victims)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return len(victims)
+
+    def gc(self, retention):
+        conn = self._conn()
+        expired = conn.execute("DELETE FROM tiles WHERE generated_at < ?", (time.time() - retention,)).rowcount
+        evicted = self.enforce_size()
+        # executescript steps the pragma to completion; execute() would free a single page
+        conn.executescript("PRAGMA incremental_vacuum;")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return {'expired': expired, 'evicted': evicted, 'bytes': self.total_bytes()}
+
+
+class FileTileStore(TileStore):
+    """Legacy layout: one {layer}_{z}_{x}_{y}.png per tile, generation time kept in the mtime"""
+
+    def __init__(self, directory, max_bytes=512 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, layer, z, x, y):
+        return os.path.join(self.directory, f"{layer}_{z}_{x}_{y}.png")
+
+    def get(self, layer, z, x, y, max_age=None):
+        path = self._path(layer, z, x, y)
+        try:
+            generated_at = os.path.getmtime(path)
+            if max_age is not None and time.time() - generated_at >= max_age:
+                return None
+            with open(path, 'rb') as f:
+                return StoredTile(f.read(), generated_at)
+        except OSError:
+            return None
+
+    def generated_at(self, layer, z, x, y):
+        try:
+            return os.stat(self._path(layer, z, x, y)).st_mtime
+        except OSError:
+            return None
+
+    def put(self, layer, z, x, y, data, generated_at=None):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        if generated_at:
+            os.utime(tmp_path, (generated_at, generated_at))
+        os.replace(tmp_path, self._path(layer, z, x, y))
+
+    def gc(self, retention):
+        cutoff = time.time() - retention
+        entries = []
+        expired = 0
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith('.png'):
+                continue
+            stat = entry.stat()
+            if stat.st_mtime < cutoff:
+                os.remove(entry.path)
+                expired += 1
+            else:
+                entries.append((stat.st_atime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+            evicted += 1
+        return {'expired': expired, 'evicted': evicted, 'bytes': total}
+
+
+class MemoryTileCache:
+    """Byte-budgeted LRU of encoded tiles in front of the tile store, aware of tile expiry"""
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, max_age):
+        """StoredTile for key when younger than max_age seconds, else None"""
+        with self._lock:
+            tile = self._data.get(key)
+            if tile is not None and time.time() - tile.generated_at < max_age:
+                self._data.move_to_end(key)
+                memory_cache_hits.inc()
+                return tile
+            if tile is not None:
+                self._remove(key)
+        memory_cache_misses.inc()
+        return None
+
+    def put(self, key, tile):
+        size = len(tile.data)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = tile
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                self._remove(next(iter(self._data)))
+            memory_cache_bytes.set(self.bytes)
+
+    def _remove(self, key):
+        self.bytes -= len(self._data.pop(key).data)
+        memory_cache_bytes.set(self.bytes)
+
+
+def open_tile_store(backend, path, max_bytes):
+    """Create the configured tile store backend"""
+    if backend == 'files':
+        return FileTileStore(path, max_bytes=max_bytes)
+    if backend == 'sqlite':
+        return SQLiteTileStore(path, max_bytes=max_bytes)
+    raise ValueError(f"Unknown tile store backend: {backend}")
@@ -0,0 +1,126 @@
+"""
+Klatki animacji pogody dla osi czasu - interpolacja godzinowych prognoz do kroków półgodzinnych,
+kwantyzacja, delta względem poprzedniej klatki i kompresja całej sekwencji w jednej odpowiedzi
+"""
+
+import base64
+import math
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+import config
+from forecast_cells import FIELD, cell_of, load_cube
+from forecast_grid import forecast_grid
+from raster_codec import compress, delta_encode, quantize
+from tile_renderer import bilinear_sample
+from weather_client import TTLCache
+
+# Warstwa -> pola prognozy (kanały klatki) i kwantyzacja uint8: wartość = q * scale + offset
+TIMELINE_LAYERS = {
+    'temperature': {'fields': ('temp_c',), 'scale': 0.5, 'offset': -40.0, 'units': '°C'},
+    'wind': {'fields': ('wind_u', 'wind_v'), 'scale': 0.5, 'offset': -63.5, 'units': 'km/h'},
+    'precipitation': {'fields': ('precip_mm',), 'scale': 0.05, 'offset': 0.0, 'units': 'mm/h'},
+    'clouds': {'fields': ('cloud',), 'scale': 0.5, 'offset': 0.0, 'units': '%'},
+    'humidity': {'fields': ('humidity',), 'scale': 0.5, 'offset': 0.0, 'units': '%'},
+}
+
+# Zakodowane sekwencje klatek (klucz zawiera run siatki prognoz)
+timeline_cache = TTLCache(maxsize=256)
+
+
+class TimelineError(ValueError):
+    """Nieprawidłowe parametry animacji - zwracane klientowi jako 400"""
+
+
+def raster_axes(bbox, width, max_size):
+    """Szerokości (z północy na południe) i długości rastra; wysokość z proporcji obszaru"""
+    west, south, east, north = bbox
+    if not (west < east and south < north):
+        raise TimelineError("Nieprawidłowy obszar (zach,płd,wsch,płn)")
+    width = int(min(max(width, 2), max_size))
+    aspect = (north - south) / ((east - west) * math.cos(math.radians((north + south) / 2)))
+    height = int(min(max(round(width * aspect), 2), max_size))
+    return np.linspace(north, south, height), np.linspace(west, east, width)
+
+
+def sample_frames(fields, lats, lons, epochs, deadline=None):
+    """Wartości (klatki, kanały, wiersze, kolumny) i źródło danych.
+
+    W zasięgu siatki prognoz - jedno wektorowe próbkowanie kostki; poza nią
+    rzadka siatka TIMELINE_FALLBACK_NODES węzłów z prognoz godzinowych
+    (cache tras) interpolowana dwuliniowo do rozmiaru rastra.
+    """
+    grid = forecast_grid.snapshot()
+    if grid is not None and grid.covers(lats[-1], lats[0], lons[0], lons[-1]) \
+            and grid.times[0] <= epochs[0] and epochs[-1] <= grid.times[-1]:
+        values = grid.sample(lats[None, :, None], lons[None, None, :], epochs[:, None, None], fields)
+        return np.moveaxis(values, -1, 1), 'grid'
+
+    nodes = config.TIMELINE_FALLBACK_NODES
+    node_lats = np.linspace(lats[0], lats[-1], min(nodes, len(lats)))
+    node_lons = np.linspace(lons[0], lons[-1], min(nodes, len(lons)))
+    cells = [cell_of(lat, lon) for lat in node_lats for lon in node_lons]
+    cube = load_cube(cells, deadline)
+    if not cube.covers(epochs):
+        raise TimelineError(f"Okres animacji poza zakresem prognozy ({config.ROUTE_FORECAST_DAYS} dni)")
+    cell_idx = cube.cell_indices(cells).reshape(len(node_lats), len(node_lons))
+    coarse = cube.sample(cell_idx[None], epochs[:, None, None])[..., [FIELD[name] for name in fields]]
+    rows = np.linspace(0, len(node_lats) - 1, len(lats))
+    cols = np.linspace(0, len(node_lons) - 1, len(lons))
+    return bilinear_sample(np.moveaxis(coarse, -1, 1), rows, cols), 'weatherapi'
+
+
+def build_timeline(layer, bbox, width=None, steps=None, step_minutes=None, start=None, deadline=None):
+    """Wszystkie klatki warstwy dla obszaru w jednym słowniku (dane: base64 z zlib).
+
+    Klatki (klatka, kanał, wiersz, kolumna) uint8; od drugiej klatki przesyłana
+    jest różnica względem poprzedniej modulo 256. Dekodowanie:
+    klatka[k] = (klatka[k-1] + delta[k]) mod 256, wartość = q * scale + offset,
+    q == nodata oznacza brak danych.
+    """
+    if layer not in TIMELINE_LAYERS:
+        raise TimelineError(f"Nieznana warstwa animacji: {layer}")
+    spec = TIMELINE_LAYERS[layer]
+    steps = int(min(max(steps or config.TIMELINE_STEPS, 1), config.TIMELINE_MAX_STEPS))
+    step_minutes = step_minutes or config.TIMELINE_STEP_MINUTES
+    start = start or int(time.time() // 3600 * 3600)
+    lats, lons = raster_axes(bbox, width or config.TIMELINE_WIDTH, config.TIMELINE_MAX_SIZE)
+
+    grid = forecast_grid.snapshot()
+    key = (layer, tuple(round(v, 4) for v in bbox), len(lons), steps, step_minutes, start, grid.run if grid else None)
+    cached = timeline_cache.get(key)
+    if cached is not None:
+        return cached
+
+    epochs = start + np.arange(steps, dtype=np.float64) * step_minutes * 60
+    values, source = sample_frames(spec['fields'], lats, lons, epochs, deadline)
+    frames, nodata = quantize(values, spec['scale'], spec['offset'])
+    payload = compress(delta_encode(frames))
+
+    result = {
+        'layer': layer,
+        'bbox': list(bbox),
+        'width': len(lons),
+        'height': len(lats),
+        'channels': list(spec['fields']),
+        'frames': steps,
+        'step_minutes': step_minutes,
+        'times': [datetime.fromtimestamp(epoch, tz=timezone.utc).strftime('%Y-%m-%dT%H:%MZ') for epoch in epochs],
+        'encoding': {
+            'dtype': 'uint8',
+            'layout': 'frame,channel,row,col',
+            'scale': spec['scale'],
+            'offset': spec['offset'],
+            'nodata': nodata,
+            'units': spec['units'],
+            'delta': 'mod256',
+            'compression': 'zlib'
+        },
+        'source': source,
+        'bytes': len(payload),
+        'data': base64.b64encode(payload).decode('ascii')
+    }
+    timeline_cache.set(key, result, config.TIMELINE_CACHE_TTL)
+    return result
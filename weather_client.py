@@ -0,0 +1,437 @@
+"""
+Wspólny klient WeatherAPI.com - pula połączeń keep-alive i cache TTL odpowiedzi
+Używany przez app.py oraz weather_tile_server_production.py
+"""
+
+import json
+import logging
+import random
+import threading
+import time
+import zlib
+from collections import OrderedDict, defaultdict
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, TimeoutError, wait
+from contextvars import ContextVar
+from typing import Any, Optional, Tuple
+
+import requests
+from prometheus_client import Counter, Histogram
+from requests.adapters import HTTPAdapter
+
+import config
+from quota_governor import INTERACTIVE, PREWARM, TILE, QuotaGovernor
+from redis_cache import RedisTier, redis_cache_client
+from resilience import CircuitBreaker, LatencyTracker
+
+logger = logging.getLogger(__name__)
+
+# Metryki Prometheus
+upstream_calls = Counter('weatherapi_upstream_calls_total', 'WeatherAPI upstream HTTP calls', ['endpoint'])
+coalesced_calls = Counter('weatherapi_coalesced_calls_total', 'WeatherAPI calls served by an in-flight request', ['endpoint'])
+stale_served = Counter('weatherapi_stale_served_total', 'Expired WeatherAPI responses served while refreshing in the background', ['endpoint'])
+hedged_calls = Counter('weatherapi_hedged_calls_total', 'Backup WeatherAPI requests sent after the latency threshold', ['endpoint'])
+upstream_latency = Histogram(
+    'weatherapi_request_duration_seconds', 'WeatherAPI fetch latency by outcome', ['endpoint', 'outcome'],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 16)
+)
+
+# Termin (time.monotonic) bieżącego zapytania przychodzącego - ustawiany przez set_deadline()
+request_deadline = ContextVar('weatherapi_request_deadline', default=None)
+
+# Precyzja współrzędnych w kluczu zapytania (4 miejsca ~ 11 m)
+COORD_PRECISION = 4
+
+
+def normalize_query(q):
+    """Normalizuje parametr q - 'lat,lon' zaokrąglone, nazwy małymi literami"""
+    text = str(q).strip()
+    parts = text.split(',')
+    if len(parts) == 2:
+        try:
+            lat, lon = float(parts[0]), float(parts[1])
+            return f"{round(lat, COORD_PRECISION)},{round(lon, COORD_PRECISION)}"
+        except ValueError:
+            pass
+    return text.lower()
+
+
+def set_deadline(seconds):
+    """Ustawia termin dla wywołań WeatherAPI w bieżącym zapytaniu (before_request)"""
+    request_deadline.set(time.monotonic() + seconds if seconds else None)
+
+
+class TTLCache:
+    """Cache z czasem życia wpisów i ograniczonym rozmiarem (eviction LRU)
+
+    Wpis może mieć okno "stale" po wygaśnięciu - get() już go nie zwraca,
+    ale get_stale() tak, dopóki okno nie minie (stale-while-revalidate).
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Zwraca wartość lub None, gdy wpis nie istnieje albo wygasł"""
+        value, fresh = self.get_stale(key)
+        return value if fresh else None
+
+    def get_stale(self, key):
+        """(wartość, czy_świeża) - także dla wpisu w oknie stale; (None, False), gdy go nie ma"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None, False
+            value, fresh_until, expires_at = entry
+            now = time.monotonic()
+            if expires_at <= now:
+                del self._data[key]
+                return None, False
+            self._data.move_to_end(key)
+            return value, fresh_until > now
+
+    def set(self, key, value, ttl, stale_ttl=0):
+        """Zapisuje wartość na ttl sekund (plus stale_ttl jako przeterminowana), usuwając najdawniej używane wpisy"""
+        with self._lock:
+            now = time.monotonic()
+            self._data[key] = (value, now + ttl, now + ttl + stale_ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def remaining(self, key):
+        """Sekundy do wygaśnięcia wpisu (0, gdy go nie ma)"""
+        with self._lock:
+            entry = self._data.get(key)
+        if entry is None:
+            return 0
+        return max(0.0, entry[1] - time.monotonic())
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SingleFlight:
+    """Deduplikacja równoległych identycznych wywołań - pierwszy pobiera, reszta czeka na ten sam future"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self.coalesced = 0
+
+    def do(self, key, fn, timeout=None):
+        """Wykonuje fn() raz dla wszystkich równoległych wywołań z tym samym kluczem.
+
+        Czekający dłużej niż timeout dostają TimeoutError (lider kończy pobieranie).
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result(timeout), True
+
+        try:
+            result = fn()
+            future.set_result(result)
+            return result, False
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+
+class WeatherAPIClient:
+    """Klient WeatherAPI.com z keep-alive i cache TTL zależnym od endpointu"""
+
+    def __init__(self, api_key, base_url, timeout: float = 10, pool_size=32, cache_maxsize=4096, ttls=None, l2=None,
+                 max_stale=0, ttl_jitter=0.0, governor=None, hedge_quantile: Optional[float] = 0.95, hedge_min_delay=0.05,
+                 breaker=None):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.ttls = ttls or {}
+        self.default_ttl = self.ttls.get('default', 300)
+        self.max_stale = max_stale  # jak długo po wygaśnięciu odpowiedź może być serwowana
+        self.ttl_jitter = ttl_jitter
+        self.cache = TTLCache(maxsize=cache_maxsize)
+        self.l2 = l2  # opcjonalny RedisTier współdzielony przez workery
+        self.governor = governor  # opcjonalny QuotaGovernor - limit wywołań wg priorytetu
+        self.inflight = SingleFlight()
+        self.stale_served = 0
+        self._refreshing = set()
+        self._refresh_lock = threading.Lock()
+        self._refresher = ThreadPoolExecutor(max_workers=4, thread_name_prefix='wx-refresh')
+        self.upstream_count = 0  # wywołania WeatherAPI od startu procesu (budżet prewarmingu)
+        self.hedge_quantile = hedge_quantile  # None wyłącza zapytania zapasowe
+        self.hedge_min_delay = hedge_min_delay
+        self.latency = defaultdict(LatencyTracker)  # osobny kwantyl opóźnień dla każdego endpointu
+        self.breaker = breaker or CircuitBreaker()
+        self.hedged = 0
+        self._http = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='wx-http')
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def _url(self, endpoint):
+        if endpoint.startswith('http://') or endpoint.startswith('https://'):
+            return endpoint
+        return f"{self.base_url}/{endpoint}"
+
+    def ttl_for(self, url):
+        """TTL cache dla endpointu (np. current.json, forecast.json)"""
+        endpoint = url.rsplit('/', 1)[-1]
+        return self.ttls.get(endpoint, self.default_ttl)
+
+    def normalize_params(self, params):
+        """Parametry zapytania bez klucza API, ze znormalizowanym q"""
+        query = {k: v for k, v in params.items() if k != 'key'}
+        if 'q' in query:
+            query['q'] = normalize_query(query['q'])
+        return query
+
+    def cache_key(self, url, params):
+        """Klucz cache - endpoint i posortowane, znormalizowane parametry"""
+        return f"{url.rsplit('/', 1)[-1]}?{json.dumps(self.normalize_params(params), sort_keys=True)}"
+
+    def fetch(self, endpoint, params, priority=INTERACTIVE, deadline=None) -> Tuple[int, Any]:
+        """Zwraca (status_code, data); odpowiedzi 200 są cache'owane wg TTL endpointu.
+
+        Przeterminowana odpowiedź (do max_stale s) jest zwracana od razu,
+        a odświeżenie idzie w tle - raz na klucz. Gdy limit wywołań dla
+        klasy priority jest wyczerpany, zwraca (429, None); po terminie
+        deadline (time.monotonic, domyślnie termin zapytania) - (504, None).
+        """
+        url = self._url(endpoint)
+        key = self.cache_key(url, params)
+
+        cached, fresh = self._cached(key)
+        if cached is not None:
+            if not fresh:
+                self.stale_served += 1
+                stale_served.labels(endpoint=url.rsplit('/', 1)[-1]).inc()
+                self._revalidate(url, key, params, priority)
+            return 200, cached
+
+        deadline = deadline or request_deadline.get()
+        wait_for = None if deadline is None else deadline - time.monotonic()
+        if wait_for is not None and wait_for <= 0:
+            return 504, None
+        try:
+            result, shared = self.inflight.do(
+                key, lambda: self._fetch_upstream(url, key, params, priority, deadline), timeout=wait_for
+            )
+        except TimeoutError:
+            return 504, None
+        if shared:
+            coalesced_calls.labels(endpoint=url.rsplit('/', 1)[-1]).inc()
+        return result
+
+    def _revalidate(self, url, key, params, priority=INTERACTIVE):
+        """Odświeża przeterminowany wpis w tle; kolejne żądania nie dublują odświeżenia"""
+        with self._refresh_lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                self.inflight.do(key, lambda: self._fetch_upstream(url, key, params, priority))
+            except Exception as e:
+                logger.error(f"Błąd odświeżania w tle {key}: {e}")
+            finally:
+                with self._refresh_lock:
+                    self._refreshing.discard(key)
+
+        self._refresher.submit(refresh)
+
+    def _fetch_upstream(self, url, key, params, priority=INTERACTIVE, deadline=None) -> Tuple[int, Any]:
+        """Pojedyncze wywołanie WeatherAPI (wykonywane przez lidera single-flight).
+
+        Przy otwartym circuit breakerze, wyczerpanym limicie albo błędzie
+        zwraca przeterminowany wpis z cache, jeśli jest.
+        """
+        cached, fresh = self._cached(key)
+        if fresh:
+            return 200, cached
+        endpoint = url.rsplit('/', 1)[-1]
+        if not self.breaker.allow():
+            upstream_latency.labels(endpoint=endpoint, outcome='rejected').observe(0)
+            return (200, cached) if cached is not None else (503, None)
+        if self.governor is not None and not self.governor.acquire(priority):
+            # Limit wyczerpany - zostaje przeterminowany wpis (jeśli jest), bez wywołania API
+            self.breaker.cancel()
+            return (200, cached) if cached is not None else (429, None)
+
+        query = self.normalize_params(params)
+        query['key'] = params.get('key', self.api_key)
+        started = time.monotonic()
+        status, data, outcome = 504, None, 'timeout'
+        try:
+            status, data, outcome = self._request(url, query, priority, deadline)
+        finally:
+            # 4xx to błąd zapytania (np. nieznana lokalizacja), nie awaria WeatherAPI
+            self.breaker.record(failed=outcome in ('error', 'timeout') and not 400 <= status < 500)
+            upstream_latency.labels(endpoint=endpoint, outcome=outcome).observe(time.monotonic() - started)
+
+        if status != 200:
+            logger.error(f"WeatherAPI error {status} dla {key}")
+            return (200, cached) if cached is not None else (status, data)
+
+        # Jitter rozkłada wygasanie wpisów pobranych w tym samym momencie
+        ttl = self.ttl_for(url) * (1 - random.random() * self.ttl_jitter)
+        self.cache.set(key, data, ttl, self.max_stale)
+        if self.l2 is not None:
+            blob = zlib.compress(json.dumps(data, separators=(',', ':')).encode('utf-8'))
+            self.l2.set(key, blob, ttl + self.max_stale)
+        return 200, data
+
+    def _request(self, url, query, priority, deadline) -> Tuple[int, Any, str]:
+        """GET z limitem czasu do terminu; po przekroczeniu kwantyla opóźnień wysyła zapytanie zapasowe.
+
+        Zwraca (status, data, outcome), outcome: ok, hedged, error, timeout.
+        """
+        timeout = self.timeout if deadline is None else min(self.timeout, deadline - time.monotonic())
+        if timeout <= 0:
+            return 504, None, 'timeout'
+        end = time.monotonic() + timeout
+        endpoint = url.rsplit('/', 1)[-1]
+
+        primary = self._http.submit(self._get, url, query, timeout)
+        pending = {primary}
+        hedge_delay = self.latency[endpoint].quantile(self.hedge_quantile) if self.hedge_quantile else None
+        if hedge_delay is not None:
+            hedge_delay = max(hedge_delay, self.hedge_min_delay)
+            if hedge_delay < timeout and not wait(pending, timeout=hedge_delay).done:
+                # Zapas też liczy się do limitu - bez czekania na token
+                if self.governor is None or self.governor.acquire(priority, max_wait=0):
+                    self.hedged += 1
+                    hedged_calls.labels(endpoint=endpoint).inc()
+                    pending.add(self._http.submit(self._get, url, query, end - time.monotonic()))
+
+        result = (504, None, 'timeout')
+        while pending:
+            done, pending = wait(pending, timeout=max(0, end - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                status, data, outcome = future.result()
+                if status == 200:
+                    return status, data, 'ok' if future is primary else 'hedged'
+                result = (status, data, outcome)
+        return result
+
+    def _get(self, url, query, timeout) -> Tuple[int, Any, str]:
+        """Pojedynczy GET do WeatherAPI -> (status, data, outcome)"""
+        endpoint = url.rsplit('/', 1)[-1]
+        upstream_calls.labels(endpoint=endpoint).inc()
+        self.upstream_count += 1
+        started = time.monotonic()
+        try:
+            response = self.session.get(url, params=query, timeout=timeout)
+            self.latency[endpoint].observe(time.monotonic() - started)
+            if response.status_code != 200:
+                return response.status_code, None, 'error'
+            return 200, response.json(), 'ok'
+        except requests.Timeout as e:
+            logger.error(f"Timeout requestu API: {e}")
+            return 504, {'error': str(e)}, 'timeout'
+        except Exception as e:
+            logger.error(f"Błąd requestu API: {e}")
+            return 500, {'error': str(e)}, 'error'
+
+    def _cached(self, key):
+        """(wartość, czy_świeża) z L1 w procesie, potem z L2 w Redis - trafienie w L2 zasila L1.
+
+        Przeterminowany wpis L1 jest najpierw sprawdzany w L2, bo inny worker
+        mógł go już odświeżyć.
+        """
+        value, fresh = self.cache.get_stale(key)
+        if fresh or self.l2 is None:
+            return value, fresh
+        blob, remaining = self.l2.get(key)
+        if blob is None:
+            return value, False
+        try:
+            l2_value = json.loads(zlib.decompress(blob))
+        except (zlib.error, ValueError):
+            return value, False
+        # TTL w Redis obejmuje okno stale - świeża część to remaining - max_stale
+        fresh_remaining = remaining - self.max_stale
+        self.cache.set(key, l2_value, max(0, fresh_remaining), min(remaining, self.max_stale))
+        return l2_value, fresh_remaining > 0
+
+    def remaining_ttl(self, endpoint, params):
+        """Sekundy do wygaśnięcia odpowiedzi w cache dla danego zapytania"""
+        return self.cache.remaining(self.cache_key(self._url(endpoint), params))
+
+    def stats(self):
+        """Statystyki cache i deduplikacji"""
+        return {
+            'cached_responses': len(self.cache),
+            'coalesced_calls': self.inflight.coalesced,
+            'stale_served': self.stale_served,
+            'quota_remaining': self.governor.remaining() if self.governor else None,
+            'hedged_calls': self.hedged,
+            'circuit': self.breaker.state
+        }
+
+    def current(self, lat, lon, priority=INTERACTIVE, deadline=None):
+        """Aktualne warunki dla punktu"""
+        return self.fetch('current.json', {'q': f"{lat},{lon}", 'aqi': 'no'}, priority, deadline)
+
+    def forecast(self, q, days=1, priority=INTERACTIVE, deadline=None, **extra):
+        """Prognoza dla lokalizacji (nazwa lub 'lat,lon')"""
+        params = {'q': q, 'days': days, 'aqi': 'no', 'alerts': 'no'}
+        params.update(extra)
+        return self.fetch('forecast.json', params, priority, deadline)
+
+
+weather_client = WeatherAPIClient(
+    api_key=config.WEATHERAPI_KEY,
+    base_url=config.WEATHERAPI_BASE_URL,
+    timeout=config.WEATHERAPI_TIMEOUT,
+    pool_size=config.WEATHERAPI_POOL_SIZE,
+    cache_maxsize=config.WEATHER_CACHE_MAXSIZE,
+    ttls={
+        'current.json': config.WEATHER_CACHE_TTL_CURRENT,
+        'forecast.json': config.WEATHER_CACHE_TTL_FORECAST,
+        'search.json': config.WEATHER_CACHE_TTL_SEARCH,
+        'default': config.WEATHER_CACHE_TTL_DEFAULT,
+    },
+    l2=RedisTier(redis_cache_client, 'wx:') if redis_cache_client else None,
+    max_stale=config.WEATHER_CACHE_MAX_STALE,
+    ttl_jitter=config.WEATHER_CACHE_TTL_JITTER,
+    governor=QuotaGovernor(
+        monthly=config.WEATHERAPI_QUOTA_MONTHLY,
+        daily=config.WEATHERAPI_QUOTA_DAILY,
+        per_second=config.WEATHERAPI_QUOTA_PER_SECOND,
+        reserves={
+            INTERACTIVE: 0.0,
+            TILE: config.WEATHERAPI_QUOTA_RESERVE_TILE,
+            PREWARM: config.WEATHERAPI_QUOTA_RESERVE_PREWARM
+        },
+        shared=RedisTier(redis_cache_client, 'quota:') if redis_cache_client else None
+    ),
+    hedge_quantile=config.WEATHERAPI_HEDGE_QUANTILE or None,
+    hedge_min_delay=config.WEATHERAPI_HEDGE_MIN_DELAY,
+    breaker=CircuitBreaker(
+        error_rate=config.WEATHERAPI_BREAKER_ERROR_RATE,
+        min_calls=config.WEATHERAPI_BREAKER_MIN_CALLS,
+        window=config.WEATHERAPI_BREAKER_WINDOW,
+        cooldown=config.WEATHERAPI_BREAKER_COOLDOWN
+    )
+)
@@ -7,14 +7,32 @@ Replace WEATHERAPI_KEY with your actual API key
 import os
 import math
 import json
-import requests
-from flask import Flask, send_file, jsonify, request
+import hashlib
+import struct
+import zlib
+from flask import Flask, send_file, jsonify, request, make_response
 from flask_cors import CORS
-from PIL import Image, ImageDraw
+from PIL import Image
 import io
+import threading
+import time
 import numpy as np
-from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+import click
 import config
+from weather_client import TTLCache, request_deadline, set_deadline, weather_client
+from quota_governor import INTERACTIVE, PREWARM, TILE
+from tile_renderer import bilinear_sample, build_lut, colorize
+from sample_lattice import SampleLattice
+from tile_store import MemoryTileCache, StoredTile, open_tile_store
+from redis_cache import RedisTier, redis_cache_client
+from tile_prewarm import TilePrewarmer, parse_regions
+from forecast_grid import forecast_grid, grid_ingest
+from grid_sources import parse_bbox
+from raster_codec import stretch
+from timeline_frames import raster_axes, sample_frames
+from prometheus_client import Counter
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
@@ -24,10 +42,35 @@ WEATHERAPI_KEY = config.WEATHERAPI_KEY  # Your API key from config.py
 TILE_SIZE = 256
 CACHE_DIR = "weather_tiles_cache"
 CACHE_TIMEOUT = 3600  # 1 hour cache
+SAMPLE_WORKERS = config.TILE_SAMPLE_WORKERS  # Parallel upstream sample fetches per process
+SAMPLE_DEADLINE = config.TILE_SAMPLE_DEADLINE  # Seconds to wait for a tile's samples
+MAX_STALE = config.TILE_MAX_STALE  # Expired tiles are served this long while refreshing in the background
+DEGRADED_TILE_TTL = 60  # Tiles missing samples (quota, errors, deadline) are retried this much sooner
 
 # Ensure cache directory exists
 os.makedirs(CACHE_DIR, exist_ok=True)
 
+# Tile store: one SQLite file (default) or the legacy flat PNG directory
+tile_store = open_tile_store(
+    config.TILE_STORE_BACKEND,
+    config.TILE_STORE_PATH or (CACHE_DIR if config.TILE_STORE_BACKEND == 'files' else os.path.join(CACHE_DIR, 'tiles.sqlite')),
+    config.TILE_STORE_MAX_MB * 1024 * 1024
+)
+# Hot tiles served straight from memory, without touching the filesystem
+memory_tiles = MemoryTileCache(max_bytes=config.TILE_MEMORY_CACHE_MB * 1024 * 1024)
+# Rendered tiles shared by every worker process (None without Redis)
+redis_tiles = RedisTier(redis_cache_client, 'tile:') if redis_cache_client else None
+
+# Shared pool for tile sample fetching (bounded parallelism per process)
+sample_executor = ThreadPoolExecutor(max_workers=SAMPLE_WORKERS, thread_name_prefix='tile-sample')
+# Background regeneration of expired tiles (stale-while-revalidate)
+refresh_executor = ThreadPoolExecutor(max_workers=config.TILE_REFRESH_WORKERS, thread_name_prefix='tile-refresh')
+refreshing_tiles = set()
+refreshing_lock = threading.Lock()
+
+# Metryki Prometheus
+stale_tiles_served = Counter('tile_stale_served_total', 'Expired tiles served while a background refresh runs', ['layer'])
+
 def num2deg(xtile, ytile, zoom):
     """Convert tile numbers to lat/lon"""
     n = 2.0 ** zoom
@@ -36,24 +79,57 @@ def num2deg(xtile, ytile, zoom):
     lat_deg = math.degrees(lat_rad)
     return (lat_deg, lon_deg)
 
-def get_weather_data(lat, lon):
-    """Fetch real weather data from WeatherAPI.com API"""
-    try:
-        url = "http://api.weatherapi.com/v1/current.json"
-        params = {
-            'key': WEATHERAPI_KEY,
-            'q': f"{lat},{lon}",
-            'aqi': 'no'
-        }
-        response = requests.get(url, params=params, timeout=10)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            print(f"Weather API error: {response.status_code}")
-            return None
-    except Exception as e:
-        print(f"Weather API request failed: {e}")
+def get_weather_data(lat, lon, priority=INTERACTIVE, deadline=None):
+    """Fetch real weather data from WeatherAPI.com API (pooled, TTL-cached, quota-governed)"""
+    status_code, data = weather_client.current(lat, lon, priority, deadline)
+    if status_code == 200 and data:
+        return data
+    if status_code not in (429, 503, 504):  # Quota, open circuit and deadline are counted in metrics
+        print(f"Weather API error: {status_code}")
+    return None
+
+def fetch_weather_samples(points, deadline=SAMPLE_DEADLINE, priority=TILE):
+    """Fetch weather data for many (lat, lon) points in parallel.
+
+    Returns a list aligned with points; samples that fail, miss the
+    deadline or are refused by the quota governor are None so the tile
+    can still be rendered (interpolated) from the rest. The deadline is
+    capped by the incoming request's own and passed down to every call.
+    """
+    deadline_at = time.monotonic() + deadline
+    outer = request_deadline.get()
+    if outer is not None:
+        deadline_at = min(deadline_at, outer)
+    futures = [sample_executor.submit(get_weather_data, lat, lon, priority, deadline_at) for lat, lon in points]
+    done, not_done = wait(futures, timeout=max(0, deadline_at - time.monotonic()))
+    if not_done:
+        print(f"⏱️ {len(not_done)}/{len(futures)} samples missed the {deadline}s deadline")
+        for future in not_done:
+            future.cancel()  # Drop queued fetches; running ones still fill the cache
+    return [f.result() if f in done else None for f in futures]
+
+# Fields kept per lattice node - one current.json response feeds every layer
+SAMPLE_FIELDS = ('temp_c', 'wind_kph', 'precip_mm', 'pressure_mb', 'humidity', 'cloud', 'wind_degree')
+FIELD_INDEX = {field: i for i, field in enumerate(SAMPLE_FIELDS)}
+
+def sample_vector(weather_data):
+    """Pack a WeatherAPI response into a float32 vector of SAMPLE_FIELDS (NaN when missing)"""
+    if not weather_data:
         return None
+    current = weather_data.get('current', {})
+    return np.array([current.get(field, np.nan) for field in SAMPLE_FIELDS], dtype=np.float32)
+
+def fetch_sample_vectors(points, priority=TILE):
+    """Fetch many points in parallel and keep only the multi-field sample vectors"""
+    return [sample_vector(data) for data in fetch_weather_samples(points, priority=priority)]
+
+# Global sampling lattice - nodes are fetched once and reused by every tile, zoom and layer
+lattice = SampleLattice(
+    fetcher=fetch_sample_vectors,
+    step=config.LATTICE_STEP_DEG,
+    nodes_per_tile=config.LATTICE_NODES_PER_TILE,
+    ttl=CACHE_TIMEOUT
+)
 
 def temperature_to_color(temp_celsius):
     """Convert temperature to color (blue=cold, red=hot)"""
@@ -99,88 +175,381 @@ def precipitation_to_color(precipitation_mm):
     alpha = int(normalized * 255)
     return (r, g, b, alpha)
 
-def generate_weather_tile(layer_type, z, x, y):
-    """Generate weather tile with real data"""
+def pressure_to_color(pressure_mb):
+    """Convert pressure to color (blue=low, red=high)"""
+    normalized = max(0, min(1, (pressure_mb - 980) / 60))
+    return (int(normalized * 255), 0, int((1 - normalized) * 255), 128)
+
+def humidity_to_color(humidity):
+    """Convert relative humidity to cyan intensity"""
+    normalized = max(0, min(1, humidity / 100))
+    return (0, int(normalized * 255), 255, 128)
+
+def clouds_to_color(clouds):
+    """Convert cloud cover to white opacity"""
+    alpha = int(max(0, min(100, clouds)) * 255 / 100)
+    return (255, 255, 255, alpha)
+
+# Layer -> sample field, unit factor, colormap range and color function
+LAYER_SPECS = {
+    'temperature': {'field': 'temp_c', 'factor': 1.0, 'min': -40, 'max': 50, 'color': temperature_to_color},
+    'wind': {'field': 'wind_kph', 'factor': 1 / 3.6, 'min': 0, 'max': 30, 'color': wind_speed_to_color},
+    'precipitation': {'field': 'precip_mm', 'factor': 1.0, 'min': 0, 'max': 10, 'color': precipitation_to_color},
+    'pressure': {'field': 'pressure_mb', 'factor': 1.0, 'min': 980, 'max': 1040, 'color': pressure_to_color},
+    'humidity': {'field': 'humidity', 'factor': 1.0, 'min': 0, 'max': 100, 'color': humidity_to_color},
+    'clouds': {'field': 'cloud', 'factor': 1.0, 'min': 0, 'max': 100, 'color': clouds_to_color},
+}
+
+# Precomputed 256-entry RGBA lookup tables, one per layer
+LAYER_LUTS = {
+    name: build_lut(spec['color'], spec['min'], spec['max'])
+    for name, spec in LAYER_SPECS.items()
+}
+
+# Multi-field sample arrays per tile: (fields x lat nodes x lon nodes) plus pixel coordinates
+tile_samples_cache = TTLCache(maxsize=20000)
+
+class TileSamples:
+    """Lattice samples covering one tile - enough to render any layer"""
+
+    def __init__(self, grid, rows, cols, sampled_at):
+        self.grid = grid  # float32 (len(SAMPLE_FIELDS), lat nodes, lon nodes)
+        self.rows = rows  # fractional node row of each pixel row
+        self.cols = cols  # fractional node column of each pixel column
+        self.sampled_at = sampled_at  # fetch time of the oldest node used
+
+    def field(self, name):
+        return self.grid[FIELD_INDEX[name]]
+
+def get_tile_samples(z, x, y, refresh=False, priority=TILE):
+    """Multi-field samples for a tile, shared by all layers (refresh=True refetches the nodes)"""
+    key = (z, x, y)
+    samples = None if refresh else tile_samples_cache.get(key)
+    if samples is not None:
+        return samples
+    
     lat_north, lon_west = num2deg(x, y, z)
     lat_south, lon_east = num2deg(x + 1, y + 1, z)
     
-    img = Image.new('RGBA', (TILE_SIZE, TILE_SIZE), (0, 0, 0, 0))
-    draw = ImageDraw.Draw(img)
+    # Lattice nodes covering the tile (shared with neighbours and other zooms)
+    lats, lons = lattice.node_axes(lat_north, lat_south, lon_west, lon_east)
+    now = time.time()
+    forecast = forecast_grid.snapshot()
+    if forecast is not None and forecast.covers(lats[-1], lats[0], lons[0], lons[-1], now):
+        # Inside the hourly forecast grid: slice and interpolate to the current time, no upstream calls
+        grid = forecast.sample(lats[:, None], lons[None, :], now, SAMPLE_FIELDS)
+        grid = np.ascontiguousarray(grid.transpose(2, 0, 1))
+        sampled_at = now
+    else:
+        vectors, sampled_at = lattice.fetch_nodes(lats, lons, refresh=refresh, priority=priority)
+        if any(v is None for v in vectors):
+            # Missing nodes are interpolated from their neighbours; expire early to retry them
+            sampled_at = min(sampled_at, now - CACHE_TIMEOUT * (1 - config.TILE_TTL_JITTER) + DEGRADED_TILE_TTL)
+        
+        empty = np.full(len(SAMPLE_FIELDS), np.nan, dtype=np.float32)
+        grid = np.stack([v if v is not None else empty for v in vectors])
+        grid = grid.T.reshape(len(SAMPLE_FIELDS), len(lats), len(lons))
+    rows, cols = lattice.pixel_coords(z, x, y, lats, lons, TILE_SIZE)
     
-    # Sample points across the tile
-    grid_size = 8 if z > 6 else 4
+    samples = TileSamples(grid, rows, cols, sampled_at)
+    tile_samples_cache.set(key, samples, CACHE_TIMEOUT - (time.time() - sampled_at))
+    return samples
+
+def render_layer(samples, layer_type):
+    """Render one layer from a tile's multi-field samples"""
+    spec = LAYER_SPECS[layer_type]
+    values = bilinear_sample(samples.field(spec['field']) * spec['factor'], samples.rows, samples.cols)
+    return colorize(values, LAYER_LUTS[layer_type], spec['min'], spec['max'])
+
+def generate_weather_tile(layer_type, z, x, y):
+    """Generate weather tile with real data sampled on the global lattice"""
+    if layer_type not in LAYER_SPECS:
+        return Image.new('RGBA', (TILE_SIZE, TILE_SIZE), 0)
+    return render_layer(get_tile_samples(z, x, y), layer_type)
+
+def render_weather_tile(layer_type, z, x, y, refresh=False, priority=TILE):
+    """Render and store a tile; its generation time is the age of the samples it was drawn from"""
+    print(f"🌦️ Generating real weather tile: {layer_type} {z}/{x}/{y}")
+    if layer_type in LAYER_SPECS:
+        samples = get_tile_samples(z, x, y, refresh=refresh, priority=priority)
+        tile = StoredTile(encode_png(render_layer(samples, layer_type)), samples.sampled_at)
+    else:
+        tile = StoredTile(encode_png(generate_weather_tile(layer_type, z, x, y)), time.time())
+    save_tile(layer_type, z, x, y, tile)
+    return tile
+
+def deg2num(lat_deg, lon_deg, zoom):
+    """Convert lat/lon to tile numbers"""
+    lat_rad = math.radians(max(-85.0511, min(85.0511, lat_deg)))
+    n = 2 ** zoom
+    xtile = int((lon_deg + 180.0) / 360.0 * n)
+    ytile = int((1.0 - math.asinh(math.tan(lat_rad)) / math.pi) / 2.0 * n)
+    return (min(max(xtile, 0), n - 1), min(max(ytile, 0), n - 1))
+
+def encode_png(img):
+    img_buffer = io.BytesIO()
+    img.save(img_buffer, format='PNG')
+    return img_buffer.getvalue()
+
+def pack_tile(tile):
+    """Tile bytes for Redis: 8-byte generation time followed by the PNG"""
+    return struct.pack('>d', tile.generated_at) + tile.data
+
+def unpack_tile(blob):
+    return StoredTile(blob[8:], struct.unpack('>d', blob[:8])[0])
+
+def tile_ttl(tile):
+    """Seconds a tile may still be served, stale window included"""
+    return CACHE_TIMEOUT + MAX_STALE - (time.time() - tile.generated_at)
+
+def tile_fresh_for(key):
+    """Fresh lifetime of a tile - CACHE_TIMEOUT shortened by a stable per-tile jitter.
+
+    Tiles rendered together (a viewport, a prewarm cycle) would otherwise
+    all expire in the same second.
+    """
+    spread = zlib.crc32('/'.join(map(str, key)).encode()) / 0xFFFFFFFF
+    return CACHE_TIMEOUT * (1 - config.TILE_TTL_JITTER * spread)
+
+def is_fresh(key, tile):
+    return time.time() - tile.generated_at < tile_fresh_for(key)
+
+def cached_tiles(keys, stale=False):
+    """Tiles for many (layer, z, x, y) keys: memory, then one Redis pipeline, then the store.
+
+    Only fresh tiles are returned unless stale=True, which also returns
+    expired tiles still inside the MAX_STALE window. A stale memory hit is
+    checked against Redis and the store first - another worker or the
+    prewarmer may already have refreshed it.
+    """
+    # Every tier is read up to the end of the stale window so a fresh-only
+    # lookup does not evict tiles a stale=True caller could still serve
+    max_ages = [tile_fresh_for(key) + MAX_STALE for key in keys]
+    tiles = [memory_tiles.get(key, max_age) for key, max_age in zip(keys, max_ages)]
+    lookup = [i for i, tile in enumerate(tiles) if tile is None or not is_fresh(keys[i], tile)]
+    
+    def newer(i, tile):
+        return time.time() - tile.generated_at < max_ages[i] and (tiles[i] is None or tile.generated_at > tiles[i].generated_at)
+    
+    if lookup and redis_tiles is not None:
+        replies = redis_tiles.mget(['/'.join(map(str, keys[i])) for i in lookup])
+        for i, (blob, _) in zip(lookup, replies):
+            if blob is not None:
+                tile = unpack_tile(blob)
+                if newer(i, tile):
+                    memory_tiles.put(keys[i], tile)
+                    tiles[i] = tile
+    
+    for i in lookup:
+        if tiles[i] is None or not is_fresh(keys[i], tiles[i]):
+            tile = tile_store.get(*keys[i], max_age=max_ages[i])
+            if tile is not None and newer(i, tile):
+                tiles[i] = tile
+                memory_tiles.put(keys[i], tile)
+                if redis_tiles is not None:
+                    redis_tiles.set('/'.join(map(str, keys[i])), pack_tile(tile), tile_ttl(tile))
+    if not stale:
+        tiles = [tile if tile is not None and is_fresh(key, tile) else None for key, tile in zip(keys, tiles)]
+    return tiles
+
+def cached_tile(layer_type, z, x, y, stale=False):
+    """StoredTile from memory, Redis or the tile store, or None (fresh only unless stale=True)"""
+    return cached_tiles([(layer_type, z, x, y)], stale=stale)[0]
+
+def save_tile(layer_type, z, x, y, tile):
+    """Write a tile through the memory cache and Redis to the tile store"""
+    key = (layer_type, z, x, y)
+    memory_tiles.put(key, tile)
+    if redis_tiles is not None:
+        redis_tiles.set('/'.join(map(str, key)), pack_tile(tile), tile_ttl(tile))
+    tile_store.put(layer_type, z, x, y, tile.data, tile.generated_at)
+
+def schedule_refresh(layer_type, z, x, y):
+    """Regenerate an expired tile in the background, at most once at a time per tile"""
+    key = (layer_type, z, x, y)
+    with refreshing_lock:
+        if key in refreshing_tiles:
+            return
+        refreshing_tiles.add(key)
     
-    for i in range(grid_size):
-        for j in range(grid_size):
-            lat = lat_north + (lat_south - lat_north) * i / (grid_size - 1)
-            lon = lon_west + (lon_east - lon_west) * j / (grid_size - 1)
-            
-            weather_data = get_weather_data(lat, lon)
-            
-            if weather_data:
-                px = int(j * TILE_SIZE / (grid_size - 1))
-                py = int(i * TILE_SIZE / (grid_size - 1))
-                
-                color = None
-                
-                if layer_type == 'temperature':
-                    temp = weather_data.get('current', {}).get('temp_c', 0)
-                    color = temperature_to_color(temp)
-                
-                elif layer_type == 'wind':
-                    wind_speed = weather_data.get('current', {}).get('wind_kph', 0) / 3.6  # Convert km/h to m/s
-                    color = wind_speed_to_color(wind_speed)
-                
-                elif layer_type == 'precipitation':
-                    precip_mm = weather_data.get('current', {}).get('precip_mm', 0)
-                    color = precipitation_to_color(precip_mm)
-                
-                elif layer_type == 'pressure':
-                    pressure = weather_data.get('current', {}).get('pressure_mb', 1013)
-                    normalized = max(0, min(1, (pressure - 980) / 60))
-                    color = (int(normalized * 255), 0, int((1-normalized) * 255), 128)
-                
-                elif layer_type == 'humidity':
-                    humidity = weather_data.get('current', {}).get('humidity', 50)
-                    normalized = humidity / 100
-                    color = (0, int(normalized * 255), 255, 128)
-                
-                elif layer_type == 'clouds':
-                    clouds = weather_data.get('current', {}).get('cloud', 0)
-                    alpha = int(clouds * 255 / 100)
-                    color = (255, 255, 255, alpha)
-                
-                if color:
-                    cell_size = TILE_SIZE // grid_size
-                    x1 = j * cell_size
-                    y1 = i * cell_size
-                    x2 = x1 + cell_size
-                    y2 = y1 + cell_size
-                    draw.rectangle([x1, y1, x2, y2], fill=color)
+    def refresh():
+        try:
+            refresh_tile(layer_type, z, x, y)
+        except Exception as e:
+            print(f"❌ Background refresh failed for {layer_type} {z}/{x}/{y}: {e}")
+        finally:
+            with refreshing_lock:
+                refreshing_tiles.discard(key)
     
-    return img
+    refresh_executor.submit(refresh)
+
+def max_native_zoom(layer_type):
+    """Highest zoom rendered from samples for a layer; above it tiles are overzoomed"""
+    return config.TILE_MAX_NATIVE_ZOOM_LAYERS.get(layer_type, config.TILE_MAX_NATIVE_ZOOM)
+
+def native_tile(layer_type, z, x, y):
+    """Cached tile, derived from children or rendered from samples on a miss.
+
+    An expired tile within MAX_STALE is returned as is and refreshed in
+    the background; past that the caller waits for a new render.
+    """
+    tile = cached_tile(layer_type, z, x, y, stale=True)
+    if tile:
+        if not is_fresh((layer_type, z, x, y), tile):
+            stale_tiles_served.labels(layer=layer_type).inc()
+            schedule_refresh(layer_type, z, x, y)
+        return tile
+    
+    tile = compose_from_children(layer_type, z, x, y)
+    if tile:
+        return tile
+    return render_weather_tile(layer_type, z, x, y)
+
+def overzoom_tile(layer_type, z, x, y, native_zoom):
+    """Crop and bilinearly upscale the native-zoom ancestor of a tile.
+
+    Returns (PNG bytes, ancestor StoredTile). Overzoomed tiles are cheap to
+    derive and carry no extra information, so they are not stored.
+    """
+    d = z - native_zoom
+    scale = 2 ** d
+    ax, ay = x >> d, y >> d
+    ancestor = native_tile(layer_type, native_zoom, ax, ay)
+    
+    size = TILE_SIZE / scale
+    left = (x - ax * scale) * size
+    top = (y - ay * scale) * size
+    with Image.open(io.BytesIO(ancestor.data)) as ancestor_img:
+        img = ancestor_img.convert('RGBA').resize(
+            (TILE_SIZE, TILE_SIZE), Image.Resampling.BILINEAR, box=(left, top, left + size, top + size)
+        )
+    return encode_png(img), ancestor
+
+def compose_from_children(layer_type, z, x, y):
+    """Build a tile by 2x downsampling its four cached z+1 children (no upstream traffic).
+
+    Returns the stored tile, or None when any child is missing or stale.
+    """
+    children = [(0, 0), (1, 0), (0, 1), (1, 1)]
+    tiles = cached_tiles([(layer_type, z + 1, 2 * x + dx, 2 * y + dy) for dx, dy in children])
+    if not all(tiles):
+        return None
+    
+    mosaic = Image.new('RGBa', (TILE_SIZE * 2, TILE_SIZE * 2))
+    for (dx, dy), child_tile in zip(children, tiles):
+        with Image.open(io.BytesIO(child_tile.data)) as child:
+            mosaic.paste(child.convert('RGBa'), (dx * TILE_SIZE, dy * TILE_SIZE))
+    # Average in premultiplied alpha so transparent pixels don't darken edges
+    img = mosaic.reduce(2).convert('RGBA')
+    
+    # The parent is only as fresh as its oldest child
+    tile = StoredTile(encode_png(img), min(t.generated_at for t in tiles))
+    save_tile(layer_type, z, x, y, tile)
+    return tile
+
+def tiles_in_bbox(bbox, z):
+    """(x, y) of every tile at zoom z intersecting bbox (west, south, east, north)"""
+    west, south, east, north = bbox
+    x_min, y_min = deg2num(north, west, z)
+    x_max, y_max = deg2num(south, east, z)
+    for x in range(x_min, x_max + 1):
+        for y in range(y_min, y_max + 1):
+            yield x, y
+
+def build_pyramid(layer_type, bbox, base_zoom, min_zoom):
+    """Warm base_zoom tiles inside bbox, then derive every lower zoom bottom-up"""
+    counts = {}
+    for z in range(base_zoom, min_zoom - 1, -1):
+        built = 0
+        for x, y in tiles_in_bbox(bbox, z):
+            if not cached_tile(layer_type, z, x, y):
+                native_tile(layer_type, z, x, y)
+                built += 1
+        counts[z] = built
+    return counts
+
+def refresh_tile(layer_type, z, x, y, priority=TILE):
+    """Regenerate a tile ahead of expiry - from fresh children when possible, else from refetched samples.
+
+    Returns None, keeping the existing tile, when the upstream quota no
+    longer allows calls of this priority.
+    """
+    if z < max_native_zoom(layer_type):
+        tile = compose_from_children(layer_type, z, x, y)
+        if tile and time.time() - tile.generated_at < CACHE_TIMEOUT - config.PREWARM_LEAD:
+            return tile
+    if weather_client.governor is not None and not weather_client.governor.available(priority):
+        return None
+    return render_weather_tile(layer_type, z, x, y, refresh=True, priority=priority)
+
+# Keeps the configured regions warm so users rarely hit a cold or expired tile
+prewarmer = TilePrewarmer(
+    regions=parse_regions(config.PREWARM_REGIONS),
+    layers=[layer for layer in config.PREWARM_LAYERS if layer in LAYER_SPECS],
+    lookup=tile_store.generated_at,
+    refresh=lambda *key: refresh_tile(*key, priority=PREWARM),
+    upstream_count=lambda: weather_client.upstream_count,
+    tiles_in_bbox=tiles_in_bbox,
+    ttl=CACHE_TIMEOUT * (1 - config.TILE_TTL_JITTER),  # earliest jittered expiry
+    lead=config.PREWARM_LEAD,
+    budget=config.PREWARM_CALL_BUDGET
+)
+
+if config.PREWARM_ENABLED:
+    threading.Thread(target=prewarmer.run_forever, args=(config.PREWARM_INTERVAL,), name='tile-prewarm', daemon=True).start()
+
+if config.FORECAST_GRID_INGEST_ENABLED:
+    threading.Thread(target=grid_ingest.run_forever, args=(config.FORECAST_GRID_INGEST_INTERVAL,), name='grid-ingest', daemon=True).start()
+
+def tile_gc_loop(interval):
+    """Periodically expire old tiles, enforce the size cap and vacuum the store"""
+    while True:
+        time.sleep(interval)
+        try:
+            print(f"🧹 Tile store GC: {tile_store.gc(config.TILE_STORE_RETENTION)}")
+        except Exception as e:
+            print(f"❌ Tile store GC failed: {e}")
+
+if config.TILE_STORE_GC_INTERVAL > 0:
+    threading.Thread(target=tile_gc_loop, args=(config.TILE_STORE_GC_INTERVAL,), name='tile-gc', daemon=True).start()
+
+def tile_response(data, generated_at, fresh_for: float = CACHE_TIMEOUT):
+    """PNG response with ETag, Last-Modified and Cache-Control; 304 when the client copy is current"""
+    response = make_response(data)
+    response.mimetype = 'image/png'
+    response.set_etag(hashlib.sha1(data).hexdigest())
+    response.last_modified = datetime.fromtimestamp(generated_at, tz=timezone.utc)
+    remaining = max(0, int(fresh_for - (time.time() - generated_at)))
+    response.headers['Cache-Control'] = (
+        f'public, max-age={remaining}, stale-while-revalidate={config.HTTP_STALE_WHILE_REVALIDATE}'
+    )
+    return response.make_conditional(request)
+
+@app.before_request
+def start_request_deadline():
+    """Bound every upstream call made while serving this request by one shared deadline"""
+    set_deadline(config.REQUEST_DEADLINE)
 
 @app.route('/api/weather/<layer_type>/<int:z>/<int:x>/<int:y>.png')
 def weather_tile(layer_type, z, x, y):
     """Serve weather tile with caching"""
     try:
-        cache_path = os.path.join(CACHE_DIR, f"{layer_type}_{z}_{x}_{y}.png")
-        
-        # Check cache
-        if os.path.exists(cache_path):
-            cache_age = (datetime.now() - datetime.fromtimestamp(os.path.getmtime(cache_path))).seconds
-            if cache_age < CACHE_TIMEOUT:
-                return send_file(cache_path, mimetype='image/png')
-        
-        print(f"🌦️ Generating real weather tile: {layer_type} {z}/{x}/{y}")
-        img = generate_weather_tile(layer_type, z, x, y)
-        img.save(cache_path, 'PNG')
+        native_zoom = max_native_zoom(layer_type)
+        if z > native_zoom:
+            data, ancestor = overzoom_tile(layer_type, z, x, y, native_zoom)
+            # Derived tile: exactly as fresh as its ancestor
+            ancestor_key = (layer_type, native_zoom, x >> (z - native_zoom), y >> (z - native_zoom))
+            response = tile_response(data, ancestor.generated_at, tile_fresh_for(ancestor_key))
+            response.headers['X-Tile-Overzoom'] = f'{native_zoom}/{x >> (z - native_zoom)}/{y >> (z - native_zoom)}'
+            return response
         
-        return send_file(cache_path, mimetype='image/png')
+        # Cache, then four cached children, then a fresh render
+        tile = native_tile(layer_type, z, x, y)
+        return tile_response(tile.data, tile.generated_at, tile_fresh_for((layer_type, z, x, y)))
         
     except Exception as e:
         print(f"❌ Error generating tile {layer_type} {z}/{x}/{y}: {e}")
-        img = Image.new('RGBA', (TILE_SIZE, TILE_SIZE), (0, 0, 0, 0))
+        img = Image.new('RGBA', (TILE_SIZE, TILE_SIZE), 0)
         img_buffer = io.BytesIO()
         img.save(img_buffer, format='PNG')
         img_buffer.seek(0)
@@ -194,9 +563,25 @@ def wind_vectors():
         bbox = [float(x) for x in bounds.split(',')]
         
         vectors = []
+        forecast = forecast_grid.snapshot()
+        if forecast is not None and forecast.covers(bbox[1], bbox[3], bbox[0], bbox[2], time.time()):
+            # Whole bbox inside the forecast grid - one vectorised sample instead of a call per point
+            lats = np.arange(int(bbox[1]), int(bbox[3]), 2)
+            lons = np.arange(int(bbox[0]), int(bbox[2]), 2)
+            wind = forecast.sample(lats[:, None], lons[None, :], time.time(), ('wind_kph', 'wind_degree'))
+            for i, lat in enumerate(lats):
+                for j, lon in enumerate(lons):
+                    vectors.append({
+                        'lat': int(lat),
+                        'lon': int(lon),
+                        'speed': float(wind[i, j, 0]) / 3.6,  # Convert km/h to m/s
+                        'direction': float(wind[i, j, 1])
+                    })
+            return jsonify({'vectors': vectors})
+        
         for lat in range(int(bbox[1]), int(bbox[3]), 2):
             for lon in range(int(bbox[0]), int(bbox[2]), 2):
-                weather_data = get_weather_data(lat, lon)
+                weather_data = get_weather_data(lat, lon, TILE)
                 if weather_data and 'current' in weather_data:
                     current = weather_data['current']
                     vectors.append({
@@ -212,6 +597,62 @@ def wind_vectors():
         print(f"❌ Error generating wind vectors: {e}")
         return jsonify({'vectors': []})
 
+WIND_TEXTURE_TTL = 600  # Default texture time is rounded to this, and it is cached this long
+wind_texture_cache = TTLCache(maxsize=256)
+
+def build_wind_texture(bbox, width, epoch):
+    """RGBA PNG of the wind field: R = U, G = V stretched to their min/max, A = 0 where there is no data"""
+    lats, lons = raster_axes(bbox, width, config.WIND_TEXTURE_MAX_SIZE)
+    values, source = sample_frames(('wind_u', 'wind_v'), lats, lons, np.array([epoch], dtype=np.float64))
+    u, v = values[0] / 3.6  # km/h -> m/s
+    r, u_min, u_max = stretch(u)
+    g, v_min, v_max = stretch(v)
+    a = np.where(np.isfinite(u) & np.isfinite(v), 255, 0).astype(np.uint8)
+    png = encode_png(Image.fromarray(np.dstack([r, g, np.zeros_like(r), a]), 'RGBA'))
+    return png, {
+        'X-Wind-U-Min': f'{u_min:.3f}',
+        'X-Wind-U-Max': f'{u_max:.3f}',
+        'X-Wind-V-Min': f'{v_min:.3f}',
+        'X-Wind-V-Max': f'{v_max:.3f}',
+        'X-Wind-Units': 'm/s',
+        'X-Wind-Bounds': ','.join(str(c) for c in bbox),
+        'X-Wind-Size': f'{len(lons)}x{len(lats)}',
+        'X-Wind-Time': str(epoch),
+        'X-Wind-Source': source
+    }
+
+@app.route('/api/weather/wind-texture')
+def wind_texture():
+    """Whole wind field for a bbox as one packed U/V texture (GPU particle animation)"""
+    try:
+        try:
+            bbox = parse_bbox(request.args.get('bounds', '14,49,24,55'))
+            width = int(request.args.get('width', config.WIND_TEXTURE_WIDTH))
+            epoch = int(request.args['time']) if request.args.get('time') else int(time.time() // WIND_TEXTURE_TTL * WIND_TEXTURE_TTL)
+        except ValueError:
+            return jsonify({'error': 'Invalid bounds/width/time'}), 400
+        
+        forecast = forecast_grid.snapshot()
+        key = (tuple(bbox), width, epoch, forecast.run if forecast else None)
+        texture = wind_texture_cache.get(key)
+        if texture is None:
+            try:
+                png, headers = build_wind_texture(bbox, width, epoch)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            texture = (png, headers, time.time())
+            wind_texture_cache.set(key, texture, WIND_TEXTURE_TTL)
+        
+        png, headers, generated_at = texture
+        response = tile_response(png, generated_at, WIND_TEXTURE_TTL)
+        response.headers.update(headers)
+        response.headers['Access-Control-Expose-Headers'] = ', '.join(headers)
+        return response
+        
+    except Exception as e:
+        print(f"❌ Error generating wind texture: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/config')
 def get_config():
     """API configuration endpoint"""
@@ -241,21 +682,20 @@ def current_weather():
 def forecast():
     """Real weather forecast"""
     try:
-        url = "http://api.weatherapi.com/v1/forecast.json"
-        params = {
-            'key': WEATHERAPI_KEY,
-            'q': 'Warsaw',
-            'days': 7,
-            'aqi': 'no'
-        }
-        response = requests.get(url, params=params, timeout=10)
-        if response.status_code == 200:
-            return jsonify(response.json())
+        status_code, data = weather_client.forecast('Warsaw', days=7)
+        if status_code == 200 and data:
+            return jsonify(data)
         else:
             return jsonify({'error': 'Forecast not available'}), 500
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/metrics')
+def metrics():
+    """Prometheus metrics (upstream calls, coalesced requests)"""
+    from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
+    return generate_latest(), 200, {'Content-Type': CONTENT_TYPE_LATEST}
+
 @app.route('/')
 def index():
     """Server status"""
@@ -267,10 +707,47 @@ def index():
             '/api/weather/wind-vectors - Wind vector data',
             '/api/config - Server configuration',
             '/api/weather/current - Current weather',
-            '/api/weather/forecast - Weather forecast'
+            '/api/weather/forecast - Weather forecast',
+            '/metrics - Prometheus metrics'
         ]
     })
 
+@app.cli.command('build-pyramid')
+@click.option('--layer', 'layers', multiple=True, help='Layer to build (repeatable, default: all)')
+@click.option('--bbox', default='14,49,24,55', help='west,south,east,north')
+@click.option('--base-zoom', default=9, type=int, help='Zoom rendered from upstream samples')
+@click.option('--min-zoom', default=5, type=int, help='Lowest zoom derived by downsampling')
+def build_pyramid_command(layers, bbox, base_zoom, min_zoom):
+    """Build the tile pyramid bottom-up from a warmed base zoom"""
+    bounds = [float(v) for v in bbox.split(',')]
+    for layer_type in layers or LAYER_SPECS.keys():
+        counts = build_pyramid(layer_type, bounds, base_zoom, min_zoom)
+        print(f"🗺️ {layer_type}: " + ', '.join(f"z{z}={n}" for z, n in sorted(counts.items())))
+
+@app.cli.command('tiles-gc')
+@click.option('--retention', default=None, type=int, help='Drop tiles older than this many seconds')
+def tiles_gc_command(retention):
+    """Expire old tiles, enforce the size cap and vacuum the tile store"""
+    print(f"🧹 {tile_store.gc(retention or config.TILE_STORE_RETENTION)}")
+
+@app.cli.command('prewarm')
+@click.option('--once', is_flag=True, help='Run a single cycle and exit')
+def prewarm_command(once):
+    """Refresh tiles of the configured prewarm regions ahead of expiry"""
+    if once:
+        print(f"🔥 {prewarmer.run_cycle()}")
+    else:
+        prewarmer.run_forever(config.PREWARM_INTERVAL)
+
+@app.cli.command('ingest-grid')
+@click.option('--once', is_flag=True, help='Ingest a single forecast run and exit')
+def ingest_grid_command(once):
+    """Fetch the hourly forecast grid and swap it in for all workers"""
+    if once:
+        print(f"🗺️ {grid_ingest.run()}")
+    else:
+        grid_ingest.run_forever(config.FORECAST_GRID_INGEST_INTERVAL)
+
 if __name__ == '__main__':
     print("🌦️ Starting Production Weather Tile Server...")
     print("📝 Using real WeatherAPI.com API data")